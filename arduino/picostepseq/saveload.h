@@ -6,7 +6,15 @@
 
 uint32_t last_sequence_write_millis = 0;
 
+// sequence bank file, shared with the CircuitPython version,
+// see circuitpython/picostepseq/sequencer_bank.py for the format
+const char* bank_file = "/saved_sequences.psq";
+const uint8_t bank_version = 1;
+const uint8_t bank_header_size = 12;
+const uint8_t bank_step_size = 8;  // note, vel, gate, flags, prob, cond, chord, arp
+
 // write all sequences to "disk"
+// (we don't have prob/cond/chord/arp, so they get written as their defaults)
 void sequences_write() {
   Serial.println("sequences_write");
   // save wear & tear on flash, only allow writes every 10 seconds
@@ -15,37 +23,69 @@ void sequences_write() {
   }
   last_sequence_write_millis = millis();
 
-  DynamicJsonDocument doc(8192);  // assistant said 6144
+  File file = LittleFS.open(bank_file, "w");
+  if (!file) {
+    Serial.println("sequences_write: Failed to create file");
+    return;
+  }
+  uint16_t tempo_centi = tempo * 100;
+  uint8_t header[bank_header_size] = { 'P', 'S', 'Q', 'B', bank_version, bank_header_size,
+                                       numseqs, numsteps, bank_step_size, 0,
+                                       (uint8_t)(tempo_centi & 0xff), (uint8_t)(tempo_centi >> 8) };
+  file.write(header, bank_header_size);
   for (int j = 0; j < numseqs; j++) {
-    JsonArray seq_array = doc.createNestedArray();
     for (int i = 0; i < numsteps; i++) {
       Step s = sequences[j][i];
-      JsonArray step_array = seq_array.createNestedArray();
-      step_array.add(s.note);
-      step_array.add(s.vel);
-      step_array.add(s.gate);
-      step_array.add(s.on);
+      uint8_t step_bytes[bank_step_size] = { s.note, s.vel, s.gate, (uint8_t)(s.on ? 1 : 0), 100, 0, 0, 0 };
+      file.write(step_bytes, bank_step_size);
     }
   }
+  file.close();
+  Serial.println("sequences saved");
+}
 
-  LittleFS.remove(save_file);
-  File file = LittleFS.open(save_file, "w");
+// read all sequences from bank file, returns false if there isn't one we can read
+bool sequences_read_bank() {
+  File file = LittleFS.open(bank_file, "r");
   if (!file) {
-    Serial.println("sequences_write: Failed to create file");
-    return;
+    return false;
   }
-  if (serializeJson(doc, file) == 0) {
-    Serial.println(F("sequences_write: Failed to write to file"));
+  uint8_t header[bank_header_size];
+  if (file.read(header, bank_header_size) != bank_header_size || memcmp(header, "PSQB", 4) != 0 ||
+      header[4] > bank_version || header[5] < bank_header_size || header[8] < 4) {
+    Serial.println("sequences_read: not a bank file we can read");
+    file.close();
+    return false;
+  }
+  file.seek(header[5]);  // skip any header fields newer than us
+  int bank_seqs = header[6];
+  int bank_steps = header[7];
+  int step_size = header[8];
+  for (int j = 0; j < bank_seqs; j++) {
+    for (int i = 0; i < bank_steps; i++) {
+      uint8_t b[4];
+      file.read(b, 4);
+      file.seek(step_size - 4, SeekCur);  // skip step params we don't have
+      if (j < numseqs && i < numsteps) {
+        Step s = { b[0], b[1], b[2], (bool)(b[3] & 1) };
+        sequences[j][i] = s;
+      }
+    }
+  }
+  uint16_t tempo_centi = header[10] | (header[11] << 8);
+  if (tempo_centi) {
+    tempo = tempo_centi / 100.0;
   }
   file.close();
-  Serial.print("saved_sequences_json = \"");
-  serializeJson(doc, Serial);
-  Serial.println("\"\nsequences saved");
+  return true;
 }
 
-// read all sequences from "disk"
+// read all sequences from "disk", from bank file or older JSON file
 void sequences_read() {
   Serial.println("sequences_read");
+  if (sequences_read_bank()) {
+    return;
+  }
   DynamicJsonDocument doc(8192);  // assistant said 6144
 
   File file = LittleFS.open(save_file, "r");
@@ -14,6 +14,9 @@
 # - Change step gate -- hold step key, push + turn encoder knob
 # - Change sequence -- push encoder, tap step key 1-8, release encoder
 # - Save sequence -- push encoder, hold step key 1-8 for 2 secs, release encoder
+# - Tap tempo -- hold encoder 1 sec, then tap encoder in time
+# - Choose step param to edit -- hold step key, tap encoder (note/vel/prob/cond/chord/arp/undo)
+# - Undo / redo -- hold any step key, tap encoder to "undo", turn encoder left / right
 
 #
 # Or from the device point-of-view:
@@ -29,37 +32,78 @@
 # - Tap step button to enable/disable from sequence
 # - Hold step button + turn encoder to change note
 # - Hold step button + push encoder + turn encoder to change gate length
+# - Hold step button + tap encoder to pick param (note, velocity, probability, trig condition, chord, arp,
+#   sequence length, sequence MIDI channel, undo)
+# - MIDI channel, step count, tempo and per-sequence length & channel saved in /settings.pss
 #
 
 # built in libraries
 import board
 import gc
-import json
 import usb_midi
 
 # local libraries in CIRCUITPY
-import winterbloom_smolmidi as smolmidi
-from sequencer import StepSequencer, ticks_ms
+from sequencer import StepSequencer, ticks_ms, trig_conds, chord_shapes, arp_names, cc_none, rate_names
+from sequencer_boot import BootTimer, NullDisplay
+boot = BootTimer()  # MIDI & sequencer first, then display, timed & printed as it goes
 
-if 'macropad' in board.board_id:
-    from sequencer_display_macropad import SequencerDisplayMacroPad as SequencerDisplay
+import winterbloom_smolmidi as smolmidi
+from sequencer_midi import MidiOut
+from sequencer_leds import LedEngine
+from sequencer_recorder import EventRecorder, EV_MIDI_IN, EV_MIDI_OUT
+from sequencer_input import (CommandQueue, Gestures, command_in_range, edit_fields, tempo_min_centi, tempo_max_centi,
+                             CMD_KEY_DOWN, CMD_KEY_UP, CMD_EDIT_FIELD, CMD_EDIT_GATE, CMD_EDIT_NOTE, CMD_LOAD,
+                             CMD_PLAY_TOGGLE, CMD_SAVE, CMD_SAVE_ARMED, CMD_TAP_MODE, CMD_TAP_TEMPO, CMD_TEMPO,
+                             CMD_TRANSPOSE)
+from sequencer_undo import (UndoHistory, SLOT_LIVE, num_step_fields, step_field_get, step_field_set,
+                            stored_field_get, stored_field_set, FIELD_NOTE, FIELD_VEL, FIELD_GATE, FIELD_ON,
+                            FIELD_PROB, FIELD_COND, FIELD_CHORD, FIELD_ARP, FIELD_CC, FIELD_RAMP, FIELD_SEQNO)
+from sequencer_bank import (BankHeader, bank_header_size, bank_step_size, read_bank, write_bank,
+                            read_sequence, write_sequence)
+from sequencer_sysex import (SysexPort, SysexHandler, BufReader, BufWriter, KIND_BANK, KIND_PATTERN,
+                             KIND_SETTINGS, PATTERN_LIVE)
+from sequencer_settings import Settings
+from sequencer_heap import HeapMonitor
+from sequencer_cc import ParamLocks
+
+# display libraries & fonts are only loaded by ui_setup(), after the sequencer is going
+is_macropad = 'macropad' in board.board_id
+if is_macropad:
     from sequencer_hardware_macropad import Hardware
 else:
-    import displayio
-    displayio.release_displays() # can we put this in sequencer_hardware?
-    from sequencer_display import SequencerDisplay
     from sequencer_hardware import Hardware
+boot.mark("imports")
 
+# defaults, until changed from the UI or by SysEx and saved in /settings.pss
 do_usb_midi = True
 do_serial_midi = True
 
 playdebug = False
+do_record_events = False  # record input & output to replay timing bugs, dumped to /event_log.bin on pause
+do_export_smf = False  # write all sequences, played in order, as a MIDI file /sequences.mid on pause
+do_framebuf_display = False  # draw the OLED straight over I2C instead of with displayio (not on MacroPad)
+use_framebuf = do_framebuf_display and not is_macropad
+if use_framebuf:
+    from sequencer_display_fb import FramebufDisplay, bytes_for_millis
 
 midi_chan = 1
 base_note = 60  #  60 = C4, 48 = C3
+cc_lock_num = 74  # CC that step param locks send, 74 == filter cutoff on most synths
 num_steps = 8
 tempo = 100
 gate_default = 8    # ranges 0-15
+settings_write_millis = 2000  # settings changed while stopped get saved after this long
+ui_setup_millis = 30  # display gets built a piece at a time when nothing is due for this long
+fb_flush_max = 200  # most framebuffer bytes sent per main loop pass, about 4.5 ms of I2C
+
+settings = Settings(midi_chan, num_steps, tempo * 100, do_usb_midi, do_serial_midi)
+try:
+    with open('/settings.pss', 'rb') as fp:
+        settings.load(fp)
+except (OSError, ValueError) as e:
+    print("no settings file, using defaults:", e)
+num_steps = settings.num_steps
+settings.boot_num_steps = num_steps  # a num_steps from SysEx is saved, but used from next boot
 
 # array of sequences used by Sequencer (which only knows about one sequence)
 sequences = [ [(None)] * num_steps ] * num_steps  # pre-fill arrays for easy use later
@@ -68,81 +112,112 @@ sequences = [ [(None)] * num_steps ] * num_steps  # pre-fill arrays for easy use
 usb_out = usb_midi.ports[1]
 usb_in = usb_midi.ports[0]
 
-usb_midi_in = smolmidi.MidiIn(usb_in)
+usb_sysex = SysexPort(usb_in)  # reads USB MIDI in bulk, takes SysEx out for sysex_handler
+usb_midi_in = smolmidi.MidiIn(usb_sysex)
 
 
-midiclk_cnt = 0
-midiclk_last_millis = 0
-def midi_receive():
-    """Handle MIDI Clock and Start/Stop"""
-    global midiclk_cnt, midiclk_last_millis
+recorder = EventRecorder() if do_record_events else None
+heap = HeapMonitor()  # gc.collect() right after each step, if there's time before the next thing due
+
+undo = UndoHistory(size=2 * num_steps * num_step_fields + 2)  # room for two whole-sequence loads/saves
+undo_fields = (FIELD_NOTE, FIELD_VEL, FIELD_PROB, FIELD_COND, FIELD_CHORD, FIELD_ARP, FIELD_CC, FIELD_RAMP)  # for edit_fields
 
+def midi_receive():
+    """Handle MIDI Clock and Start/Stop, and SysEx dumps"""
     msg = usb_midi_in.receive()
 
+    if usb_sysex.ready:
+        sysex_handler.handle(usb_sysex.msg, usb_sysex.msg_len)
+        usb_sysex.done()
+
     if not msg: return
 
+    if recorder:
+        data = msg.data or b"\0\0"
+        recorder.record(EV_MIDI_IN, msg.type | (msg.channel or 0), data[0], data[1] if len(data) > 1 else 0)
+
     if msg.type == smolmidi.START:
         print("MIDI START")
-        seqr.play()
+        seqr.midi_start(ticks_ms())  # plays from first step on next MIDI clock
         seqr_display.update_ui_playing()
 
     elif msg.type == smolmidi.STOP:
         print("MIDI STOP")
         seqr.stop()
+        notes_stop()
         seqr_display.update_ui_playing()
 
     elif msg.type == smolmidi.CLOCK:
-        midiclk_cnt += 1
-        if midiclk_cnt % 6 == 0:  # once every 1/16th note (24 pulses per quarter note => 6 pulses per 16th note)
-            now = ticks_ms()
-            seqr.trigger_next(now)
-
-            if midiclk_cnt % 24 == 0:  # once every quarter note
-                beat_millis = (now - midiclk_last_millis) / 4  # beat_millis is 1/16th note time
-                midiclk_last_millis = now
-                seqr.beat_millis = beat_millis
-                seqr_display.update_ui_bpm()
-                seqr_display.update_ui_playing()
+        if seqr.midi_clock(ticks_ms()):  # tempo re-measured every quarter note
+            seqr_display.update_ui_bpm()
+            seqr_display.update_ui_playing()
 
 
 def play_note_on(note, vel, gate, on):  #
     """Callback for sequencer when note should be turned on"""
     if not on: return
     if playdebug: print("on :%d n:%3d v:%3d %d %d" % (note,vel, gate,on), end="\n" )
-    midi_status = 0x90 | (midi_chan-1)
-    midi_msg = bytearray([midi_status, note, vel])
-    if do_usb_midi:
-        usb_out.write( midi_msg )
-    if do_serial_midi:
-        hw.midi_uart.write( midi_msg )
+    boot.mark_once("first note")
+    note_chan = settings.seq_chan(seqr.seqno)
+    midi_out.note_on(note_chan, note, vel)  # sent on midi_out.flush()
+    if recorder: recorder.record(EV_MIDI_OUT, 0x90 | (note_chan-1), note, vel)
 
 def play_note_off(note, vel, gate, on):  #
     """Callback for sequencer when note should be turned off"""
-    #if on: # FIXME: always do note off to since race condition of note muted right after playing
+    # always asked, even if muted right after it played: midi_out only sends it if the note is on,
+    # and on the channel it went out on, even if the sequence's channel changed since
     if playdebug: print("off:%d n:%3d v:%3d %d %d" % (note,vel, gate,on), end="\n" )
-    midi_status = 0x80 | (midi_chan-1)
-    midi_msg = bytearray([midi_status, note, vel])
-    if do_usb_midi:
-        usb_out.write( midi_msg )
-    if do_serial_midi:
-        hw.midi_uart.write( midi_msg )
-
-def sequence_load(seq_num):
+    chan = midi_out.release(note, vel)  # sent on midi_out.flush()
+    if recorder and chan: recorder.record(EV_MIDI_OUT, 0x80 | (chan-1), note, vel)
+
+def notes_stop():
+    """No notes left on when stopped or paused, not even ones whose gate isn't up yet"""
+    seqr.release_voices()
+    midi_out.all_notes_off()
+
+def sequence_load(seq_num, undoable=True):
     """Load a single sequence into the sequencer from RAM storage"""
-    new_seq = sequences[seq_num].copy()
-    seqr.steps = new_seq
+    if undoable:
+        undo.begin_group()
+        undo.record(SLOT_LIVE, 0, FIELD_SEQNO, seqr.seqno, seq_num)
+        for i in range(seqr.step_count):
+            for f in range(num_step_fields):
+                undo.record(SLOT_LIVE, i, f, step_field_get(seqr, i, f), stored_field_get(sequences, seq_num, i, f))
+        undo.end_group()
+    seqr.load_steps(sequences[seq_num])
     seqr.seqno = seq_num
+    seqr.length = settings.seq_len(seq_num)
+    seqr.set_rate(settings.seq_rate(seq_num))
+    if recorder: recorder.snapshot(seqr)
 
 def sequence_save(seq_num):
     """Store current sequence in sequencer to RAM storage"""
-    sequences[seq_num] = seqr.steps.copy()
+    undo.begin_group()
+    for i in range(seqr.step_count):
+        for f in range(num_step_fields):
+            undo.record(seq_num, i, f, stored_field_get(sequences, seq_num, i, f), step_field_get(seqr, i, f))
+    undo.end_group()
+    sequences[seq_num] = seqr.save_steps()
 
 def sequences_read():
-    """Read entire sequence set from disk into RAM"""
+    """Read entire sequence set from disk into RAM, from the bank file
+    shared with the Arduino version, or older JSON file if no bank yet"""
     global sequences
     print("READING ALL SEQUENCES")
-    with open('/saved_sequences.json', 'r') as fp:
-        sequences = json.load(fp)
+    try:
+        with open('/saved_sequences.psq', 'rb') as fp:
+            (sequences, tempo_centi) = read_bank(fp)
+        if tempo_centi and not settings.loaded:  # settings file's tempo wins
+            seqr.set_tempo_centi(tempo_centi)
+    except (OSError, ValueError) as e:
+        print("no bank file, reading json:", e)
+        import json  # only costs RAM & boot time for old setups
+        with open('/saved_sequences.json', 'r') as fp:
+            sequences = json.load(fp)
+    for steps in sequences:  # might've been saved with a different num_steps
+        del steps[num_steps:]
+        while len(steps) < num_steps:
+            steps.append([base_note, 127, gate_default, False])
 
 last_write_time = ticks_ms()
 def sequences_write():
@@ -153,194 +228,357 @@ def sequences_write():
         return
     last_write_time = ticks_ms()
     print("WRITING ALL SEQUENCES")
-    with open('/saved_sequences.json', 'w') as fp:
-        json.dump(sequences, fp)
+    with open('/saved_sequences.psq', 'wb') as fp:
+        write_bank(fp, sequences, seqr.tempo_centi)
+    if do_export_smf:
+        print("WRITING MIDI FILE")
+        from sequencer_smf import write_song  # only costs RAM if used
+        with open('/sequences.mid', 'wb') as fp:
+            slots = range(min(len(sequences), len(settings.seq_lens)))  # each at its own length, channel & rate
+            write_song(fp, sequences, slots, seqr.tempo_centi, settings.midi_chan-1, seqr.transpose,
+                       lens=[ settings.seq_len(i) for i in slots ], chans=[ settings.seq_chan(i)-1 for i in slots ],
+                       rates=[ settings.seq_rate(i) for i in slots ])
+    if recorder:
+        print("WRITING EVENT LOG")
+        with open('/event_log.bin', 'wb') as fp:
+            recorder.dump(fp)
+
+def settings_write():
+    """Write settings to disk, only done when stopped so it never gets in the way of timing"""
+    settings.tempo_centi = seqr.tempo_centi
+    print("WRITING SETTINGS")
+    try:
+        with open('/settings.pss', 'wb') as fp:
+            settings.save(fp)
+    except OSError as e:
+        print("could not write settings:", e)
+def sysex_get_payload(kind, index, buf):
+    """Fill buf with a bank, pattern or settings for a SysEx dump, returns its length"""
+    fp = BufWriter(buf)
+    if kind == KIND_BANK:
+        write_bank(fp, sequences, seqr.tempo_centi)
+    elif kind == KIND_PATTERN and index == PATTERN_LIVE:
+        write_sequence(fp, seqr.save_steps())
+    elif kind == KIND_PATTERN and index < len(sequences):
+        write_sequence(fp, sequences[index])
+    elif kind == KIND_SETTINGS:
+        settings.tempo_centi = seqr.tempo_centi
+        fp.write(settings.to_bytes())
+    return fp.pos
+
+def sysex_put_payload(kind, index, buf, length):
+    """Use a bank, pattern or settings received by SysEx. The playing pattern
+    changes on the next bar, and it all gets saved to disk on next pause"""
+    global sequences
+    fp = BufReader(buf, length)
+    try:
+        if kind == KIND_BANK:
+            (new_sequences, tempo_centi) = read_bank(fp)
+            if len(new_sequences[0]) != num_steps:
+                raise ValueError("bank has %d steps" % len(new_sequences[0]))
+            sequences = new_sequences
+            if tempo_centi:
+                seqr.set_tempo_centi(tempo_centi)
+            if not seqr.queue_op(StepSequencer.load_steps, sequences[seqr.seqno]):
+                raise ValueError("too many pattern changes waiting")
+        elif kind == KIND_PATTERN and length == num_steps * bank_step_size:
+            steps = read_sequence(fp, BankHeader(1, num_steps))
+            if index == PATTERN_LIVE:
+                if not seqr.queue_op(StepSequencer.load_steps, steps):
+                    raise ValueError("too many pattern changes waiting")
+            elif index < len(sequences):
+                sequences[index] = steps
+        elif kind == KIND_SETTINGS:  # num_steps & MIDI ports change on next boot
+            midi_out.panic()  # channels may be about to change
+            settings.from_bytes(buf, length)
+            settings.changed(ticks_ms())
+            seqr.set_tempo_centi(settings.tempo_centi)
+            seqr.length = settings.seq_len(seqr.seqno)
+            seqr.set_rate(settings.seq_rate(seqr.seqno))
+        else:
+            return
+    except (ValueError, IndexError) as e:
+        print("bad sysex payload:", e)
+        return
+    print("SYSEX LOADED", kind, index)
+    seqr_display.update_ui_all()
 
 
 hw = Hardware()
 
+midi_ports = []
+serial_midi_ports = []  # these get running status & velocity 0 note offs, fewer bytes on the wire
+if settings.usb_midi: midi_ports.append(usb_out)
+if settings.serial_midi: serial_midi_ports.append(hw.midi_uart)
+midi_out = MidiOut(midi_ports, serial_ports=serial_midi_ports)
+cc_locks = ParamLocks(midi_out, num_steps, cc_lock_num)  # each step's CC lock & ramp, sent after its notes
+
+leds = LedEngine(hw, num_steps)
+
 seqr = StepSequencer(num_steps, tempo, play_note_on, play_note_off, playing=False)
+seqr.set_tempo_centi(settings.tempo_centi)
 
 sequences_read()
 
-seqr_display = SequencerDisplay(seqr)
-hw.display.root_group = seqr_display
+# whole bank is the biggest thing sent or received by SysEx
+sysex_handler = SysexHandler(usb_out, sysex_get_payload, sysex_put_payload,
+                             bank_header_size + len(sequences) * num_steps * bank_step_size)
+
+sequence_load(0, undoable=False)
+
+# key & encoder gestures become commands in ui_cmds, handled by ui_command()
+ui_cmds = CommandQueue()
+gestures = Gestures(ui_cmds, hw.step_to_key_pos)
+gestures.recorder = recorder
+
+seqr_display = NullDisplay()  # until ui_setup() is done
+
+def ui_setup():
+    """Build the display a piece at a time, a generator stepped from the main loop
+    so MIDI & the sequencer keep going while fonts load & labels get made"""
+    global seqr_display
+    if use_framebuf:
+        hw.setup_display(framebuf=True)
+        yield
+        seqr_display = FramebufDisplay(seqr, hw.display_i2c)
+        seqr_display.update_ui_all()  # sent a piece at a time by the main loop
+        boot.mark("ui ready")
+        return
+    hw.setup_display()
+    yield
+    if is_macropad:
+        from sequencer_display_macropad import SequencerDisplayMacroPad as SequencerDisplay
+    else:
+        from sequencer_display import SequencerDisplay
+    yield
+    display = SequencerDisplay(seqr, lazy=True)
+    while not display.build_more():
+        yield
+    hw.display.root_group = display
+    seqr_display = display
+    seqr_display.update_ui_all()
+    boot.mark("ui ready")
+    gc.collect()
+    print("mem free after ui:", gc.mem_free())
+
+ui_setup_steps = ui_setup()
+
+def step_edit_show(step, field):
+    """Show the value of the param being edited on held step"""
+    (n,v,gate,on) = seqr.steps[step]
+    field = edit_fields[field]
+    if field == "vel":    seqr_display.update_ui_seqno(f"vel:{v}")
+    elif field == "prob": seqr_display.update_ui_seqno(f"prob:{seqr.probs[step]}%")
+    elif field == "cond": seqr_display.update_ui_seqno("cond:" + seqr.cond_to_name(seqr.conds[step]))
+    elif field == "chord" or field == "arp": seqr_display.update_ui_seqno(seqr.chord_to_name(step))
+    elif field == "cc":
+        cc = seqr.ccs[step]
+        seqr_display.update_ui_seqno(f"cc{cc_lock_num}:" + ("--" if cc == cc_none else str(cc)))
+    elif field == "ramp": seqr_display.update_ui_seqno("ramp:" + ("on" if seqr.ramps[step] else "off"))
+    elif field == "len":  seqr_display.update_ui_seqno(f"len:{seqr.length}")
+    elif field == "rate": seqr_display.update_ui_seqno("rate:" + rate_names[seqr.rate])
+    elif field == "chan": seqr_display.update_ui_seqno(f"chan:{settings.seq_chan(seqr.seqno)}")
+    elif field == "undo": seqr_display.update_ui_seqno(f"undo:{undo.count} redo:{undo.redo_count}")
+    else:                 seqr_display.update_ui_seqno()
+
+def undo_apply(slot, step, field, val):
+    """Put back one param, for undo.undo() & undo.redo()"""
+    if slot == SLOT_LIVE:
+        step_field_set(seqr, step, field, val)
+        if field == FIELD_SEQNO:
+            seqr.length = settings.seq_len(val)
+            seqr.set_rate(settings.seq_rate(val))
+    else:
+        stored_field_set(sequences, slot, step, field, val)
+
+def ui_command(cmd, a, b):
+    """Act on one command from the gesture layer, see sequencer_input.py"""
+    if not command_in_range(cmd, a, seqr.step_count, len(sequences)):
+        return  # a step key past num_steps
+    # step param edits are recorded for undo as one delta of the param they change
+    undo_field = -1
+    if cmd == CMD_EDIT_GATE:
+        undo_field = FIELD_GATE
+    elif cmd >= CMD_EDIT_NOTE and cmd - CMD_EDIT_NOTE < len(undo_fields):
+        undo_field = undo_fields[cmd - CMD_EDIT_NOTE]
+    if undo_field >= 0:
+        undo_old = step_field_get(seqr, a, undo_field)
+
+    # UI: encoder tap, with no key == play/pause
+    if cmd == CMD_PLAY_TOGGLE:
+        if recorder: recorder.snapshot(seqr)  # replays start from here, before the play or pause
+        seqr.toggle_play_pause()
+        if recorder: recorder.record_state(seqr)
+        seqr_display.update_ui_playing()
+        if not seqr.playing:
+            notes_stop()
+            midi_out.flush()  # before the file writes
+            heap.report()
+            sequences_write()
+            if settings.changed_millis or settings.tempo_centi != seqr.tempo_centi:
+                settings_write()
+
+    # UI: encoder turned without any modifiers == change transpose
+    elif cmd == CMD_TRANSPOSE:
+        seqr.transpose = min(max(seqr.transpose + a, -36), 36)
+        seqr_display.update_ui_transpose()
+        if recorder: recorder.record_state(seqr)
+
+    # UI: encoder turned while encoder pushed == change tempo
+    elif cmd == CMD_TEMPO:
+        seqr.set_tempo_centi(min(max(seqr.tempo_centi + a * 100, tempo_min_centi), tempo_max_centi))
+        settings.changed(ticks_ms())
+        seqr_display.update_ui_bpm()
+        if recorder: recorder.record_state(seqr)
+
+    # UI: encoder hold == tap tempo mode, then tap encoder in time
+    elif cmd == CMD_TAP_MODE:
+        seqr_display.update_ui_seqno("TAP TEMPO" if a else None)
+
+    elif cmd == CMD_TAP_TEMPO:
+        seqr.set_tempo_centi(min(max(a, tempo_min_centi), tempo_max_centi))
+        settings.changed(ticks_ms())
+        seqr_display.update_ui_bpm()
+        if recorder: recorder.record_state(seqr)
+
+    elif cmd == CMD_KEY_DOWN:
+        (n,v,gate,on) = seqr.steps[a]
+        seqr_display.update_ui_step(a, n, v, gate, on, True)
+        if not seqr.playing:  # UI: if not playing, step keys == play their pitches
+            play_note_on(n, v, gate, True)  # step note preview note on
+
+    elif cmd == CMD_KEY_UP:
+        (n,v,gate,on) = seqr.steps[a]
+        if not seqr.playing:
+            play_note_off(n, v, gate, True)  # step note preview note off
+        elif not b:  # UI: if playing, step keys == toggles enable (must be on release)
+            on = not on
+            seqr.steps[a] = (n, v, gate, on)
+            undo.record(SLOT_LIVE, a, FIELD_ON, not on, on)
+            if recorder: recorder.record_step(seqr, a)
+        undo.seal()  # edits on next key press are a new undo
+        seqr_display.update_ui_step(a, n, v, gate, on, False)
+        seqr_display.update_ui_seqno()  # in case it was showing a step param
+
+    # UI: encoder tap while step key held == pick next step param to edit
+    elif cmd == CMD_EDIT_FIELD:
+        step_edit_show(a, b)
+
+    # UI: encoder turned and pushed while step key held == change step's gate
+    elif cmd == CMD_EDIT_GATE:
+        (n,v,gate,on) = seqr.steps[a]
+        gate = min(max(gate + b, 1), 15)
+        seqr.steps[a] = (n,v,gate,on)
+        seqr_display.update_ui_step(a, n, v, gate, on, True)
+
+    # UI: encoder turned while step key held == change step's note
+    elif cmd == CMD_EDIT_NOTE:
+        (n,v,gate,on) = seqr.steps[a]
+        if not seqr.playing:
+            play_note_off(n, v, gate, True)  # step note preview note off
+        n = min(max(n + b, 1), 127)
+        if not seqr.playing:
+            play_note_on(n, v, gate, True)  # step note preview note on
+        seqr.steps[a] = (n,v,gate,on)
+        seqr_display.update_ui_step(a, n, v, gate, on, True)
+
+    # UI: encoder turned while step key held, other param picked == change that param
+    elif cmd > CMD_EDIT_NOTE:
+        field = edit_fields[cmd - CMD_EDIT_NOTE]
+        if field == "vel":
+            (n,v,gate,on) = seqr.steps[a]
+            v = min(max(v + b, 1), 127)
+            seqr.steps[a] = (n,v,gate,on)
+        elif field == "prob":
+            seqr.probs[a] = min(max(seqr.probs[a] + b, 0), 100)
+        elif field == "cond":
+            seqr.conds[a] = (seqr.conds[a] + b) % len(trig_conds)
+        elif field == "chord":
+            seqr.chords[a] = (seqr.chords[a] + b) % len(chord_shapes)
+        elif field == "arp":
+            seqr.arps[a] = (seqr.arps[a] + b) % len(arp_names)
+        elif field == "cc":  # turned down past 0 == no lock
+            cc = -1 if seqr.ccs[a] == cc_none else seqr.ccs[a]
+            cc = min(max(cc + b, -1), 127)
+            seqr.ccs[a] = cc_none if cc < 0 else cc
+        elif field == "ramp":
+            seqr.ramps[a] = 1 if b > 0 else 0
+        elif field == "len":  # of the whole sequence, if shorter than where it's at, next step is the first
+            settings.set_seq_len(seqr.seqno, seqr.length + b, ticks_ms())
+            seqr.length = settings.seq_len(seqr.seqno)
+            if recorder: recorder.record_state(seqr)
+        elif field == "rate":  # of the whole sequence, the step playing ends on the new rate's next tick
+            settings.set_seq_rate(seqr.seqno, seqr.rate + b, ticks_ms())
+            seqr.set_rate(settings.seq_rate(seqr.seqno))
+            if recorder: recorder.record_state(seqr)
+        elif field == "chan":  # of the whole sequence, 0 == settings.midi_chan
+            settings.set_seq_chan(seqr.seqno, settings.seq_chans[seqr.seqno] + b, ticks_ms())
+        elif field == "undo":  # one encoder detent == one undo (left) or redo (right)
+            for _ in range(abs(b)):
+                if b < 0: undo.undo(undo_apply)
+                else:     undo.redo(undo_apply)
+            seqr_display.update_ui_steps()
+            if recorder: recorder.snapshot(seqr)
+        step_edit_show(a, cmd - CMD_EDIT_NOTE)
 
-sequence_load(0)
+    # UI: encoder push + hold step key = save sequence
+    elif cmd == CMD_SAVE_ARMED:
+        seqr_display.update_ui_seqno(f"SAVE:{a}")
+
+    elif cmd == CMD_SAVE:
+        sequence_save(a)
+        seqr_display.update_ui_seqno()
+        seqr_display.update_ui_step()
 
-# init display UI
-seqr_display.update_ui_all()
+    # UI: encoder push + tap step key = load sequence
+    elif cmd == CMD_LOAD:
+        sequence_load(a)
+        seqr_display.update_ui_seqno()
+        if not seqr.playing:
+            seqr_display.update_ui_steps() # causes too much lag when playing
 
-# various state for UI handling
-encoder_val_last = hw.encoder.position # needed to calculate encoder_delta
-encoder_push_millis = 0  # when was encoder pushed, 0 == no push
-encoder_delta = 0  # how much encoder was turned, 0 == no turn
-step_push = -1  # which step button is being pushed, -1 == no push
-step_push_millis = 0  # when was a step button pushed
-step_edited = False  # was a step edited while it was held?
+    if undo_field >= 0:
+        undo.record(SLOT_LIVE, a, undo_field, undo_old, step_field_get(seqr, a, undo_field))
+        if recorder: recorder.record_step(seqr, a)
 
 print("Ready.")
+boot.mark("sequencer ready")
 
 while True:
-    gc.collect()  # just to make the timing of this consistent
-
     midi_receive()
 
     seqr.update()
+    cc_locks.update(seqr, settings.seq_chan(seqr.seqno), ticks_ms())  # after the notes, rate capped
+    midi_out.flush()  # all of this step's notes in one write per port
+    sysex_handler.update()  # next chunk of any SysEx dump, after the notes
+    heap.update(seqr)  # collects just after a step, not on every pass
 
-    # update step LEDs
-    for i in range(num_steps):
-        (n,v,gate,on) = seqr.steps[ i ]
-        if i == seqr.i:  cmax = 255  # UI: bright red = indicate sequence position
-        elif on:         cmax = 20   # UI: dim red = indicate mute/unmute state
-        else:            cmax = 0    # UI: off = muted
-        c = max( hw.led_get(i) - hw.leds_fade_amount, cmax)  # nice fade
-        hw.led_set(i,c)
-    hw.leds_show()
+    # update step LEDs, only does work once per LED frame
+    leds.update(seqr)
 
     seqr_display.update_ui_step()
 
-    now = ticks_ms()
-
-    # update encoder turning
-    encoder_val = hw.encoder.position
-    if encoder_val != encoder_val_last:
-        encoder_delta = (encoder_val - encoder_val_last)
-        encoder_val_last = encoder_val
-
-    # UI: encoder push + hold step key = save sequence
-    #print(encoder_push_millis, now-step_push_millis)
-    if encoder_push_millis > 0 and step_push_millis > 0:
-        if encoder_push_millis < step_push_millis:  # encoder pushed first
-            if now - step_push_millis > 1000:
-                seqr_display.update_ui_seqno(f"SAVE:{step_push}")
-
-
-    # on encoder turn
-    if encoder_delta:
-
-        # UI: encoder turned and pushed while step key held == change step's gate
-        if step_push > -1 and encoder_push_millis > 0:
-            (n,v,gate,on) = seqr.steps[ step_push ]
-            gate = min(max(gate + encoder_delta, 1), 15)
-            seqr.steps[ step_push ] = (n,v,gate,on)
-            step_edited = True
-            seqr_display.update_ui_step( step_push, n, v, gate, on, True)
-
-        # UI: encoder turned while step key held == change step's note
-        elif step_push > -1:  # step key pressed
-            (n,v,gate,on) = seqr.steps[ step_push ]
-            if not seqr.playing:
-                play_note_off( n, v, gate, True)  # step note preview note off
-
-            n = min(max(n + encoder_delta, 1), 127)
-
-            if not seqr.playing:
-                play_note_on( n, v, gate, True )  # step note preview note on
-
-            seqr.steps[ step_push ] = (n,v,gate,on)
-            step_edited = True
-            seqr_display.update_ui_step( step_push, n, v, gate, on, True)
-
-        # UI: encoder turned while encoder pushed == change tempo
-        elif encoder_push_millis > 0:
-            tempo = tempo + encoder_delta
-            seqr.set_tempo(tempo)
-            seqr_display.update_ui_bpm()
-
-        # UI: encoder turned without any modifiers == change transpose
-        else:
-            seqr.transpose = min(max(seqr.transpose + encoder_delta, -36), 36)
-            seqr_display.update_ui_transpose()
-        encoder_delta = 0  # we used up encoder delta
-
-    # on encoder push
-    encsw = hw.encoder_switch.events.get()
-    if encsw:
-        if encsw.pressed:
-            #print("encoder_switch: press")
-            encoder_push_millis = now  # save when we pushed encoder
-
-        if encsw.released:
-            #print("encoder_switch: release")
-            if step_push == -1 and encoder_delta == 0:  # step key is not pressed and no turn
-                # UI: encoder tap, with no key == play/pause
-                if ticks_ms() - encoder_push_millis < 300:
-                    seqr.toggle_play_pause()
-                    seqr_display.update_ui_playing()
-                    if not seqr.playing:
-                        sequences_write()
-                # UI encoder hold with no key == STOP and reset playhead to 0
-                # FIXME: broken. doesn't re-start at 0 properly
-                # elif ticks_diff( ticks_ms(), encoder_push_millis) > 1000:
-                #     seqr.stop()
-                #     seqr_display.update_ui_all()
-            else:  # step key is pressed
-                pass
-            encoder_push_millis = 0  # say we are done with encoder, on key release
-
-
-    # on step key push
-    key = hw.keys.events.get()
-    if key:
-        try:
-            # record which step key is pushed for other UI modifiers
-            # .index() throws the ValueError, thus the try/except
-            step_push = hw.step_to_key_pos.index(key.key_number) # map key pos back to step num
-            (n,v,gate,on) = seqr.steps[step_push]
-
-            if key.pressed:
-                #print("+ press", key.key_number, "step_push:",step_push)
-                step_push_millis = ticks_ms()
-
-                # encoder push + key push = load/save sequence ## FIXME need to clean this up
-                if encoder_push_millis > 0:
-                    pass
-                else:
-                    seqr_display.update_ui_step( step_push, n, v, gate, on, True)
-                    if seqr.playing:
-                        pass
-                    # UI: if not playing, step keys == play their pitches
-                    else:
-                        play_note_on( n, v, gate, True )  # step note preview note on
-
-            elif key.released:
-                #print("- release", key.key_number, step_push)
-
-                if encoder_push_millis > 0:   # UI load /save sequence mode
-                    # UI: encoder push + hold step key = save sequence
-                    if now - step_push_millis > 1000:
-                        sequence_save( step_push )
-                        seqr_display.update_ui_seqno()
-                        seqr_display.update_ui_step()
-                    # UI: encoder push + tap step key = load sequence
-                    else:
-                        sequence_load( step_push )
-                        seqr_display.update_ui_seqno()
-                        if not seqr.playing:
-                            seqr_display.update_ui_steps() # causes too much lag when playing
-                        (n,v,gate,on) = seqr.steps[step_push]
-                else:
-                    if seqr.playing:
-                        if step_edited:
-                            pass
-                        else:
-                            # UI: if playing, step keys == toggles enable (must be on relase)
-                            on = not on
-                            seqr.steps[step_push] = (n, v, gate, on)
-                    else:
-                        # UI: if not playing, step key == play their pitches
-                        (n,v,gate,on) = seqr.steps[step_push]
-                        play_note_off( n, v, gate, True )   # step note preview note on
-
-                seqr_display.update_ui_step( step_push, n, v, gate, on, False)
-                step_push = -1  # say we are done with key
-                step_push_millis = 0 # say we're done with key push
-                step_edited = False  # done editing  # FIXME we need all these vars? I think so
-
-        except ValueError:  # undefined macropad key was pressed, ignore
-            pass
-
-#    emillis = ticks_ms() - now
-#    if emillis > 2:
-#        print("emillis:",emillis, ticks_ms())
+    # handle all key & encoder events since last time through
+    gestures.poll(hw)
+    cmd = ui_cmds.get()
+    while cmd:
+        ui_command(cmd, ui_cmds.a, ui_cmds.b)
+        cmd = ui_cmds.get()
+
+    midi_out.flush()  # any step preview notes from UI
+
+    # build the display a piece per loop, when there's time before the sequencer needs us
+    if ui_setup_steps and seqr.idle_millis(ticks_ms()) > ui_setup_millis:
+        if next(ui_setup_steps, True):
+            ui_setup_steps = None
+
+    # framebuffer display sends what changed, as much as fits before the sequencer needs us
+    if use_framebuf and not ui_setup_steps:
+        idle = seqr.idle_millis(ticks_ms())
+        if idle > 1:
+            seqr_display.flush(min(bytes_for_millis(idle - 1), fb_flush_max))
+
+    # settings changed while stopped get saved once they've stopped changing
+    if (settings.changed_millis and not seqr.playing and
+        ticks_ms() - settings.changed_millis > settings_write_millis):
+        settings_write()
@@ -14,6 +14,54 @@ def ticks_diff(t1,t2): return t1-t2
 
 note_names = ("C","C#","D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
 
+# trig conditions, as (A,B) == "play on loop A of every B loops", index 0 == always
+trig_conds = ( (1,1), (1,2), (2,2), (1,3), (2,3), (3,3), (1,4), (2,4), (3,4), (4,4) )
+
+# chord shapes a step can play, as semitone offsets from step's note, index 0 == single note
+chord_shapes = ( (0,), (0,4,7), (0,3,7), (0,4,7,11), (0,3,7,10), (0,4,7,10), (0,5,7), (0,7), (0,12) )
+chord_names = ( "", "maj", "min", "maj7", "min7", "7", "sus4", "5", "oct" )
+
+# how a step's chord notes are played: all at once, or arpeggiated up/down within the step
+ARP_CHORD, ARP_UP, ARP_DOWN = 0, 1, 2
+arp_names = ( "chd", "up", "dn" )
+
+max_voices = 4  # most notes a step can sound at once, i.e. longest chord shape
+max_pending_ops = 4  # pattern ops that can wait for a bar or pass at once
+
+# step rates a sequence can play at, in master clock ticks per step, 96 ticks per quarter note
+# (4 per MIDI clock tick) so triplets are whole ticks too. Steps fire on the master ticks that
+# are multiples of the rate, so sequences at any rates stay lined up with each other & the bar
+ticks_per_quarter = 96
+ticks_per_bar = ticks_per_quarter * 4  # every rate divides it, so the master clock can count bars
+rate_ticks = ( 8, 12, 16, 24, 32, 48, 64, 96, 192, 384 )
+rate_names = ( "1/32T", "1/32", "1/16T", "1/16", "1/8T", "1/8", "1/4T", "1/4", "1/2", "1/1" )
+RATE_16TH = 3
+
+cc_none = 0xff  # step has no CC param lock
+
+class Xorshift16:
+    """Small seeded xorshift PRNG for step probabilities.
+    16-bit so state stays a small int on CircuitPython (no heap allocation),
+    and seeded so a run can be replayed exactly on the host"""
+    def __init__(self, seed=0xACE1):
+        self.seed(seed)
+
+    def seed(self, seed):
+        self.state = (seed & 0xffff) or 0xACE1  # xorshift state can never be zero
+
+    def next(self):
+        """Return next pseudo-random value, 1-65535"""
+        x = self.state
+        x ^= (x << 7) & 0xffff
+        x ^= x >> 9
+        x ^= (x << 8) & 0xffff
+        self.state = x
+        return x
+
+    def percent(self):
+        """Return next pseudo-random value, 0-99"""
+        return self.next() % 100
+
 # maybe use this someday
 # class Step:
 #     on = True
@@ -24,100 +72,313 @@ note_names = ("C","C#","D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
 #     #     self.on = on
 
 class StepSequencer:
-    def __init__(self, step_count, tempo, on_func, off_func, playing=False, seqno=0):
+    def __init__(self, step_count, tempo, on_func, off_func, playing=False, seqno=0, seed=0xACE1):
         self.ext_trigger = False  # midi clocked or not
-        self.steps_per_beat = 4  # 16th note
+        self.rate = RATE_16TH  # index into rate_ticks, set with set_rate()
+        self.ticks_per_step = rate_ticks[self.rate]  # master clock ticks, 96 per quarter note
+        self.tick = 0  # master clock tick within the bar the current step fired on, or MIDI clock is up to
+        self.step_ticks = self.ticks_per_step  # master clock ticks the current step lasts
         self.step_count = step_count
-        self.i = 0  # where in the sequence we currently are
+        self.length = step_count  # steps played before going back to the first, up to step_count
+        self.i = -1  # where in the sequence we currently are, -1 == before the start
         self.steps = [ (0,100,8,True) ] * step_count  # list of step "objects", i.e. tuple (note, vel, gate, on)
+        self.probs = bytearray([100] * step_count)  # per-step trigger probability, 0-100 percent
+        self.conds = bytearray(step_count)  # per-step trig condition, index into trig_conds
+        self.chords = bytearray(step_count)  # per-step chord, index into chord_shapes
+        self.arps = bytearray(step_count)  # per-step arp mode, ARP_CHORD, ARP_UP, ARP_DOWN
+        self.ccs = bytearray([cc_none] * step_count)  # per-step CC param lock, 0-127 or cc_none
+        self.ramps = bytearray(step_count)  # per-step, 1 == CC ramps from this step's lock to the next one
+        # everything stored per step, for pattern ops to move around together
+        self.step_arrays = (self.steps, self.probs, self.conds, self.chords, self.arps, self.ccs, self.ramps)
+        self.pending_ops = [None] * max_pending_ops  # ring of (func,args,at_pass) pattern ops waiting to be done
+        self.pending_head = 0  # oldest pending op
+        self.pending_count = 0
+        self.loop_count = -1  # how many times we've gone through the sequence, for trig conditions
+        self.rng = Xorshift16(seed)
         self.on_func = on_func    # callback to invoke when 'note on' should be sent
         self.off_func = off_func  # callback to invoke when 'note off' should be sent
         self.set_tempo(tempo)
-        self.last_beat_millis = ticks_ms()  # 'tempo' in our native tongue
-        self.held_gate_millis = 0  # when in the future our note off should occur
-        self.held_note = (0,0,0,0)  # the current note being on, to be turned off
+        self.last_beat_millis = ticks_ms()  # when last step should've happened, 'tempo' in our native tongue
+        self.step_frac_micros = 0  # and the fraction of a millisecond after last_beat_millis it really was
+        # voices are the notes of the current step, one slot per chord note
+        self.voice_on_millis = [0] * max_voices  # when in the future an arp note on should occur, 0 == none
+        self.voice_off_millis = [0] * max_voices  # when in the future our note off should occur, 0 == none
+        self.voice_notes = [(0,0,0,0)] * max_voices  # the notes being on, to be turned off
         self.transpose = 0
         self.playing = playing   # is sequence running or not (but use .play()/.pause())
         self.seqno = seqno # an 'id' of what sequence it's currently playing
+        self.midiclk_last_millis = 0  # when last quarter note of MIDI clock happened, 0 == none yet
 
     @property
     def tempo(self):  # really just used for display purposes
-        return 60_000 // self.beat_millis // self.steps_per_beat
+        return self.tempo_centi / 100
 
     def set_tempo(self, tempo):
-        """Sets the internal tempo. beat_millis is 1/16th note time in milliseconds"""
-        self.beat_millis = 60_000 // self.steps_per_beat // tempo
-        print("seq.set_tempo: %6.2f %d" % (self.beat_millis, tempo) )
+        """Sets the internal tempo in BPM, can be fractional"""
+        self.set_tempo_centi(round(tempo * 100))
+
+    def set_tempo_centi(self, tempo_centi):
+        """Sets the internal tempo in 1/100ths of a BPM, the tempo we really keep.
+        Step time is a whole number of MIDI clock ticks in microseconds, like the
+        Arduino version, beat_millis is that rounded down to milliseconds"""
+        self.tempo_centi = tempo_centi
+        self.tick_micros = 6_000_000_000 // (24 * tempo_centi)  # MIDI clock tick, 4 master ticks
+        self.set_step_len()
+
+    def set_rate(self, rate, now=None):
+        """Play a step every rate_ticks[rate] master clock ticks, on the ticks that are multiples
+        of it: the step playing now ends on the next one. rate is an index into rate_ticks"""
+        self.rate = rate
+        tps = self.ticks_per_step = rate_ticks[rate]
+        self.step_ticks = tps
+        if self.playing and not self.ext_trigger:
+            if now is None:
+                now = ticks_ms()
+            elapsed = (now - self.last_beat_millis) * 1000 - self.step_frac_micros
+            tick = self.tick + max(elapsed, 0) * 4 // self.tick_micros  # where the master clock is now
+            self.step_ticks = (tick // tps + 1) * tps - self.tick
+        self.set_step_len()
+
+    def set_step_len(self):
+        """beat_micros is a whole step at the tempo & rate, step_len_micros the step playing now
+        (longer or shorter than a whole one just after a rate change)"""
+        self.beat_micros = self.tick_micros * self.ticks_per_step // 4  # rates are all whole MIDI clock ticks
+        self.beat_millis = self.beat_micros // 1000
+        self.step_len_micros = self.tick_micros * self.step_ticks // 4
 
     def trigger_next(self, now):
         """Trigger next step in sequence (and thus make externally triggered)"""
         self.ext_trigger = True
-        self.trigger(now, self.beat_millis)
+        self.last_beat_millis = now
+        self.step_frac_micros = 0
+        self.trigger(now)
+
+    def midi_start(self, now):
+        """Handle MIDI start: play from the first step, on the first clock pulse to come"""
+        self.tick = 0
+        self.midiclk_last_millis = 0
+        self.ext_trigger = True
+        self.last_beat_millis = now  # so we only fall back to internal clock if no clock comes
+        self.i = -1
+        self.loop_count = -1
+        self.playing = True
 
-    def trigger(self, now, delta_t):
+    def midi_clock(self, now):
+        """Handle an incoming MIDI clock pulse. Returns True when tempo was re-measured"""
+        tick = self.tick
+        measured = False
+        if tick % ticks_per_quarter == 0:  # once every quarter note, from the first pulse after MIDI start
+            quarter_millis = now - self.midiclk_last_millis
+            if self.midiclk_last_millis and 0 < quarter_millis < 6000:  # ignore first quarter note, or a long gap
+                self.set_tempo_centi((6_000_000 + quarter_millis // 2) // quarter_millis)
+                measured = True
+            self.midiclk_last_millis = now
+        if tick % self.ticks_per_step == 0:  # e.g. every 6 pulses for 1/16th notes, every 4 for 1/16th triplets
+            self.trigger_next(now)  # with self.tick the tick it fires on, like the internal clock
+        self.tick = (tick + 4) % ticks_per_bar  # 4 master ticks per pulse
+        return measured
+
+    def trigger(self, now):
+        """Play next step in sequence. 'now' is when it should've happened, and
+        step_frac_micros the fraction of a millisecond past that"""
         if not self.playing:
             return
-        fudge = 0  # seems more like 3-10
 
         # go to next step in sequence, get new note, transpose if needed
-        self.i = (self.i + 1) % self.step_count
+        self.i += 1
+        if self.i >= self.length:  # (length may have just been made shorter)
+            self.i = 0
+        if self.i == 0:
+            self.loop_count += 1
+        if self.pending_count and (self.tick == 0 or self.i == 0):  # pattern ops on a bar or pass, never mid-step
+            self.run_pending_ops()
+            if self.i >= self.length:  # op made the sequence shorter than where we're at
+                self.i = 0
         (note,vel,gate,on) = self.steps[self.i]
         note += self.transpose
+        if on:
+            on = self.step_fires(self.i)
+
+        # turn off any pending notes (should've been turned off, but this is just in case)
+        for k in range(max_voices):
+            if self.voice_off_millis[k] > 0:
+                held_note = self.voice_notes[k]
+                if self.voice_on_millis[k] == 0:  # only turn off notes that got turned on
+                    print("HELD NOTE", self.notenum_to_name(held_note[0]), held_note[2],
+                          now, self.voice_off_millis[k], self.beat_millis)
+                    self.off_func( *held_note )  # FIXME: why is this getting held?
+                self.voice_on_millis[k] = 0
+                self.voice_off_millis[k] = 0
+
+        # trigger new notes, arp notes are spread evenly across the step
+        shape = chord_shapes[self.chords[self.i]]
+        arp = self.arps[self.i]
+        num_notes = len(shape)
+        sub_millis = self.beat_millis // num_notes if arp else 0
+        if arp:
+            gate_millis = (sub_millis * gate) // 16  # gate ranges from 1-16
+        else:  # gate timed in micros from when the step really was, like the Arduino version
+            gate_millis = (self.step_frac_micros + gate * self.beat_micros // 16) // 1000
+        for k in range(num_notes):
+            j = num_notes-1-k if arp == ARP_DOWN else k
+            voice = (min(note + shape[j], 127), vel, gate, on)
+            self.voice_notes[k] = voice  # save for note off later
+            on_millis = now + k * sub_millis
+            self.voice_off_millis[k] = on_millis + gate_millis
+            if k > 0 and arp:
+                self.voice_on_millis[k] = on_millis  # update() will turn it on
+            else:
+                self.on_func( *voice )
 
-        # turn off any pending note (should've been turned off, but this is just in case)
-        if self.held_gate_millis > 0:
-            print("HELD NOTE", self.notenum_to_name(self.held_note[0]), self.held_note[2],
-                  now, self.held_gate_millis, delta_t, self.beat_millis)
-            self.off_func( *self.held_note )  # FIXME: why is this getting held?
+    def queue_op(self, func, *args, at_pass=False):
+        """Do pattern op func(self, *args) on the next bar downbeat, or at the start of
+        the next pass through the sequence if at_pass, or right away if not playing.
+        Ops are done in the order queued. Returns False if too many are waiting already"""
+        if self.pending_count == max_pending_ops:
+            return False
+        self.pending_ops[(self.pending_head + self.pending_count) % max_pending_ops] = (func, args, at_pass)
+        self.pending_count += 1
+        if not self.playing:
+            self.run_pending_ops(True)
+        return True
+
+    def run_pending_ops(self, now=False):
+        """Do queued pattern ops, oldest first, while they're due (all of them if now)"""
+        while self.pending_count:
+            (func, args, at_pass) = self.pending_ops[self.pending_head]
+            if not (now or (self.i == 0 if at_pass else self.tick == 0)):
+                return
+            self.pending_ops[self.pending_head] = None
+            self.pending_head = (self.pending_head + 1) % max_pending_ops
+            self.pending_count -= 1
+            func(self, *args)
 
-        # trigger new note
-        self.on_func(note, vel, gate, on)
+    def step_fires(self, i):
+        """Decide if step i plays this time, based on its trig condition and probability"""
+        cond = self.conds[i]
+        if cond:
+            (a,b) = trig_conds[cond]
+            if self.loop_count % b != a-1:
+                return False
+        prob = self.probs[i]
+        if prob < 100:  # only draw a random number when needed, keeps replays deterministic
+            return self.rng.percent() < prob
+        return True
 
-        # calculate next note timing and held note timing
-        err_t = delta_t - self.beat_millis  # how much we are over
-        #print("err_t:",self.i, err_t, self.beat_millis)
-        self.last_beat_millis = now - err_t - fudge # adjust for our overage
-        self.held_note = (note,vel,gate,on) # save for note off later
-        self.held_gate_millis = now + ((self.beat_millis * gate) // 16) - err_t # gate ranges from 1-16
+    def load_steps(self, steps):
+        """Load a stored sequence, a list of [note,vel,gate,on] or [note,vel,gate,on,prob,cond,...]"""
+        for i in range(self.step_count):
+            s = steps[i]
+            self.steps[i] = (s[0], s[1], s[2], s[3])
+            self.probs[i] = s[4] if len(s) > 4 else 100
+            self.conds[i] = s[5] if len(s) > 5 else 0
+            self.chords[i] = s[6] if len(s) > 6 else 0
+            self.arps[i] = s[7] if len(s) > 7 else 0
+            self.ccs[i] = s[8] if len(s) > 8 else cc_none
+            self.ramps[i] = s[9] if len(s) > 9 else 0
 
-    def update(self):
-        """Update state of sequencer. Must be called regularly in main"""
+    def save_steps(self):
+        """Return current sequence in storable form, list of (note,vel,gate,on,prob,cond,chord,arp,cc,ramp)"""
+        return [ self.steps[i] + (self.probs[i], self.conds[i], self.chords[i], self.arps[i],
+                                  self.ccs[i], self.ramps[i])
+                 for i in range(self.step_count) ]
 
-        now = ticks_ms()
+    def update(self, now=None):
+        """Update state of sequencer. Must be called regularly in main.
+        'now' can be passed in to run the sequencer off a fake clock"""
+
+        if now is None:
+            now = ticks_ms()
         delta_t = now - self.last_beat_millis  # FIXME: better name, 'real_beat_millis'?
 
-        # turn off note if it is done
-        if self.held_gate_millis != 0 and now >= self.held_gate_millis:
-            self.held_gate_millis = 0
-            self.off_func( *self.held_note )
+        # turn on arp notes when due, turn off notes when done
+        for k in range(max_voices):
+            on_millis = self.voice_on_millis[k]
+            if on_millis != 0 and now >= on_millis:
+                self.voice_on_millis[k] = 0
+                self.on_func( *self.voice_notes[k] )
+            elif on_millis == 0 and self.voice_off_millis[k] != 0 and now >= self.voice_off_millis[k]:
+                self.voice_off_millis[k] = 0
+                self.off_func( *self.voice_notes[k] )
 
-        # if time for new note, trigger it
-        if delta_t >= self.beat_millis:
+        # if time for new note, trigger it. Steps stay on the microsecond step grid,
+        # even if we're called late, and a tempo change applies from the next step
+        step_micros = self.step_frac_micros + self.step_len_micros
+        if delta_t >= step_micros // 1000:
             if not self.ext_trigger:
-                self.trigger(now, delta_t)
+                self.last_beat_millis += step_micros // 1000
+                self.step_frac_micros = step_micros % 1000
+                self.tick = (self.tick + self.step_ticks) % ticks_per_bar
+                if self.step_ticks != self.ticks_per_step:  # whole steps again after a rate change
+                    self.step_ticks = self.ticks_per_step
+                    self.step_len_micros = self.beat_micros
+                self.trigger(self.last_beat_millis)
             else:
                 # fall back to internal triggering if not externally clocked for a while
                 if delta_t > self.beat_millis * 4:
                     self.ext_trigger = False
                     print("Turning EXT TRIGGER off")
 
+    def idle_millis(self, now):
+        """How long until the sequencer next has to do something (a step, an arp note
+        or a note off), for fitting other work in between. 1000 if nothing to do"""
+        t = 1000
+        if self.playing:
+            t = (self.step_frac_micros + self.step_len_micros) // 1000 - (now - self.last_beat_millis)
+        for k in range(max_voices):
+            due = self.voice_on_millis[k] or self.voice_off_millis[k]
+            if due:
+                t = min(t, due - now)
+        return t
+
+    def release_voices(self):
+        """End the current step's sounding notes now instead of when their gates are up,
+        and drop arp notes not played yet"""
+        for k in range(max_voices):
+            if self.voice_off_millis[k] and not self.voice_on_millis[k]:
+                self.off_func( *self.voice_notes[k] )
+            self.voice_on_millis[k] = 0
+            self.voice_off_millis[k] = 0
+
     def toggle_play_pause(self):
         if self.playing:
             self.pause()
+        else:
+            self.cont()
+
+    def toggle_play_stop(self):
+        if self.playing:
+            self.stop()
         else:
             self.play()
 
-    def stop(self):  # FIXME: what about pending note
+    def stop(self):
+        """Stop playing, next play starts from the first step. Playing notes end as usual"""
         self.playing = False
-        self.i = 0
-        self.last_beat_millis = 0
+        self.i = -1
+        self.loop_count = -1
 
     def pause(self):
+        """Stop playing, next cont() carries on from here. Playing notes end as usual"""
         self.playing = False
 
-    def play(self, play=True):
-        self.last_beat_millis = ticks_ms() - self.beat_millis # ensures we start on immediately
+    def play(self, play=True, now=None):
+        """Play from the first step, starting right now"""
+        self.stop()
+        self.cont(now)
+
+    def cont(self, now=None):
+        """Carry on playing from the next step, starting right now"""
+        if now is None:
+            now = ticks_ms()
         self.playing = True
+        if not self.ext_trigger:  # when MIDI clocked, next clock pulse plays it
+            self.last_beat_millis = now
+            self.step_frac_micros = 0
+            self.tick = 0  # master clock starts over with this step
+            self.step_ticks = self.ticks_per_step
+            self.set_step_len()
+            self.trigger(now)
 
     def notenum_to_noteoct(self, notenum):
         """Return note and octave as (string,int) tuple"""
@@ -125,6 +386,16 @@ class StepSequencer:
         notename = note_names[notenum % 12]
         return (notename, octave)
 
+    def cond_to_name(self, cond):
+        """Return trig condition as display string, e.g. "1:2" """
+        if cond == 0: return "all"
+        return "%d:%d" % trig_conds[cond]
+
+    def chord_to_name(self, i):
+        """Return step i's chord and arp mode as display string, e.g. "maj7 up" """
+        if self.chords[i] == 0: return "none"
+        return chord_names[self.chords[i]] + " " + arp_names[self.arps[i]]
+
     # old do not use
     def notenum_to_name(self, notenum, separator=""):
         octave = notenum // 12 - 2;
@@ -0,0 +1,101 @@
+# sequencer_bank.py -- picostepseq sequence bank file format
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# A bank is all the stored sequence slots, in a small binary file that both
+# the CircuitPython and Arduino builds read & write ("/saved_sequences.psq").
+# Everything is little-endian bytes:
+#
+#   header (bank_header_size bytes):
+#     "PSQB"          magic
+#     version         bank_version, only goes up if the meaning of existing bytes changes
+#     header_size     bytes in this header, readers skip any they don't know about
+#     num_seqs        sequence slots in the bank
+#     num_steps       steps in each sequence
+#     step_size       bytes per step, readers skip any they don't know about
+#     reserved        0
+#     tempo_centi     uint16, tempo in 1/100ths BPM, 0 == not saved
+#   then num_seqs * num_steps steps of step_size bytes:
+#     note, vel, gate, flags (bit 0 == on), prob, cond, chord, arp, cc, ramp
+#     (cc is the step's CC param lock value, 0xff == none, see sequencer_cc.py)
+#
+# New per-step params get added at the end of a step, and new header fields at
+# the end of the header, so older readers can still read newer banks.
+# Steps are read & written one sequence at a time, so a bank never has to be
+# in memory all at once to convert it.
+
+import struct
+
+bank_magic = b"PSQB"
+bank_version = 1
+bank_header_fmt = "<4sBBBBBBH"  # magic, version, header_size, num_seqs, num_steps, step_size, reserved, tempo_centi
+bank_header_size = struct.calcsize(bank_header_fmt)
+bank_step_size = 10
+step_defaults = (0, 127, 8, 1, 100, 0, 0, 0, 0xff, 0)  # for params older banks or the JSON format don't have
+
+FLAG_ON = 0x01
+
+class BankHeader:
+    """What's in a bank, from read_header()"""
+    def __init__(self, num_seqs, num_steps, tempo_centi=0, step_size=bank_step_size, version=bank_version):
+        self.version = version
+        self.num_seqs = num_seqs
+        self.num_steps = num_steps
+        self.step_size = step_size
+        self.tempo_centi = tempo_centi
+
+def write_header(fp, header):
+    fp.write(struct.pack(bank_header_fmt, bank_magic, bank_version, bank_header_size,
+                         header.num_seqs, header.num_steps, bank_step_size, 0, header.tempo_centi))
+
+def read_header(fp):
+    """Read a bank header, raises ValueError if fp isn't a bank we can read"""
+    data = fp.read(bank_header_size)
+    if len(data) < bank_header_size:
+        raise ValueError("not a picostepseq bank")
+    (magic, version, header_size, num_seqs, num_steps, step_size, _, tempo_centi) = struct.unpack(bank_header_fmt, data)
+    if magic != bank_magic or header_size < bank_header_size or step_size < 4:
+        raise ValueError("not a picostepseq bank")
+    if version > bank_version:
+        raise ValueError("bank version %d is newer than %d" % (version, bank_version))
+    if header_size > bank_header_size:
+        fp.read(header_size - bank_header_size)
+    return BankHeader(num_seqs, num_steps, tempo_centi, step_size, version)
+
+def write_sequence(fp, steps, buf=None):
+    """Write one sequence, a list of [note,vel,gate,on, prob,cond,chord,arp, cc,ramp] steps,
+    trailing params can be left off. buf is an optional reusable bytearray"""
+    if buf is None or len(buf) != len(steps) * bank_step_size:
+        buf = bytearray(len(steps) * bank_step_size)
+    j = 0
+    for s in steps:
+        for f in range(bank_step_size):
+            buf[j+f] = s[f] if f < len(s) else step_defaults[f]
+        buf[j+3] = FLAG_ON if s[3] else 0
+        j += bank_step_size
+    fp.write(buf)
+    return buf
+
+def read_sequence(fp, header):
+    """Read the next sequence, returns list of [note,vel,gate,on, prob,cond,chord,arp, cc,ramp] steps"""
+    step_size = header.step_size
+    data = fp.read(header.num_steps * step_size)
+    if len(data) < header.num_steps * step_size:
+        raise ValueError("bank is cut short")
+    steps = []
+    for j in range(0, len(data), step_size):
+        s = [ data[j+f] if f < step_size else step_defaults[f] for f in range(bank_step_size) ]
+        s[3] = bool(s[3] & FLAG_ON)
+        steps.append(s)
+    return steps
+
+def write_bank(fp, sequences, tempo_centi=0):
+    """Write a whole bank, sequences is a list of sequences of steps"""
+    write_header(fp, BankHeader(len(sequences), len(sequences[0]), tempo_centi))
+    buf = None
+    for steps in sequences:
+        buf = write_sequence(fp, steps, buf)
+
+def read_bank(fp):
+    """Read a whole bank, returns (sequences, tempo_centi)"""
+    header = read_header(fp)
+    return [ read_sequence(fp, header) for _ in range(header.num_seqs) ], header.tempo_centi
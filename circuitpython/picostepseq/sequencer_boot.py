@@ -0,0 +1,37 @@
+# sequencer_boot.py -- picostepseq boot timing, and a stand-in display until the real one is built
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# code.py starts MIDI & the sequencer first, then builds the display a piece
+# at a time from the main loop (fonts, labels), so notes can play as soon as
+# possible. BootTimer prints how long each part of that took.
+
+from sequencer import ticks_ms
+
+class BootTimer:
+    """Prints boot milestones, in millis since power-on and since the last milestone"""
+    def __init__(self):
+        self.start = ticks_ms()
+        self.last = self.start
+        self.marks = {}  # name -> millis since power-on
+        print("boot: code.py started at %d ms" % self.start)
+
+    def mark(self, name):
+        now = ticks_ms()
+        self.marks[name] = now
+        print("boot: %-20s at %6d ms (+%d ms)" % (name, now, now - self.last))
+        self.last = now
+
+    def mark_once(self, name):
+        """mark() only the first time, for things like the first note"""
+        if name not in self.marks:
+            self.mark(name)
+
+class NullDisplay:
+    """Takes the UI updates SequencerDisplay does, and does nothing, until the display is built"""
+    def update_ui_step(self, step=None, n=0, v=127, gate=8, on=True, selected=False): pass
+    def update_ui_steps(self): pass
+    def update_ui_bpm(self): pass
+    def update_ui_playing(self): pass
+    def update_ui_transpose(self): pass
+    def update_ui_seqno(self, msg=None): pass
+    def update_ui_all(self): pass
@@ -0,0 +1,122 @@
+# sequencer_cc.py -- picostepseq per-step CC param locks & ramps, kept under a MIDI bandwidth cap
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Each step can lock a CC (seqr.ccs, one CC number for the whole sequence,
+# like filter cutoff) to a value, and ramp (seqr.ramps) from there to the next
+# locked step's value. Whenever the locks change, they're rendered into a
+# small table of ramp_slots values per step, so playing them back is one byte
+# lookup per main loop pass, no math.
+#
+# CCs are queued after the step's notes in the same MidiOut flush, so they
+# never hold up a note. At most one CC goes out per min_interval_millis, worked
+# out by cc_interval_millis() so notes & CCs together use no more than
+# share_percent of the 31250 baud serial MIDI. If the ramp is faster than that,
+# values in between are skipped, the latest one always gets sent.
+
+from sequencer import cc_none, max_voices, ticks_per_quarter
+
+ramp_slots = 6  # CC values per step in a ramp, one per MIDI clock tick
+
+uart_bytes_per_sec = 31250 // 10  # serial MIDI sends 10 bits a byte, start + 8 data + stop
+note_bytes = 6  # note on & note off, 3 bytes each
+cc_bytes = 3
+
+def step_bytes(notes_per_step=1, ccs_per_step=0):
+    """Serial MIDI bytes one step sends"""
+    return notes_per_step * note_bytes + ccs_per_step * cc_bytes
+
+def midi_bytes_per_sec(tempo_centi, notes_per_step=1, ccs_per_step=0, steps_per_beat=4):
+    """Serial MIDI bytes per second at tempo_centi (1/100ths BPM)"""
+    return step_bytes(notes_per_step, ccs_per_step) * steps_per_beat * tempo_centi // 6000
+
+def midi_load_percent(tempo_centi, notes_per_step=1, ccs_per_step=0, steps_per_beat=4):
+    """How much of serial MIDI's bandwidth the steps use, in percent"""
+    return midi_bytes_per_sec(tempo_centi, notes_per_step, ccs_per_step, steps_per_beat) * 100 // uart_bytes_per_sec
+
+def cc_interval_millis(tempo_centi, notes_per_step=max_voices, share_percent=50, steps_per_beat=4):
+    """Shortest time between CCs so notes & CCs together stay under share_percent of serial MIDI.
+    1000 if the notes alone use it all"""
+    left = uart_bytes_per_sec * share_percent // 100 - midi_bytes_per_sec(tempo_centi, notes_per_step, 0, steps_per_beat)
+    if left < cc_bytes:
+        return 1000
+    return (cc_bytes * 1000 + left - 1) // left
+
+class ParamLocks:
+    """Plays a sequencer's CC param locks & ramps out a MidiOut, rate capped"""
+    def __init__(self, midi_out, step_count, cc_num=74, share_percent=50):
+        self.midi_out = midi_out
+        self.cc_num = cc_num
+        self.share_percent = share_percent
+        self.table = bytearray(step_count * ramp_slots)  # CC value of each slot, cc_none == nothing new
+        self.seen_ccs = bytearray(step_count)  # what the table was rendered from
+        self.seen_ramps = bytearray(step_count)
+        self.seen_length = -1
+        self.tempo_centi = 0  # min_interval_millis is for this tempo
+        self.ticks_per_step = 0  # and step rate
+        self.min_interval_millis = 1000
+        self.last_pos = -1  # table slot looked at last, -1 == none since play
+        self.pending = cc_none  # value to send once the rate cap allows
+        self.last_value = cc_none  # value last sent
+        self.last_sent_millis = 0
+        self.sent = 0  # CCs sent, for measuring
+
+    def render(self, seqr):
+        """Fill the table from seqr's locks: a lock's value on its step's first slot,
+        a ramp's values on every slot up to the next locked step"""
+        (ccs, n, table) = (seqr.ccs, seqr.length, self.table)
+        for j in range(len(table)):
+            table[j] = cc_none
+        for i in range(n):
+            a = ccs[i]
+            if a == cc_none:
+                continue
+            table[i * ramp_slots] = a
+            if not seqr.ramps[i]:
+                continue
+            for d in range(1, n + 1):  # next lock, around the end to this one again if need be
+                b = ccs[(i + d) % n]
+                if b != cc_none:
+                    break
+            span = d * ramp_slots
+            for k in range(1, span):
+                table[(i * ramp_slots + k) % (n * ramp_slots)] = a + (b - a) * k // span
+        self.seen_ccs[:] = ccs
+        self.seen_ramps[:] = seqr.ramps
+        self.seen_length = n
+
+    def update(self, seqr, chan, now):
+        """Queue the CC due now, if any and the rate cap allows, on chan (1-16).
+        Call after seqr.update(), before midi_out.flush(). Returns True if one was queued"""
+        if not seqr.playing or seqr.i < 0:
+            self.last_pos = -1
+            return False
+        if seqr.ccs != self.seen_ccs or seqr.ramps != self.seen_ramps or seqr.length != self.seen_length:
+            self.render(seqr)
+        if seqr.tempo_centi != self.tempo_centi or seqr.ticks_per_step != self.ticks_per_step:
+            self.tempo_centi = seqr.tempo_centi
+            self.ticks_per_step = seqr.ticks_per_step
+            steps_per_beat = max(ticks_per_quarter // seqr.ticks_per_step, 1)  # slower than 1/4 counts as 1/4
+            self.min_interval_millis = cc_interval_millis(seqr.tempo_centi, share_percent=self.share_percent,
+                                                          steps_per_beat=steps_per_beat)
+        slot = (now - seqr.last_beat_millis) * ramp_slots // max(seqr.beat_millis, 1)
+        first = seqr.i * ramp_slots
+        pos = first + min(max(slot, 0), ramp_slots - 1)
+        if pos != self.last_pos:
+            # latest value since last pass, never skipping a step's lock on its first slot
+            start = self.last_pos + 1 if first <= self.last_pos < pos else first
+            for j in range(start, pos + 1):
+                v = self.table[j]
+                if v != cc_none:
+                    self.pending = v
+            self.last_pos = pos
+        if self.pending == cc_none or now - self.last_sent_millis < self.min_interval_millis:
+            return False
+        v = self.pending
+        self.pending = cc_none
+        if v == self.last_value:
+            return False
+        self.midi_out.send(0xB0 | (chan-1), self.cc_num, v)
+        self.last_value = v
+        self.last_sent_millis = now
+        self.sent += 1
+        return True
@@ -9,6 +9,8 @@ import vectorio
 from adafruit_display_text import bitmap_label as label
 from adafruit_bitmap_font import bitmap_font
 
+from sequencer_glyphs import step_sheets, text_palette, octave_texts
+
 uidebug = False
 
 four_per_line = False  # normally we do all 8 steps in one line
@@ -42,12 +44,20 @@ else:
     edit_text_offset = (3,22)
 
 class SequencerDisplay(displayio.Group):
-    def __init__(self, sequencer):
+    def __init__(self, sequencer, lazy=False):
         super().__init__(x=0,y=0,scale=1)
         self.seq = sequencer
-        self.setup()
+        self.building = self.setup()
+        if not lazy:
+            while not self.build_more(): pass
+
+    def build_more(self):
+        """Build the next piece of the display (a step's labels), returns True when all built"""
+        if self.building and next(self.building, True):
+            self.building = None
+        return self.building is None
 
-    def setup(self):
+    def setup(self):  # a generator, yields after each piece, see build_more()
         gate_pal = displayio.Palette(1)
         gate_pal[0] = 0xffffff
         self.notegroup = displayio.Group()
@@ -61,13 +71,21 @@ class SequencerDisplay(displayio.Group):
         font = bitmap_font.load_font("helvB12.pcf")
         #font = terminalio.FONT
         font2 = terminalio.FONT
-        for (x,y) in step_text_pos:
-            self.notegroup.append( label.Label(font, text="A#", x=x, y=y, line_spacing=0.65))
-            self.octgroup.append( label.Label(font2, text="0", x=x+oct_text_offset[0], y=y+oct_text_offset[1]))
-            self.editgroup.append( label.Label(font2, text="*", x=x+edit_text_offset[0], y=y+edit_text_offset[1]))
+        yield
+        # step cells are tiles from sheets of every note name, octave & edit marker, rendered once
+        (note_sheet, small_sheet) = step_sheets(font, font2)
+        text_pal = text_palette()
+        self.step_tiles = bytearray(b"\xff" * 3 * len(step_text_pos))  # note, octave, edit tile of each step
+        blank = len(octave_texts)  # first edit marker
+        yield
+        for (x,y) in step_text_pos[:self.seq.step_count]:  # no cells past num_steps
+            self.notegroup.append( note_sheet.tile_grid(text_pal, x, y))
+            self.octgroup.append( small_sheet.tile_grid(text_pal, x+oct_text_offset[0], y+oct_text_offset[1]))
+            self.editgroup.append( small_sheet.tile_grid(text_pal, x+edit_text_offset[0], y+edit_text_offset[1], blank))
             self.gategroup.append( vectorio.Rectangle(pixel_shader=gate_pal,
                                                       width=gate_bar_width, height=gate_bar_height,
                                                       x=x+gate_bar_offset[0], y=y+gate_bar_offset[1]))
+            yield
 
         self.seqno_text = label.Label(font2, text="seqno", x=seqno_text_pos[0], y=seqno_text_pos[1])
         self.bpm_text = label.Label(font2, text="bpm:", x=bpm_text_pos[0], y=bpm_text_pos[1])
@@ -87,15 +105,21 @@ class SequencerDisplay(displayio.Group):
             step = self.seq.i
             n,v,gate,on = self.seq.steps[step]
         if uidebug: print("udpate_disp_step:", step,n,v,gate,on )
-        (notename,octave) = self.seq.notenum_to_noteoct(n)
-        notestr = notename
-        octstr = str(octave)
-        editstr = "^" if selected else '*' if not on else ' '
-        if notestr != self.notegroup[step].text:
-            self.notegroup[step].text = notestr
-        if octstr != self.octgroup[step].text:
-            self.octgroup[step].text = octstr
-        self.editgroup[step].text = editstr
+        # just tile index changes, and only of tiles that changed
+        tiles = self.step_tiles
+        j = step * 3
+        tile = n % 12
+        if tile != tiles[j]:
+            tiles[j] = tile
+            self.notegroup[step][0] = tile
+        tile = n // 12  # octave
+        if tile != tiles[j+1]:
+            tiles[j+1] = tile
+            self.octgroup[step][0] = tile
+        tile = len(octave_texts) + (2 if selected else 1 if not on else 0)  # edit marker
+        if tile != tiles[j+2]:
+            tiles[j+2] = tile
+            self.editgroup[step][0] = tile
         self.gategroup[step].width = 1 + gate * gate_bar_width // 16
 
     def update_ui_steps(self):
@@ -104,7 +128,11 @@ class SequencerDisplay(displayio.Group):
             self.update_ui_step(i, n, v, gate, on)
 
     def update_ui_bpm(self):
-        self.bpm_val.text = "%d" % self.seq.tempo  # just update the part that changes
+        tempo_centi = self.seq.tempo_centi  # show what's stored, 1 decimal if not whole BPM
+        if tempo_centi % 100 == 0:
+            self.bpm_val.text = "%d" % (tempo_centi // 100)  # just update the part that changes
+        else:
+            self.bpm_val.text = "%d.%d" % (tempo_centi // 100, (tempo_centi % 100) // 10)
 
     def update_ui_playing(self):
         self.play_text.text = " >" if self.seq.playing else "||"
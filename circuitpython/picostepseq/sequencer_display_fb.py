@@ -0,0 +1,215 @@
+# sequencer_display_fb.py -- picostepseq display drawn straight into an SSD1306 framebuffer
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# A lighter alternative to sequencer_display.py: no displayio, no fonts to
+# load. The 128x64 screen is a 1-bit bytearray laid out like the SSD1306's
+# own memory, 8 pages of 8-pixel-tall columns, one byte per column. Everything
+# is drawn on page boundaries with a built-in 5x7 font, so a character is 5
+# byte writes. Only bytes that actually change mark their page dirty, and
+# flush() sends just the dirty columns of each page, at most max_bytes per
+# call, so the main loop can send a piece in each gap between sequencer
+# ticks instead of a whole frame at once.
+#
+# Screen layout, by page (8 pixel rows each):
+#   0     gate bars                 1-2  note names, double height
+#   3     octaves                   4    edit markers
+#   5     seqno & messages          7    bpm, transpose, play state
+
+from sequencer import note_names
+
+dw, dh = 128, 64
+num_pages = dh // 8
+oled_address = 0x3C
+
+# SSD1306 setup for 128x64, horizontal addressing so data fills a column range of a page
+oled_init_cmds = (0xAE, 0xD5, 0x80, 0xA8, dh - 1, 0xD3, 0x00, 0x40, 0x8D, 0x14, 0x20, 0x00,
+                  0xA1, 0xC8, 0xDA, 0x12, 0x81, 0xCF, 0xD9, 0xF1, 0xDB, 0x40, 0xA4, 0xA6, 0xAF)
+CTRL_CMD = 0x00
+CTRL_DATA = 0x40
+transfer_overhead = 7 + 1 + 2  # address commands, data control byte, I2C address byte of each write
+
+# 5x7 font, ASCII 32-126, 5 column bytes per char, bit 0 at top
+char_width = 6  # 5 columns and a space
+font5x7 = (
+    b"\x00\x00\x00\x00\x00\x00\x00\x5f\x00\x00\x00\x07\x00\x07\x00\x14\x7f\x14\x7f\x14"
+    b"\x24\x2a\x7f\x2a\x12\x23\x13\x08\x64\x62\x36\x49\x55\x22\x50\x00\x05\x03\x00\x00"
+    b"\x00\x1c\x22\x41\x00\x00\x41\x22\x1c\x00\x14\x08\x3e\x08\x14\x08\x08\x3e\x08\x08"
+    b"\x00\x50\x30\x00\x00\x08\x08\x08\x08\x08\x00\x60\x60\x00\x00\x20\x10\x08\x04\x02"
+    b"\x3e\x51\x49\x45\x3e\x00\x42\x7f\x40\x00\x42\x61\x51\x49\x46\x21\x41\x45\x4b\x31"
+    b"\x18\x14\x12\x7f\x10\x27\x45\x45\x45\x39\x3c\x4a\x49\x49\x30\x01\x71\x09\x05\x03"
+    b"\x36\x49\x49\x49\x36\x06\x49\x49\x29\x1e\x00\x36\x36\x00\x00\x00\x56\x36\x00\x00"
+    b"\x08\x14\x22\x41\x00\x14\x14\x14\x14\x14\x00\x41\x22\x14\x08\x02\x01\x51\x09\x06"
+    b"\x32\x49\x79\x41\x3e\x7e\x11\x11\x11\x7e\x7f\x49\x49\x49\x36\x3e\x41\x41\x41\x22"
+    b"\x7f\x41\x41\x22\x1c\x7f\x49\x49\x49\x41\x7f\x09\x09\x09\x01\x3e\x41\x49\x49\x7a"
+    b"\x7f\x08\x08\x08\x7f\x00\x41\x7f\x41\x00\x20\x40\x41\x3f\x01\x7f\x08\x14\x22\x41"
+    b"\x7f\x40\x40\x40\x40\x7f\x02\x0c\x02\x7f\x7f\x04\x08\x10\x7f\x3e\x41\x41\x41\x3e"
+    b"\x7f\x09\x09\x09\x06\x3e\x41\x51\x21\x5e\x7f\x09\x19\x29\x46\x46\x49\x49\x49\x31"
+    b"\x01\x01\x7f\x01\x01\x3f\x40\x40\x40\x3f\x1f\x20\x40\x20\x1f\x3f\x40\x38\x40\x3f"
+    b"\x63\x14\x08\x14\x63\x07\x08\x70\x08\x07\x61\x51\x49\x45\x43\x00\x7f\x41\x41\x00"
+    b"\x02\x04\x08\x10\x20\x00\x41\x41\x7f\x00\x04\x02\x01\x02\x04\x40\x40\x40\x40\x40"
+    b"\x00\x01\x02\x04\x00\x20\x54\x54\x54\x78\x7f\x48\x44\x44\x38\x38\x44\x44\x44\x20"
+    b"\x38\x44\x44\x48\x7f\x38\x54\x54\x54\x18\x08\x7e\x09\x01\x02\x0c\x52\x52\x52\x3e"
+    b"\x7f\x08\x04\x04\x78\x00\x44\x7d\x40\x00\x20\x40\x44\x3d\x00\x00\x7f\x10\x28\x44"
+    b"\x00\x41\x7f\x40\x00\x7c\x04\x18\x04\x78\x7c\x08\x04\x04\x78\x38\x44\x44\x44\x38"
+    b"\x7c\x14\x14\x14\x08\x08\x14\x14\x18\x7c\x7c\x08\x04\x04\x08\x48\x54\x54\x54\x20"
+    b"\x04\x3f\x44\x40\x20\x3c\x40\x40\x20\x7c\x1c\x20\x40\x20\x1c\x3c\x40\x30\x40\x3c"
+    b"\x44\x28\x10\x28\x44\x0c\x50\x50\x50\x3c\x44\x64\x54\x4c\x44\x00\x08\x36\x41\x00"
+    b"\x00\x00\x7f\x00\x00\x00\x41\x36\x08\x00\x08\x08\x2a\x1c\x08"
+)
+
+# a font column doubled in height: bit k becomes bits 2k and 2k+1
+tall_bits = [ sum((((b >> k) & 1) * 3) << (2 * k) for k in range(8)) for b in range(128) ]
+
+step_width = dw // 8
+(gate_page, note_page, oct_page, edit_page, seqno_page, status_page) = (0, 1, 3, 4, 5, 7)
+gate_bar_width = 14
+gate_bar_bits = 0x0F  # 4 pixels tall
+oct_x, edit_x = 3, 3  # within a step's cell
+seqno_chars = dw // char_width
+(bpm_text_x, bpm_val_x, trans_text_x, trans_val_x, play_x) = (0, 25, 55, 80, 110)
+octave_texts = tuple(str(o) for o in range(-2, 9))  # index == notenum // 12
+edit_markers = (" ", "*", "^")  # normal, muted, selected
+
+def bytes_for_millis(millis, i2c_freq=400_000):
+    """How many bytes I2C at i2c_freq can send in millis, 9 clocks a byte"""
+    return millis * i2c_freq // 9000
+
+class FramebufDisplay:
+    """Same update_ui_*() as SequencerDisplay, drawn into a framebuffer sent by flush()"""
+    def __init__(self, sequencer, i2c, address=oled_address):
+        self.seq = sequencer
+        self.i2c = i2c
+        self.address = address
+        # framebuffer starts at buf[1], so the byte before any run of columns
+        # can briefly be the data control byte and the run sent in one write
+        self.buf = bytearray(1 + num_pages * dw)
+        self.dirty_lo = bytearray(b"\x00" * num_pages)  # every column dirty, to clear the screen
+        self.dirty_hi = bytearray([dw - 1] * num_pages)
+        self.cmd = bytearray((CTRL_CMD, 0x21, 0, 0, 0x22, 0, 0))  # column & page range to write
+        self.step_cache = bytearray(b"\xff" * 3 * sequencer.step_count)  # note, gate, marker shown on each step
+        self.bytes_sent = 0  # all bytes written to the display, for measuring
+        while not i2c.try_lock():  # the display has this bus to itself, keep it
+            pass
+        i2c.writeto(address, bytes((CTRL_CMD,) + oled_init_cmds))
+
+    def put(self, page, x, b):
+        """Set column x of page to byte b, marking it dirty if it changed"""
+        i = 1 + page * dw + x
+        if self.buf[i] != b:
+            self.buf[i] = b
+            if x < self.dirty_lo[page]: self.dirty_lo[page] = x
+            if x > self.dirty_hi[page]: self.dirty_hi[page] = x
+
+    def text(self, x, page, s, nchars=0):
+        """Draw s at x on page, padded with blanks to nchars to cover what was there"""
+        for k in range(max(len(s), nchars)):
+            c = ord(s[k]) - 32 if k < len(s) else 0
+            if not 0 <= c < 95: c = ord("?") - 32
+            for j in range(5):
+                self.put(page, x, font5x7[c * 5 + j])
+                x += 1
+            self.put(page, x, 0)
+            x += 1
+
+    def text_tall(self, x, page, s, nchars=0):
+        """Draw s double height across page and page+1"""
+        for k in range(max(len(s), nchars)):
+            c = ord(s[k]) - 32 if k < len(s) else 0
+            for j in range(6):
+                b = tall_bits[font5x7[c * 5 + j]] if j < 5 else 0
+                self.put(page, x, b & 0xff)
+                self.put(page + 1, x, b >> 8)
+                x += 1
+
+    def is_dirty(self):
+        for page in range(num_pages):
+            if self.dirty_lo[page] <= self.dirty_hi[page]:
+                return True
+        return False
+
+    def flush(self, max_bytes=128):
+        """Send dirty columns to the display, at most max_bytes including each
+        transfer's overhead, returns bytes sent (0 when nothing's dirty)"""
+        sent = 0
+        for page in range(num_pages):
+            lo = self.dirty_lo[page]
+            hi = self.dirty_hi[page]
+            if lo > hi:
+                continue
+            n = min(hi - lo + 1, max_bytes - sent - transfer_overhead)
+            if n <= 0:
+                break
+            self.send(page, lo, n)
+            sent += n + transfer_overhead
+            if lo + n > hi:  # all of it
+                self.dirty_lo[page] = dw
+                self.dirty_hi[page] = 0
+            else:
+                self.dirty_lo[page] = lo + n
+        self.bytes_sent += sent
+        return sent
+
+    def send(self, page, x, n):
+        """Write n columns from x on page to the display"""
+        cmd = self.cmd
+        cmd[2] = x
+        cmd[3] = x + n - 1
+        cmd[5] = cmd[6] = page
+        self.i2c.writeto(self.address, cmd)
+        i = page * dw + x  # byte before the columns in buf
+        save = self.buf[i]
+        self.buf[i] = CTRL_DATA
+        self.i2c.writeto(self.address, self.buf, start=i, end=i + 1 + n)
+        self.buf[i] = save
+
+    def update_ui_step(self, step=None, n=0, v=127, gate=8, on=True, selected=False):
+        if step is None:  # get current value
+            step = self.seq.i
+            if step < 0:  # not played a step yet
+                return
+            n,v,gate,on = self.seq.steps[step]
+        marker = 2 if selected else 1 if not on else 0
+        cache = self.step_cache
+        j = step * 3
+        if cache[j] == n and cache[j+1] == gate and cache[j+2] == marker:
+            return
+        cache[j] = n
+        cache[j+1] = gate
+        cache[j+2] = marker
+        x = step * step_width
+        w = 1 + gate * gate_bar_width // 16
+        for k in range(gate_bar_width):
+            self.put(gate_page, x + k, gate_bar_bits if k < w else 0)
+        self.text_tall(x, note_page, note_names[n % 12], 2)
+        self.text(x + oct_x, oct_page, octave_texts[n // 12], 2)
+        self.text(x + edit_x, edit_page, edit_markers[marker], 1)
+
+    def update_ui_steps(self):
+        for i in range(self.seq.step_count):
+            (n,v,gate,on) = self.seq.steps[i]
+            self.update_ui_step(i, n, v, gate, on)
+
+    def update_ui_bpm(self):
+        tempo_centi = self.seq.tempo_centi
+        if tempo_centi % 100 == 0:
+            self.text(bpm_val_x, status_page, "%d" % (tempo_centi // 100), 5)
+        else:
+            self.text(bpm_val_x, status_page, "%d.%d" % (tempo_centi // 100, (tempo_centi % 100) // 10), 5)
+
+    def update_ui_playing(self):
+        self.text(play_x, status_page, " >" if self.seq.playing else "||", 2)
+
+    def update_ui_transpose(self):
+        self.text(trans_val_x, status_page, "%+2d" % self.seq.transpose, 3)
+
+    def update_ui_seqno(self, msg=None):
+        self.text(0, seqno_page, msg or f"seq: {self.seq.seqno+1}", seqno_chars)
+
+    def update_ui_all(self):
+        self.update_ui_seqno()
+        self.text(bpm_text_x, status_page, "bpm:")
+        self.text(trans_text_x, status_page, "trs:")
+        self.update_ui_bpm()
+        self.update_ui_playing()
+        self.update_ui_transpose()
+        self.update_ui_steps()
@@ -9,6 +9,8 @@ import vectorio
 from adafruit_display_text import bitmap_label as label
 from adafruit_bitmap_font import bitmap_font
 
+from sequencer_glyphs import step_sheets, text_palette, octave_texts
+
 from sequencer_display import SequencerDisplay
 
 uidebug = False
@@ -28,10 +30,10 @@ gate_bar_width, gate_bar_height = (14,4)
 edit_text_offset = (3,20)
 
 class SequencerDisplayMacroPad(SequencerDisplay):
-    def __init__(self, sequencer):
-        super().__init__(sequencer)
+    def __init__(self, sequencer, lazy=False):
+        super().__init__(sequencer, lazy)
 
-    def setup(self): # called by superclass init
+    def setup(self): # called by superclass init, yields after each piece
         gate_pal = displayio.Palette(1)
         gate_pal[0] = 0xffffff
         self.notegroup = displayio.Group()
@@ -45,13 +47,21 @@ class SequencerDisplayMacroPad(SequencerDisplay):
         font = bitmap_font.load_font("helvB12.pcf")
         #font = terminalio.FONT
         font2 = terminalio.FONT
-        for (x,y) in step_text_pos:
-            self.notegroup.append( label.Label(font, text="A#", x=x, y=y, line_spacing=0.65))
-            self.octgroup.append( label.Label(font2, text="0", x=x+oct_text_offset[0], y=y+oct_text_offset[1]))
-            self.editgroup.append( label.Label(font2, text="*", x=x+edit_text_offset[0], y=y+edit_text_offset[1]))
+        yield
+        # step cells are tiles from sheets of every note name, octave & edit marker, rendered once
+        (note_sheet, small_sheet) = step_sheets(font, font2)
+        text_pal = text_palette()
+        self.step_tiles = bytearray(b"\xff" * 3 * len(step_text_pos))  # note, octave, edit tile of each step
+        blank = len(octave_texts)  # first edit marker
+        yield
+        for (x,y) in step_text_pos[:self.seq.step_count]:  # no cells past num_steps
+            self.notegroup.append( note_sheet.tile_grid(text_pal, x, y))
+            self.octgroup.append( small_sheet.tile_grid(text_pal, x+oct_text_offset[0], y+oct_text_offset[1]))
+            self.editgroup.append( small_sheet.tile_grid(text_pal, x+edit_text_offset[0], y+edit_text_offset[1], blank))
             self.gategroup.append( vectorio.Rectangle(pixel_shader=gate_pal,
                                                       width=gate_bar_width, height=gate_bar_height,
                                                       x=x+gate_bar_offset[0], y=y+gate_bar_offset[1]))
+            yield
 
         self.seqno_text = label.Label(font2, text="seqno", x=seqno_text_pos[0], y=seqno_text_pos[1])
         self.bpm_text = label.Label(font2, text="bpm:", x=bpm_text_pos[0], y=bpm_text_pos[1])
@@ -65,19 +75,3 @@ class SequencerDisplayMacroPad(SequencerDisplay):
         self.append(self.transpose_text)
         self.append(self.transpose_val)
         self.append(self.seqno_text)
-
-    def update_ui_step(self, step=None, n=0, v=127, gate=8, on=True, selected=False):
-        if step is None:  # get current value
-            step = self.seq.i
-            n,v,gate,on = self.seq.steps[step]
-        if uidebug: print("udpate_disp_step:", step,n,v,gate,on )
-        (notename,octave) = self.seq.notenum_to_noteoct(n)
-        notestr = notename
-        octstr = str(octave)
-        editstr = "^" if selected else '*' if not on else ' '
-        if notestr != self.notegroup[step].text:
-            self.notegroup[step].text = notestr
-        if octstr != self.octgroup[step].text:
-            self.octgroup[step].text = octstr
-        self.editgroup[step].text = editstr
-        self.gategroup[step].width = 1 + gate * gate_bar_width // 16
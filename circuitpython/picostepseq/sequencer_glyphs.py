@@ -0,0 +1,70 @@
+# sequencer_glyphs.py -- picostepseq step labels from pre-rendered glyph tiles
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Every text a step cell can show (12 note names, octaves -2 to 8, and the
+# edit markers) is rendered once at boot into a tile sheet Bitmap. Each step's
+# note, octave and marker is then a one-tile TileGrid, and changing what it
+# shows is just setting its tile index: no glyph rendering, no allocation.
+
+import displayio
+import bitmaptools
+
+from sequencer import note_names
+
+octave_texts = tuple(str(o) for o in range(-2, 9))  # tile index == notenum // 12
+edit_texts = (" ", "*", "^")  # normal, muted, selected
+
+class GlyphSheet:
+    """Texts rendered in a font into one tile sheet Bitmap, one tile per text, in order"""
+    def __init__(self, font, texts):
+        glyphs = [ [ font.get_glyph(ord(c)) for c in text ] for text in texts ]
+        ascent = descent = 0
+        for g in [ g for gs in glyphs for g in gs ] + [ font.get_glyph(ord("M")) ]:
+            if g:
+                ascent = max(ascent, g.height + g.dy)
+                descent = max(descent, -g.dy)
+        self.ascent = ascent
+        self.tile_width = max(sum(g.shift_x for g in gs if g) for gs in glyphs)
+        self.tile_height = ascent + descent
+        self.bitmap = displayio.Bitmap(self.tile_width * len(texts), self.tile_height, 2)
+        for (k, gs) in enumerate(glyphs):
+            x = k * self.tile_width
+            for g in gs:
+                if g:
+                    self._blit_glyph(g, x, k)
+                    x += g.shift_x
+
+    def _blit_glyph(self, g, x, k):
+        """Copy glyph g's pixels into tile k at x, clipped to the tile"""
+        (sx, sy) = (g.tile_index * g.width, 0)  # glyph's place in its font's bitmap
+        (dx, dy) = (x + g.dx, self.ascent - g.height - g.dy)
+        (w, h) = (g.width, g.height)
+        left = k * self.tile_width
+        if dx < left:
+            (sx, w, dx) = (sx + left - dx, w - (left - dx), left)
+        if dy < 0:
+            (sy, h, dy) = (sy - dy, h + dy, 0)
+        w = min(w, left + self.tile_width - dx)
+        h = min(h, self.tile_height - dy)
+        if w > 0 and h > 0:
+            bitmaptools.blit(self.bitmap, g.bitmap, dx, dy, x1=sx, y1=sy, x2=sx + w, y2=sy + h,
+                             skip_source_index=0)
+
+    def tile_grid(self, palette, x, y, tile=0):
+        """A one-tile TileGrid showing tile, placed where a Label at (x,y) would put its text"""
+        return displayio.TileGrid(self.bitmap, pixel_shader=palette, width=1, height=1,
+                                  tile_width=self.tile_width, tile_height=self.tile_height,
+                                  default_tile=tile, x=x, y=y - self.ascent // 2)
+
+def text_palette():
+    """White glyphs on see-through, like a Label"""
+    pal = displayio.Palette(2)
+    pal[0] = 0x000000
+    pal[1] = 0xffffff
+    pal.make_transparent(0)
+    return pal
+
+def step_sheets(note_font, small_font):
+    """Tile sheets for the step cells: (notes, octaves & edit markers).
+    Octave n//12 is tile n//12 of the small sheet, edit marker i is tile len(octave_texts)+i"""
+    return (GlyphSheet(note_font, note_names), GlyphSheet(small_font, octave_texts + edit_texts))
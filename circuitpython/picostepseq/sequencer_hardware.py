@@ -8,8 +8,6 @@ import busio
 import pwmio
 import rotaryio
 import keypad
-import displayio
-import adafruit_displayio_ssd1306
 
 dw,dh = 128,64
 
@@ -42,15 +40,24 @@ class Hardware():
         self.encoder = rotaryio.IncrementalEncoder(encoderA_pin, encoderB_pin)
         self.encoder_switch = keypad.Keys((encoderSW_pin,), value_when_pressed=False, pull=True)
 
-        # DISPLAY
-        oled_i2c = busio.I2C( scl=oled_scl_pin, sda=oled_sda_pin, frequency=400_000 )
-        display_bus = displayio.I2CDisplay(oled_i2c, device_address=0x3C)  # or 0x3D depending on display
-        self.display = adafruit_displayio_ssd1306.SSD1306(display_bus, width=dw, height=dh)
+        # DISPLAY, made by setup_display() once MIDI & the sequencer are going
+        self.display = None
 
         # # uart midi setup
         #midi_timeout = 0.01
         self.midi_uart = busio.UART(tx=midi_tx_pin, rx=midi_rx_pin, baudrate=31250) # timeout=midi_timeout)
 
+    def setup_display(self, framebuf=False):
+        import displayio
+        displayio.release_displays()
+        oled_i2c = busio.I2C( scl=oled_scl_pin, sda=oled_sda_pin, frequency=400_000 )
+        if framebuf:  # drawn & sent by sequencer_display_fb.py instead of displayio
+            self.display_i2c = oled_i2c
+            return
+        import adafruit_displayio_ssd1306
+        display_bus = displayio.I2CDisplay(oled_i2c, device_address=0x3C)  # or 0x3D depending on display
+        self.display = adafruit_displayio_ssd1306.SSD1306(display_bus, width=dw, height=dh)
+
     # set LED brightness to value from 0-255
     def led_set(self,i,v):
         self.leds[i].duty_cycle = v * 256  # duty_cycle 0-65535
@@ -62,3 +69,9 @@ class Hardware():
     # refresh all LEDs (if meaningful)
     def leds_show(self):
         pass
+
+    # set brightness 0-255 of LEDs whose bit is set in 'changed', from bytearray 'vals'
+    def leds_write(self, vals, changed):
+        for i in range(len(self.leds)):
+            if changed & (1 << i):
+                self.leds[i].duty_cycle = vals[i] * 256
@@ -32,13 +32,16 @@ class Hardware():
         self.encoder = rotaryio.IncrementalEncoder(encoderB_pin, encoderA_pin)  # yes, reversed
         self.encoder_switch = keypad.Keys((encoderSW_pin,), value_when_pressed=False, pull=True)
 
-        # DISPLAY
-        self.display = board.DISPLAY
-        self.display.rotation = 90
+        # DISPLAY, set up by setup_display() once MIDI & the sequencer are going
+        self.display = None
 
         # uart midi setup
         self.midi_uart = busio.UART(tx=midi_tx_pin, rx=midi_rx_pin, baudrate=31250) # timeout=midi_timeout)
 
+    def setup_display(self):
+        self.display = board.DISPLAY
+        self.display.rotation = 90
+
     # set LED brightness to value from 0-255
     def led_set(self,i,v):
         #print("i",i)
@@ -54,3 +57,11 @@ class Hardware():
     # refresh all LEDs (if meaningful)
     def leds_show(self):
         self.leds.show()
+
+    # set brightness 0-255 of LEDs whose bit is set in 'changed', from bytearray 'vals'
+    # then show, since we only get called when a frame changed
+    def leds_write(self, vals, changed):
+        for i in range(len(self.step_to_key_pos)):
+            if changed & (1 << i):
+                self.leds[ self.step_to_key_pos[i] ] = (vals[i], 0,0)
+        self.leds.show()
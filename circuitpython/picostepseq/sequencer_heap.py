@@ -0,0 +1,78 @@
+# sequencer_heap.py -- picostepseq garbage collection, timed and fitted between steps
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# A gc.collect() takes milliseconds on a Pico, and one that lands on a step
+# makes that step late. HeapMonitor collects once per step, right after it
+# fires, when the sequencer says (idle_millis()) nothing else is due for longer
+# than the worst collection so far. While stopped it collects every so often.
+# If free heap gets low it collects anyway, and counts that as forced.
+#
+# It keeps the numbers to watch for regressions: worst & last pause, lowest
+# free heap seen before a collection (the headroom), and how fast the main
+# loop allocates. report() prints them, code.py does that on pause.
+
+import gc
+from time import monotonic_ns
+
+from sequencer import ticks_ms
+
+class HeapMonitor:
+    """Runs gc.collect() in the gaps between steps and keeps stats on it"""
+    def __init__(self, min_idle_millis=5, idle_collect_millis=250, low_free=8*1024, gc_module=gc):
+        self.gc = gc_module
+        self.min_idle_millis = min_idle_millis  # collect only if nothing's due for this long, or the worst pause
+        self.idle_collect_millis = idle_collect_millis  # how often to collect while stopped
+        self.low_free = low_free  # collect right away if free heap gets this low
+        self.last_step_millis = -1  # seqr.last_beat_millis of the step collected after
+        self.last_collect_millis = 0
+        self.free_after = 0  # free heap after the last collection
+        self.collections = 0
+        self.forced = 0  # collections done because the heap got low, not in an idle gap
+        self.last_pause_usecs = 0
+        self.worst_pause_usecs = 0
+        self.total_pause_usecs = 0
+        self.min_free = -1  # lowest free heap seen before a collection, -1 == none yet
+        self.alloc_rate = 0  # bytes/sec allocated between the last two collections
+
+    def update(self, seqr, now=None):
+        """Collect if a step fired since last time and the next thing due is far enough off,
+        call each main loop pass. Returns True if it collected"""
+        now = ticks_ms() if now is None else now
+        free = self.gc.mem_free()
+        if free < self.low_free:
+            self.forced += 1
+        elif seqr.playing:
+            if seqr.last_beat_millis == self.last_step_millis:
+                return False  # already did this step
+            if seqr.idle_millis(now) <= max(self.min_idle_millis, self.worst_pause_usecs // 1000 + 1):
+                return False  # maybe next pass, once this step's arp notes & note offs are done
+        elif (now - self.last_collect_millis < self.idle_collect_millis or
+              seqr.idle_millis(now) <= self.min_idle_millis):
+            return False
+        self.last_step_millis = seqr.last_beat_millis
+        self.collect(now, free)
+        return True
+
+    def collect(self, now, free):
+        """gc.collect() now, timed, free is gc.mem_free() just before"""
+        st = monotonic_ns()
+        self.gc.collect()
+        usecs = (monotonic_ns() - st) // 1000
+        if self.collections:
+            dt = now - self.last_collect_millis
+            if dt > 0:
+                self.alloc_rate = max(self.free_after - free, 0) * 1000 // dt
+        if self.min_free < 0 or free < self.min_free:
+            self.min_free = free
+        self.free_after = self.gc.mem_free()
+        self.last_collect_millis = now
+        self.collections += 1
+        self.last_pause_usecs = usecs
+        self.total_pause_usecs += usecs
+        self.worst_pause_usecs = max(self.worst_pause_usecs, usecs)
+
+    def report(self):
+        avg = self.total_pause_usecs // self.collections if self.collections else 0
+        print("heap: %d collections (%d forced), pause worst %d us, avg %d us, free %d after, %d lowest, %d bytes/s" %
+              (self.collections, self.forced, self.worst_pause_usecs, avg,
+               self.free_after, self.min_free, self.alloc_rate))
@@ -0,0 +1,280 @@
+# sequencer_input.py -- picostepseq key & encoder gesture handling
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Turns raw step key & encoder events into UI commands:
+#
+# - encoder tap                        -- CMD_PLAY_TOGGLE
+# - encoder turn                       -- CMD_TRANSPOSE
+# - encoder push + turn                -- CMD_TEMPO
+# - step key press / release           -- CMD_KEY_DOWN / CMD_KEY_UP (mute or preview)
+# - step key hold + encoder turn       -- CMD_EDIT_NOTE, or CMD_EDIT_VEL etc if picked
+# - step key hold + encoder tap        -- CMD_EDIT_FIELD, pick next step param to edit
+# - step key hold + encoder push+turn  -- CMD_EDIT_GATE
+# - encoder push + step key tap        -- CMD_LOAD
+# - encoder push + step key hold 1 sec -- CMD_SAVE_ARMED, then CMD_SAVE on release
+# - encoder hold 1 sec                 -- CMD_TAP_MODE, then encoder taps are CMD_TAP_TEMPO
+#
+# Commands go into a preallocated CommandQueue for code.py to act on.
+# Nothing here touches hardware except poll(), so it can be driven on the
+# host with scripted events.
+
+import array
+
+from sequencer import ticks_ms
+from sequencer_recorder import EV_KEY, EV_ENC_SW, EV_ENC_TURN
+
+# commands, 0 == no command
+CMD_NONE = 0
+CMD_PLAY_TOGGLE = 1  # a = unused
+CMD_TRANSPOSE = 2    # a = delta
+CMD_TEMPO = 3        # a = delta
+CMD_KEY_DOWN = 4     # a = step
+CMD_KEY_UP = 5       # a = step, b = was step edited while held
+CMD_EDIT_FIELD = 6   # a = step, b = index into edit_fields
+CMD_EDIT_GATE = 7    # a = step, b = delta
+CMD_LOAD = 8         # a = sequence slot
+CMD_SAVE = 9         # a = sequence slot
+CMD_SAVE_ARMED = 10  # a = sequence slot
+CMD_TAP_MODE = 11    # a = entering (1) or leaving (0) tap tempo mode
+CMD_TAP_TEMPO = 12   # a = tapped tempo in 1/100ths of a BPM
+CMD_EDIT_NOTE = 16   # a = step, b = delta. CMD_EDIT_NOTE + i edits edit_fields[i]
+
+edit_fields = ("note", "vel", "prob", "cond", "chord", "arp", "cc", "ramp", "len", "rate", "chan", "undo")  # len, rate & chan are the sequence's
+accel_fields = ("note", "vel", "prob")  # wide-range edit_fields, encoder turns get accelerated
+
+tap_millis = 300    # encoder presses shorter than this are taps
+save_millis = 1000  # step key held this long with encoder pushed == save
+tap_mode_millis = 1000  # encoder held alone this long == tap tempo mode
+tap_timeout_millis = 2000  # no taps for this long ends tap tempo mode
+encoder_frame_millis = 30  # encoder detents within this long become one turn
+encoder_accel_max = 4  # most a fast turn's detents get multiplied by
+tempo_min_centi = 20_00  # tempo range, in 1/100ths of a BPM
+tempo_max_centi = 300_00
+
+def encoder_accel(delta):
+    """Scale a frame's worth of encoder detents by how fast they came in.
+    One detent per frame is one step, spinning fast moves up to 4x per detent"""
+    return delta * min(abs(delta), encoder_accel_max)
+
+def command_in_range(cmd, a, num_steps, num_slots):
+    """Is the step (or sequence slot, for load & save) command arg a one there is?
+    Step keys past num_steps have no step, but still pick sequence slots"""
+    if cmd == CMD_LOAD or cmd == CMD_SAVE or cmd == CMD_SAVE_ARMED:
+        return a < num_slots
+    if cmd in (CMD_KEY_DOWN, CMD_KEY_UP, CMD_EDIT_FIELD, CMD_EDIT_GATE) or cmd >= CMD_EDIT_NOTE:
+        return a < num_steps
+    return True
+
+class CommandQueue:
+    """Small preallocated FIFO of commands, each a cmd plus two int args.
+    get() returns the cmd and leaves its args in .a and .b, so no tuple is made"""
+    def __init__(self, size=16):
+        self.size = size
+        self.cmds = bytearray(size)
+        self.args_a = array.array('h', [0] * size)
+        self.args_b = array.array('h', [0] * size)
+        self.head = 0  # where next put() goes
+        self.count = 0
+        self.dropped = 0  # commands lost because queue was full
+        self.a = 0
+        self.b = 0
+
+    def put(self, cmd, a=0, b=0):
+        if self.count == self.size:
+            self.dropped += 1
+            return
+        i = self.head
+        self.cmds[i] = cmd
+        self.args_a[i] = a
+        self.args_b[i] = b
+        self.head = (i + 1) % self.size
+        self.count += 1
+
+    def get(self):
+        """Return oldest command, or CMD_NONE if empty. Its args are in .a and .b"""
+        if self.count == 0:
+            return CMD_NONE
+        i = (self.head - self.count) % self.size
+        self.count -= 1
+        self.a = self.args_a[i]
+        self.b = self.args_b[i]
+        return self.cmds[i]
+
+class TapTempo:
+    """Turns tap times into a tempo, averaging the tap intervals but
+    leaving out ones too far (more than 'tolerance' percent) from the median"""
+    def __init__(self, max_taps=8, tolerance=25):
+        self.intervals = array.array('l', [0] * max_taps)  # millis between taps, ring buffer
+        self.tolerance = tolerance
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.last_tap_millis = 0
+
+    def tap(self, now):
+        """Add a tap. Returns tempo in 1/100ths of a BPM, kept within tempo_min_centi
+        & tempo_max_centi, or 0 if not enough taps yet"""
+        if self.last_tap_millis:
+            interval = now - self.last_tap_millis
+            if interval > tap_timeout_millis:  # too long ago, start over
+                self.head = 0
+                self.count = 0
+            elif interval > 0:
+                self.intervals[self.head] = interval
+                self.head = (self.head + 1) % len(self.intervals)
+                self.count = min(self.count + 1, len(self.intervals))
+        self.last_tap_millis = now
+        if self.count < 2:
+            return 0
+        median = sorted(self.intervals[:self.count])[self.count // 2]  # taps are rare, allocation is fine
+        total = 0
+        n = 0
+        for i in range(self.count):
+            interval = self.intervals[i]
+            if abs(interval - median) * 100 <= median * self.tolerance:
+                total += interval
+                n += 1
+        tempo_centi = (6_000_000 * n + total // 2) // total  # 60,000 millis/min * 100
+        return min(max(tempo_centi, tempo_min_centi), tempo_max_centi)
+
+class Gestures:
+    """State machine resolving key & encoder events into taps, holds and combos"""
+    def __init__(self, cmds, step_to_key_pos=None):
+        self.cmds = cmds  # CommandQueue to put commands in
+        self.step_to_key_pos = step_to_key_pos  # for poll(), maps step num to keypad key number
+        self.recorder = None  # optional EventRecorder, gets every raw event
+        self.encoder_push_millis = 0  # when was encoder pushed, 0 == no push
+        self.encoder_used = False  # was encoder turned or used in a combo while pushed
+        self.step_push = -1  # which step key is being held, -1 == none
+        self.step_push_millis = 0  # when was that step key pushed
+        self.step_edited = False  # was held step edited while held
+        self.save_armed = False  # has the held step been held long enough to save
+        self.edit_field = 0  # which of edit_fields encoder turns edit while step held
+        self.tap_mode = False  # are encoder taps setting tempo
+        self.tap_mode_millis = 0  # when tap mode was entered or last tapped
+        self.tap_tempo = TapTempo()
+        self.encoder_last = None  # last encoder position seen by poll()
+        self.encoder_accum = 0  # detents seen by poll() not yet turned into a command
+        self.encoder_frame_millis = 0  # when poll() last sent an encoder turn
+        self._key_event = None  # preallocated keypad.Event for poll()
+
+    def key(self, step, pressed, now):
+        """Handle step key press or release"""
+        if self.recorder: self.recorder.record(EV_KEY, step, pressed)
+        if pressed:
+            self.step_push = step
+            self.step_push_millis = now
+            self.step_edited = False
+            self.save_armed = False
+            if self.encoder_push_millis > 0:  # encoder pushed first, load/save combo
+                self.encoder_used = True
+            else:
+                self.cmds.put(CMD_KEY_DOWN, step)
+            return
+
+        if step != self.step_push:  # released a key that was overlapped by a newer one, just a tap
+            if self.encoder_push_millis == 0:
+                self.cmds.put(CMD_KEY_UP, step, False)
+            return
+
+        if self.encoder_push_millis > 0 and self.encoder_push_millis < self.step_push_millis:
+            if now - self.step_push_millis > save_millis:
+                self.cmds.put(CMD_SAVE, step)
+            else:
+                self.cmds.put(CMD_LOAD, step)
+        else:
+            self.cmds.put(CMD_KEY_UP, step, self.step_edited)
+        self.step_push = -1
+        self.step_push_millis = 0
+        self.step_edited = False
+        self.edit_field = 0  # back to editing notes
+
+    def encoder_switch(self, pressed, now):
+        """Handle encoder button press or release"""
+        if self.recorder: self.recorder.record(EV_ENC_SW, pressed)
+        if pressed:
+            self.encoder_push_millis = now
+            self.encoder_used = False
+            if self.tap_mode:
+                self.encoder_used = True  # a tempo tap, not a play/pause tap
+                self.tap_mode_millis = now
+                tempo_centi = self.tap_tempo.tap(now)
+                if tempo_centi:
+                    self.cmds.put(CMD_TAP_TEMPO, tempo_centi)
+            return
+        tap = (now - self.encoder_push_millis < tap_millis) and not self.encoder_used
+        if tap:
+            if self.step_push > -1:
+                self.edit_field = (self.edit_field + 1) % len(edit_fields)
+                self.cmds.put(CMD_EDIT_FIELD, self.step_push, self.edit_field)
+            else:
+                self.cmds.put(CMD_PLAY_TOGGLE)
+        self.encoder_push_millis = 0
+
+    def encoder_turn(self, delta, now):
+        """Handle encoder turn of 'delta' detents, from one UI frame.
+        Wide-range params (tempo, note, vel, prob) get accelerated, others move by detent"""
+        if self.recorder: self.recorder.record(EV_ENC_TURN, min(max(delta + 128, 0), 255))
+        step = self.step_push
+        if self.encoder_push_millis > 0:
+            self.encoder_used = True
+        if step > -1 and self.encoder_push_millis > 0:
+            self.cmds.put(CMD_EDIT_GATE, step, delta)
+            self.step_edited = True
+        elif step > -1:
+            if edit_fields[self.edit_field] in accel_fields:
+                delta = encoder_accel(delta)
+            self.cmds.put(CMD_EDIT_NOTE + self.edit_field, step, delta)
+            self.step_edited = True
+        elif self.encoder_push_millis > 0:
+            self.cmds.put(CMD_TEMPO, encoder_accel(delta))
+        else:
+            self.cmds.put(CMD_TRANSPOSE, delta)
+
+    def tick(self, now):
+        """Handle time-based gestures, call every loop"""
+        if (self.step_push > -1 and not self.save_armed and
+            0 < self.encoder_push_millis < self.step_push_millis and
+            now - self.step_push_millis > save_millis):
+            self.save_armed = True
+            self.cmds.put(CMD_SAVE_ARMED, self.step_push)
+
+        if (not self.tap_mode and self.step_push == -1 and not self.encoder_used and
+            self.encoder_push_millis > 0 and now - self.encoder_push_millis > tap_mode_millis):
+            self.tap_mode = True
+            self.encoder_used = True  # so its release isn't a play/pause tap
+            self.tap_mode_millis = now
+            self.tap_tempo.reset()
+            self.cmds.put(CMD_TAP_MODE, 1)
+        elif (self.tap_mode and self.encoder_push_millis == 0 and
+              now - self.tap_mode_millis > tap_timeout_millis):
+            self.tap_mode = False
+            self.cmds.put(CMD_TAP_MODE, 0)
+
+    def poll(self, hw, now=None):
+        """Drain all pending keypad & encoder events from hardware"""
+        if now is None:
+            now = ticks_ms()
+        if self._key_event is None:
+            import keypad
+            self._key_event = keypad.Event()
+        ev = self._key_event
+        while hw.encoder_switch.events.get_into(ev):
+            self.encoder_switch(ev.pressed, now)
+        position = hw.encoder.position
+        if self.encoder_last is None:
+            self.encoder_last = position
+        if position != self.encoder_last:
+            self.encoder_accum += position - self.encoder_last
+            self.encoder_last = position
+        # at most one encoder turn per frame, so one param change & display update per frame
+        if self.encoder_accum and now - self.encoder_frame_millis >= encoder_frame_millis:
+            self.encoder_turn(self.encoder_accum, now)
+            self.encoder_accum = 0
+            self.encoder_frame_millis = now
+        while hw.keys.events.get_into(ev):
+            if ev.key_number in self.step_to_key_pos:  # ignore undefined macropad keys
+                self.key(self.step_to_key_pos.index(ev.key_number), ev.pressed, now)
+        self.tick(now)
@@ -0,0 +1,36 @@
+# sequencer_leds.py -- picostepseq step LED engine
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+
+from sequencer import ticks_ms
+
+class LedEngine:
+    """Keeps step LED brightnesses in a local bytearray, fades them at a fixed
+    frame rate, and only sends the LEDs that changed to the hardware"""
+    def __init__(self, hw, num_leds, frame_millis=16):
+        self.hw = hw  # needs hw.leds_write(vals, changed) and hw.leds_fade_amount
+        self.vals = bytearray(num_leds)  # current brightness 0-255 of each LED
+        self.frame_millis = frame_millis  # fade frame time, 16 = ~60 fps
+        self.last_frame_millis = 0
+        self.pos_bright = 255  # UI: bright red = indicate sequence position
+        self.on_bright = 20    # UI: dim red = indicate mute/unmute state
+
+    def update(self, seqr, now=None):
+        """Compute a new frame if it's time, and write changed LEDs. Call every loop"""
+        if now is None:
+            now = ticks_ms()
+        if now - self.last_frame_millis < self.frame_millis:
+            return
+        self.last_frame_millis = now
+        fade = self.hw.leds_fade_amount
+        vals = self.vals
+        changed = 0  # bitmask of which LEDs changed this frame
+        for i in range(len(vals)):
+            if i == seqr.i:            cmax = self.pos_bright
+            elif seqr.steps[i][3]:     cmax = self.on_bright
+            else:                      cmax = 0  # UI: off = muted
+            c = max(vals[i] - fade, cmax)  # nice fade
+            if c != vals[i]:
+                vals[i] = c
+                changed |= 1 << i
+        if changed:
+            self.hw.leds_write(vals, changed)
@@ -0,0 +1,149 @@
+# sequencer_midi.py -- picostepseq MIDI output batching
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Serial (DIN) MIDI ports get the same messages in fewer bytes: note offs
+# are sent as note on with velocity 0, so a step's note offs and note ons all
+# share one status byte, and running status leaves out repeated status bytes,
+# so a note on or off is 2 bytes instead of 3. Nothing else writes to the
+# serial port, so running status carries over from one flush() to the next,
+# but the status byte is sent again every status_refresh writes, so a receiver
+# that missed a byte or was plugged in mid-stream gets back in step. USB MIDI
+# packs every message in its own 4-byte packet anyway, so it gets them as is.
+#
+# Every note on sent is kept in a 128-bit set per channel, so a note off for
+# a note that isn't on (a muted step, a second off) is never sent, release()
+# turns a note off on whatever channel it went out on, and all_notes_off()
+# sends exactly the note offs needed to leave nothing hanging.
+
+_no_notes = bytes(16)
+
+class MidiOut:
+    """Collects outgoing MIDI messages into one preallocated buffer,
+    so a step's chord goes out as a single write() per port on flush()"""
+    def __init__(self, ports, buf_size=48, serial_ports=(), status_refresh=32):
+        self.ports = ports  # anything with a .write(buf), e.g. usb_midi port or busio.UART
+        self.serial_ports = serial_ports  # get running status & velocity 0 note offs, e.g. busio.UART
+        self.buf = bytearray(buf_size)
+        self.buf_view = memoryview(self.buf)
+        self.buf_len = 0
+        self.serial_buf = bytearray(buf_size)
+        self.serial_view = memoryview(self.serial_buf)
+        self.running_status = 0  # last status byte sent to serial_ports, 0 == send it next time
+        self.status_refresh = status_refresh
+        self.serial_writes = 0
+        self.msg_count = 0  # total messages sent, for benchmarking
+        self.byte_count = 0  # total bytes written to each of ports
+        self.serial_byte_count = 0  # total bytes written to each of serial_ports
+        self.active = bytearray(16 * 16)  # bit per note per channel, notes on & not off yet
+        self.active_chans = 0  # bit per channel that may have notes on
+        self.offs_dropped = 0  # note offs not sent because the note wasn't on
+
+    def send(self, status, data1, data2):
+        """Queue a 3-byte MIDI message, goes out on next flush()"""
+        n = self.buf_len
+        if n + 3 > len(self.buf):  # buffer full, make room
+            self.flush()
+            n = 0
+        self.buf[n] = status
+        self.buf[n+1] = data1
+        self.buf[n+2] = data2
+        self.buf_len = n + 3
+        self.msg_count += 1
+
+    def note_on(self, chan, note, vel):
+        """Queue a note on, chan is 1-16"""
+        if vel == 0:
+            self.note_off(chan, note, 0)
+            return
+        self.active[(chan-1) * 16 + (note >> 3)] |= 1 << (note & 7)
+        self.active_chans |= 1 << (chan-1)
+        self.send(0x90 | (chan-1), note, vel)
+
+    def note_off(self, chan, note, vel):
+        """Queue a note off, chan is 1-16, only if the note is on. Returns True if queued"""
+        j = (chan-1) * 16 + (note >> 3)
+        bit = 1 << (note & 7)
+        if not self.active[j] & bit:
+            self.offs_dropped += 1
+            return False
+        self.active[j] &= ~bit
+        self.send(0x80 | (chan-1), note, vel)
+        return True
+
+    def release(self, note, vel=0):
+        """Note off for note on every channel it's on (normally one).
+        Returns the channel, 1-16, of the last one queued, 0 == wasn't on"""
+        chan = 0
+        for ch in range(16):
+            if self.active_chans & (1 << ch) and self.active[ch * 16 + (note >> 3)] & (1 << (note & 7)):
+                self.note_off(ch + 1, note, vel)
+                chan = ch + 1
+        if not chan:
+            self.offs_dropped += 1
+        return chan
+
+    def is_on(self, chan, note):
+        return bool(self.active[(chan-1) * 16 + (note >> 3)] & (1 << (note & 7)))
+
+    def all_notes_off(self):
+        """Queue a note off for every note that's on, and only those"""
+        for ch in range(16):
+            if not self.active_chans & (1 << ch):
+                continue
+            for j in range(ch * 16, ch * 16 + 16):
+                bits = self.active[j]
+                if bits:
+                    for b in range(8):
+                        if bits & (1 << b):
+                            self.send(0x80 | ch, (j - ch * 16) * 8 + b, 0)
+                    self.active[j] = 0
+        self.active_chans = 0
+
+    def panic(self):
+        """All Notes Off (CC 123) on each channel with notes on, one message per channel
+        however many notes, and forget them"""
+        for ch in range(16):
+            if self.active_chans & (1 << ch):
+                self.send(0xB0 | ch, 123, 0)
+                self.active[ch * 16:ch * 16 + 16] = _no_notes
+        self.active_chans = 0
+
+    def encode_serial(self, n):
+        """The first n bytes of queued messages into serial_buf with running status,
+        note offs as note on velocity 0. Returns bytes used"""
+        (buf, out) = (self.buf, self.serial_buf)
+        self.serial_writes += 1
+        running = self.running_status if self.serial_writes % self.status_refresh else 0
+        m = 0
+        for j in range(0, n, 3):
+            status = buf[j]
+            data2 = buf[j+2]
+            if status & 0xf0 == 0x80:
+                status |= 0x10
+                data2 = 0
+            if status != running:
+                out[m] = status
+                m += 1
+                running = status
+            out[m] = buf[j+1]
+            out[m+1] = data2
+            m += 2
+        self.running_status = running
+        return m
+
+    def flush(self):
+        """Write all queued messages to every port"""
+        n = self.buf_len
+        if n == 0:
+            return
+        msgs = self.buf_view[:n]
+        for port in self.ports:
+            port.write(msgs)
+        self.byte_count += n
+        if self.serial_ports:
+            m = self.encode_serial(n)
+            msgs = self.serial_view[:m]
+            for port in self.serial_ports:
+                port.write(msgs)
+            self.serial_byte_count += m
+        self.buf_len = 0
@@ -0,0 +1,80 @@
+# sequencer_patterns.py -- picostepseq whole-pattern operations
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# All ops work in place on a StepSequencer's step storage (seqr.step_arrays),
+# swapping elements rather than building new lists. To apply one while playing,
+# use seqr.queue_op(op, args...) so it happens on the next bar downbeat, or
+# with at_pass=True at the start of the next pass through the sequence:
+#
+#   seqr.queue_op(sequencer_patterns.rotate, 1)
+
+scales = {
+    "major":      (0, 2, 4, 5, 7, 9, 11),
+    "minor":      (0, 2, 3, 5, 7, 8, 10),
+    "dorian":     (0, 2, 3, 5, 7, 9, 10),
+    "lydian":     (0, 2, 4, 6, 7, 9, 11),
+    "pentatonic": (0, 2, 4, 7, 9),
+    "chromatic":  (0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11),
+}
+
+def _reverse(arr, start, end):
+    """Reverse arr[start:end] in place"""
+    end -= 1
+    while start < end:
+        arr[start], arr[end] = arr[end], arr[start]
+        start += 1
+        end -= 1
+
+def rotate(seqr, n=1):
+    """Shift the steps played n places later (negative n == earlier), wrapping around
+    within seqr.length, steps past it stay put"""
+    count = seqr.length
+    n %= count
+    if n == 0:
+        return
+    for arr in seqr.step_arrays:  # rotate by three reversals, no temp copy needed
+        _reverse(arr, 0, count)
+        _reverse(arr, 0, n)
+        _reverse(arr, n, count)
+
+def reverse(seqr):
+    """Play the pattern backwards, the steps past seqr.length stay put"""
+    for arr in seqr.step_arrays:
+        _reverse(arr, 0, seqr.length)
+
+def invert_mutes(seqr):
+    """Mute the playing steps, unmute the muted ones"""
+    steps = seqr.steps
+    for i in range(seqr.step_count):
+        (n,v,gate,on) = steps[i]
+        steps[i] = (n, v, gate, not on)
+
+def random_fill(seqr, scale="major", root=48, octaves=2):
+    """Give every step a random note from scale, starting at root, using seqr's seeded rng"""
+    degrees = scales[scale]
+    num_degrees = len(degrees)
+    steps = seqr.steps
+    for i in range(seqr.step_count):
+        d = seqr.rng.next() % (num_degrees * octaves)
+        (n,v,gate,on) = steps[i]
+        steps[i] = (min(root + 12 * (d // num_degrees) + degrees[d % num_degrees], 127), v, gate, on)
+
+def double_length(seqr):
+    """Make pattern twice as long by playing it twice: the steps played are copied
+    into the steps after them, as far as step_count goes. Step storage never grows,
+    only seqr.length, so everything sized to step_count stays in step.
+    Returns how many steps were added, 0 if already playing all of them"""
+    length = seqr.length
+    n = min(length, seqr.step_count - length)
+    for arr in seqr.step_arrays:
+        for i in range(n):
+            arr[length + i] = arr[i]
+    seqr.length = length + n
+    return n
+
+def copy_slot(sequences, src, dst):
+    """Copy stored sequence slot src over slot dst, step by step"""
+    src_steps = sequences[src]
+    dst_steps = sequences[dst]
+    for i in range(len(src_steps)):
+        dst_steps[i] = src_steps[i]
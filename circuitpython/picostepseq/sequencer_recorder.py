@@ -0,0 +1,108 @@
+# sequencer_recorder.py -- picostepseq event recorder, for replaying timing bugs
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Records timestamped input (MIDI in, keys, encoder), sequencer state changes,
+# and MIDI out into a preallocated ring buffer. Each event is a timestamp plus
+# 4 bytes (kind, d0, d1, d2), so recording is just a few stores, no allocation.
+# Dump to a file with dump(), read it back on the host with read_events().
+
+import array
+import struct
+
+from sequencer import ticks_ms
+
+# event kinds
+EV_MIDI_IN   = 1  # d0,d1,d2 = status, data1, data2
+EV_MIDI_OUT  = 2  # d0,d1,d2 = status, data1, data2
+EV_KEY       = 3  # d0,d1 = step, pressed
+EV_ENC_SW    = 4  # d0 = pressed
+EV_ENC_TURN  = 5  # d0 = encoder delta + 128
+EV_SNAPSHOT  = 6  # marks start of a full state snapshot, d0 = rng state lo, d1 = rng state hi
+EV_STATE     = 7  # d0,d1,d2 = seqno, playing, transpose + 128
+EV_TEMPO     = 8  # d0,d1 = tempo_centi lo, hi
+EV_STEP      = 9  # d0,d1,d2 = step, note, gate | 0x80 if on
+EV_STEP_PROB = 10 # d0,d1,d2 = step, prob, cond
+EV_STEP_CHORD= 11 # d0,d1,d2 = step, chord, arp
+EV_LENGTH    = 12 # d0 = steps played, seqr.length
+EV_STEP_CC   = 13 # d0,d1,d2 = step, cc lock, ramp
+EV_STEP_VEL  = 14 # d0,d1 = step, velocity
+EV_RATE      = 15 # d0 = step rate, index into rate_ticks
+
+ev_names = ("", "midi_in", "midi_out", "key", "enc_sw", "enc_turn", "snapshot",
+            "state", "tempo", "step", "step_prob", "step_chord", "length", "step_cc", "step_vel", "rate")
+
+dump_magic = b"PSQR"
+dump_version = 4
+dump_header_fmt = "<4sBI"   # magic, version, event count
+dump_event_fmt = "<IBBBB"  # millis, kind, d0, d1, d2
+
+class EventRecorder:
+    """Fixed-size ring buffer of timestamped events, oldest get overwritten"""
+    def __init__(self, size=1024):
+        self.size = size
+        self.times = array.array('L', [0] * size)
+        self.events = bytearray(size * 4)
+        self.head = 0   # where next event goes
+        self.count = 0  # how many valid events, up to size
+
+    def record(self, kind, d0=0, d1=0, d2=0):
+        """Record an event happening now"""
+        i = self.head
+        self.times[i] = ticks_ms()
+        j = i * 4
+        ev = self.events
+        ev[j] = kind
+        ev[j+1] = d0
+        ev[j+2] = d1
+        ev[j+3] = d2
+        self.head = (i + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def record_state(self, seqr):
+        """Record sequencer transport, transpose, tempo, length and step rate"""
+        self.record(EV_STATE, seqr.seqno, seqr.playing, seqr.transpose + 128)
+        self.record(EV_TEMPO, seqr.tempo_centi & 0xff, seqr.tempo_centi >> 8)
+        self.record(EV_LENGTH, seqr.length)
+        self.record(EV_RATE, seqr.rate)
+
+    def record_step(self, seqr, i):
+        """Record all params of step i"""
+        (n,v,gate,on) = seqr.steps[i]
+        self.record(EV_STEP, i, n, gate | (0x80 if on else 0))
+        self.record(EV_STEP_PROB, i, seqr.probs[i], seqr.conds[i])
+        self.record(EV_STEP_CHORD, i, seqr.chords[i], seqr.arps[i])
+        self.record(EV_STEP_CC, i, seqr.ccs[i], seqr.ramps[i])
+        self.record(EV_STEP_VEL, i, v)
+
+    def snapshot(self, seqr):
+        """Record everything needed to replay from this point"""
+        rng_state = seqr.rng.state
+        self.record(EV_SNAPSHOT, rng_state & 0xff, rng_state >> 8)
+        self.record_state(seqr)
+        for i in range(seqr.step_count):
+            self.record_step(seqr, i)
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def dump(self, fp):
+        """Write all events, oldest first, to an open binary file"""
+        fp.write(struct.pack(dump_header_fmt, dump_magic, dump_version, self.count))
+        start = (self.head - self.count) % self.size
+        for k in range(self.count):
+            i = (start + k) % self.size
+            j = i * 4
+            ev = self.events
+            fp.write(struct.pack(dump_event_fmt, self.times[i], ev[j], ev[j+1], ev[j+2], ev[j+3]))
+
+def read_events(fp):
+    """Read a dump() file, yields (millis, kind, d0, d1, d2) tuples"""
+    header = fp.read(struct.calcsize(dump_header_fmt))
+    (magic, version, count) = struct.unpack(dump_header_fmt, header)
+    if magic != dump_magic or version != dump_version:
+        raise ValueError("not a picostepseq event dump")
+    event_size = struct.calcsize(dump_event_fmt)
+    for _ in range(count):
+        yield struct.unpack(dump_event_fmt, fp.read(event_size))
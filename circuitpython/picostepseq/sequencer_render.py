@@ -0,0 +1,89 @@
+# sequencer_render.py -- picostepseq offline rendering, what a pattern or song plays, without playing it
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Runs a StepSequencer of its own on a virtual clock that jumps straight to
+# the next thing the sequencer has to do (idle_millis()), so it follows the
+# exact same timing rules as playing live: tempo in microsecond steps, gates,
+# chords, arps, probabilities (seeded, so the same every time), trig
+# conditions, sequence length, and pattern changes between passes. Events
+# come out of a generator as (millis, status, data1, data2), note offs before
+# note ons at the same time, and only note offs for notes that were on.
+#
+# Not rendered: CC param locks (sequencer_cc.py sends them per main loop pass).
+
+from sequencer import StepSequencer, rate_ticks, ticks_per_bar, RATE_16TH
+
+steps_per_bar = 16  # 1/16th note steps, 4/4, other rates play ticks_per_bar // rate_ticks[rate]
+start_millis = 1000  # virtual clock's start, the sequencer takes a time of 0 to mean "none"
+
+class _Notes:
+    """Collects a sequencer's notes as events, at the time in .now"""
+    def __init__(self, chan):
+        self.chan = chan
+        self.now = start_millis
+        self.events = []
+        self.active = bytearray(128)  # how many times each note is on
+
+    def on(self, note, vel, gate, on):
+        if on:
+            self.active[note] += 1
+            self.events.append((self.now - start_millis, 0x90 | self.chan, note, vel))
+
+    def off(self, note, vel, gate, on):
+        if self.active[note]:
+            self.active[note] -= 1
+            self.events.append((self.now - start_millis, 0x80 | self.chan, note, 0))
+
+def _render(seqr, notes, num_steps, next_pattern=None):
+    """Play seqr for num_steps steps from the top, then let the last notes end.
+    next_pattern(passes) is called at the start of each pass, to queue the next one"""
+    notes.now = start_millis
+    seqr.play(now=start_millis)
+    fired = 0
+    while True:
+        if seqr.playing and seqr.i >= 0:
+            played = seqr.loop_count * seqr.length + seqr.i + 1
+            if played != fired:
+                fired = played
+                if seqr.i == 0 and next_pattern:
+                    next_pattern(seqr.loop_count)
+                if fired >= num_steps:
+                    seqr.pause()  # notes still on end at their usual time
+        for ev in notes.events:
+            yield ev
+        notes.events.clear()
+        idle = seqr.idle_millis(notes.now)
+        if not seqr.playing and idle >= 1000:
+            return  # nothing left to play
+        notes.now += max(idle, 0)
+        seqr.update(notes.now)
+
+def render_pattern(steps, bars=1, tempo_centi=120_00, chan=0, transpose=0, length=None, seed=0xACE1,
+                   rate=RATE_16TH):
+    """Yields the (millis, status, data1, data2) events of a sequence played for bars,
+    steps are stored [note,vel,gate,on,...] steps, chan is 0-15, rate an index into rate_ticks"""
+    notes = _Notes(chan)
+    seqr = StepSequencer(len(steps), 120, notes.on, notes.off, seed=seed)
+    seqr.set_tempo_centi(tempo_centi)
+    seqr.load_steps(steps)
+    seqr.length = length or len(steps)
+    seqr.transpose = transpose
+    seqr.set_rate(rate)
+    return _render(seqr, notes, bars * ticks_per_bar // rate_ticks[rate])
+
+def render_song(sequences, song, tempo_centi=120_00, chan=0, transpose=0, seed=0xACE1):
+    """Yields the events of a song, sequence slots in song played once each, one after another,
+    switching patterns between passes (at_pass ops; loading one while playing waits for the next bar)"""
+    notes = _Notes(chan)
+    seqr = StepSequencer(len(sequences[0]), 120, notes.on, notes.off, seed=seed)
+    seqr.set_tempo_centi(tempo_centi)
+    seqr.load_steps(sequences[song[0]])
+    seqr.transpose = transpose
+    def next_pattern(passes):
+        if passes + 1 < len(song):
+            seqr.queue_op(StepSequencer.load_steps, sequences[song[passes + 1]], at_pass=True)
+    return _render(seqr, notes, len(song) * seqr.step_count, next_pattern)
+
+def millis_to_ticks(millis, tempo_centi, ppq=96):
+    """Time in millis at tempo_centi as MIDI file ticks, to the nearest tick"""
+    return (millis * ppq * tempo_centi + 3_000_000) // 6_000_000
@@ -0,0 +1,136 @@
+# sequencer_settings.py -- picostepseq settings that survive a reboot
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Settings live in a small binary file ("/settings.pss"), read once at boot.
+# The same bytes are the SysEx settings dump (see sequencer_sysex.py).
+# Everything is little-endian bytes:
+#
+#   "PSQS"        magic
+#   version       settings_version
+#   size          bytes in the whole file
+#   midi_chan     1-16
+#   num_steps     steps per sequence, 1-max_steps, takes effect on next boot
+#   tempo_centi   uint16, tempo in 1/100ths BPM
+#   flags         FLAG_USB_MIDI, FLAG_SERIAL_MIDI, take effect on next boot
+#   num_seqs      sequence slots, then num_seqs lengths, channels & rates:
+#   seq_lens      steps each sequence plays, 0 == num_steps
+#   seq_chans     MIDI channel of each sequence, 0 == midi_chan
+#   seq_rates     step rate of each sequence, index into rate_ticks + 1, 0 == 1/16th notes
+#                 (version 2 on, version 1 files load as all 1/16th notes)
+#
+# Checking a file is one struct.unpack() and a range check of each value
+# against settings_schema, anything out of range and the defaults are kept.
+
+import struct
+
+from sequencer import rate_ticks, RATE_16TH
+
+settings_magic = b"PSQS"
+settings_version = 2
+settings_fmt = "<4sBBBBHBB"  # magic, version, size, midi_chan, num_steps, tempo_centi, flags, num_seqs
+settings_header_size = struct.calcsize(settings_fmt)
+max_steps = 8  # one step key & display column each
+
+FLAG_USB_MIDI = 0x01
+FLAG_SERIAL_MIDI = 0x02
+
+# (lo, hi) of midi_chan, num_steps, tempo_centi, flags, num_seqs
+settings_schema = ((1, 16), (1, max_steps), (20_00, 300_00), (0, 0xff), (1, 16))
+
+class Settings:
+    """All the settings, as defaults until load()ed"""
+    def __init__(self, midi_chan=1, num_steps=8, tempo_centi=100_00, usb_midi=True, serial_midi=True, num_seqs=8):
+        self.midi_chan = midi_chan
+        self.num_steps = num_steps
+        self.boot_num_steps = 0  # steps the sequencer was made with, if set, num_steps loaded later waits for next boot
+        self.tempo_centi = tempo_centi
+        self.flags = (FLAG_USB_MIDI if usb_midi else 0) | (FLAG_SERIAL_MIDI if serial_midi else 0)
+        self.seq_lens = bytearray(num_seqs)
+        self.seq_chans = bytearray(num_seqs)
+        self.seq_rates = bytearray(num_seqs)
+        self.loaded = False  # were these read from a file
+        self.changed_millis = 0  # when last changed and not saved yet, 0 == saved
+
+    @property
+    def usb_midi(self):
+        return bool(self.flags & FLAG_USB_MIDI)
+
+    @property
+    def serial_midi(self):
+        return bool(self.flags & FLAG_SERIAL_MIDI)
+
+    def seq_len(self, seqno):
+        """Steps sequence slot seqno plays, never more than the sequencer has"""
+        steps = self.boot_num_steps or self.num_steps
+        return min(self.seq_lens[seqno], steps) or steps
+
+    def seq_chan(self, seqno):
+        """MIDI channel, 1-16, sequence slot seqno plays on"""
+        return self.seq_chans[seqno] or self.midi_chan
+
+    def seq_rate(self, seqno):
+        """Step rate of sequence slot seqno, index into rate_ticks"""
+        r = self.seq_rates[seqno]
+        return r - 1 if r else RATE_16TH
+
+    def set_seq_rate(self, seqno, rate, now):
+        rate = min(max(rate, 0), len(rate_ticks) - 1)
+        self.seq_rates[seqno] = 0 if rate == RATE_16TH else rate + 1
+        self.changed(now)
+
+    def set_seq_len(self, seqno, length, now):
+        steps = self.boot_num_steps or self.num_steps  # the steps running now, not the next boot's
+        self.seq_lens[seqno] = 0 if length >= steps else max(length, 1)
+        self.changed(now)
+
+    def set_seq_chan(self, seqno, chan, now):
+        self.seq_chans[seqno] = min(max(chan, 0), 16)
+        self.changed(now)
+
+    def changed(self, now):
+        self.changed_millis = now or 1  # 0 means saved
+
+    def size(self):
+        return settings_header_size + 3 * len(self.seq_lens)
+
+    def to_bytes(self, buf=None):
+        """Settings as the bytes of a settings file, into buf if given"""
+        n = len(self.seq_lens)
+        if buf is None:
+            buf = bytearray(self.size())
+        struct.pack_into(settings_fmt, buf, 0, settings_magic, settings_version, self.size(),
+                         self.midi_chan, self.num_steps, self.tempo_centi, self.flags, n)
+        buf[settings_header_size:settings_header_size+n] = self.seq_lens
+        buf[settings_header_size+n:settings_header_size+2*n] = self.seq_chans
+        buf[settings_header_size+2*n:settings_header_size+3*n] = self.seq_rates
+        return buf
+
+    def from_bytes(self, data, length=None):
+        """Set from the bytes of a settings file, raises ValueError if they don't pass the schema check"""
+        length = len(data) if length is None else length
+        if length < settings_header_size:
+            raise ValueError("settings too short")
+        vals = struct.unpack_from(settings_fmt, data, 0)
+        if vals[0] != settings_magic or vals[1] > settings_version or vals[2] > length:
+            raise ValueError("not picostepseq settings")
+        for (v, (lo, hi)) in zip(vals[3:], settings_schema):
+            if not lo <= v <= hi:
+                raise ValueError("setting %d out of range" % v)
+        n = vals[7]
+        per_seq = 3 if vals[1] >= 2 else 2  # version 1 has no rates
+        if vals[2] < settings_header_size + per_seq * n:
+            raise ValueError("settings too short")
+        (self.midi_chan, self.num_steps, self.tempo_centi, self.flags) = vals[3:7]
+        for i in range(min(n, len(self.seq_lens))):  # more or fewer slots than we have is ok
+            self.seq_lens[i] = min(data[settings_header_size + i], self.num_steps)
+            self.seq_chans[i] = min(data[settings_header_size + n + i], 16)
+            r = data[settings_header_size + 2 * n + i] if per_seq > 2 else 0
+            self.seq_rates[i] = r if r <= len(rate_ticks) else 0
+        self.loaded = True
+
+    def load(self, fp):
+        self.from_bytes(fp.read())
+
+    def save(self, fp):
+        fp.write(self.to_bytes())
+        self.changed_millis = 0
@@ -0,0 +1,262 @@
+# sequencer_smf.py -- picostepseq Standard MIDI File export & import
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Writes sequences as a type-1 Standard MIDI File: a tempo track, then either
+# one track per sequence, or one track of a song (sequences chained one after
+# another). Events are made by generators and written as they're made, each
+# track in two passes (one to count its bytes for the track header, one to
+# write them), so no track is ever built up in memory, however long the song.
+#
+# Reads MIDI files back into sequence slots, one event at a time, snapping
+# each note to the nearest step.
+
+from sequencer import rate_ticks, ticks_per_quarter, RATE_16TH
+
+smf_ppq = 96  # ticks per quarter note
+steps_per_beat = 4  # 1/16th note steps, StepSequencer's usual rate, what read_sequences() snaps to
+
+META = 0xFF
+META_TRACK_NAME = 0x03
+META_END_OF_TRACK = 0x2F
+META_TEMPO = 0x51
+
+def varlen_size(n):
+    """Bytes needed to write n as a MIDI variable-length number"""
+    size = 1
+    while n > 0x7f:
+        n >>= 7
+        size += 1
+    return size
+
+def write_varlen(fp, n, buf=bytearray(4)):
+    size = varlen_size(n)
+    for k in range(size):
+        buf[k] = ((n >> (7 * (size-1-k))) & 0x7f) | (0x80 if k < size-1 else 0)
+    fp.write(memoryview(buf)[:size])
+
+def event_size(ev):
+    """Bytes an event takes, not counting its delta time"""
+    if ev[1] == META:
+        data = ev[3]
+        return 2 + varlen_size(len(data)) + len(data)
+    return 2 if 0xC0 <= ev[1] < 0xE0 else 3
+
+def write_event(fp, ev, buf=bytearray(3)):
+    (_, status, d1, d2) = ev
+    if status == META:
+        buf[0] = META
+        buf[1] = d1
+        fp.write(memoryview(buf)[:2])
+        write_varlen(fp, len(d2))
+        fp.write(d2)
+    else:
+        buf[0] = status
+        buf[1] = d1
+        buf[2] = d2
+        fp.write(memoryview(buf)[:event_size(ev)])
+
+def tempo_events(tempo_centi):
+    """Events for a tempo track"""
+    micros_per_quarter = 6_000_000_000 // tempo_centi
+    yield (0, META, META_TEMPO, bytes(((micros_per_quarter >> 16) & 0xff,
+                                       (micros_per_quarter >> 8) & 0xff, micros_per_quarter & 0xff)))
+
+def rate_step_ticks(rate, ppq=smf_ppq):
+    """MIDI file ticks a step at rate (index into rate_ticks) lasts"""
+    return ppq * rate_ticks[rate] // ticks_per_quarter
+
+def sequence_events(steps, chan=0, transpose=0, start=0, ppq=smf_ppq, name=None, length=None, rate=RATE_16TH):
+    """Events for playing a sequence once from tick start, its first length steps (all if None)
+    at rate. Steps are [note,vel,gate,on,...], gates timed like StepSequencer: gate/16ths of a step"""
+    if name:
+        yield (start, META, META_TRACK_NAME, name.encode())
+    step_ticks = rate_step_ticks(rate, ppq)
+    t = start
+    for s in steps[:length]:
+        (note, vel, gate, on) = (s[0], s[1], s[2], s[3])
+        if on:
+            note = min(max(note + transpose, 0), 127)
+            yield (t, 0x90 | chan, note, vel)
+            yield (t + gate * step_ticks // 16, 0x80 | chan, note, 0)
+        t += step_ticks
+
+class SmfWriter:
+    """Streams a type-1 SMF to an open binary file. Give write_track() a function
+    that returns a fresh iterator of (tick, status, data1, data2) events in tick
+    order each time it's called, meta events are (tick, META, type, bytes)"""
+    def __init__(self, fp, num_tracks, ppq=smf_ppq):
+        self.fp = fp
+        self.ppq = ppq
+        fp.write(b"MThd\x00\x00\x00\x06")
+        fp.write(bytes((0, 1, num_tracks >> 8, num_tracks & 0xff, ppq >> 8, ppq & 0xff)))
+
+    def write_track(self, make_events):
+        fp = self.fp
+        size = 4  # end of track
+        last = 0
+        for ev in make_events():
+            size += varlen_size(ev[0] - last) + event_size(ev)
+            last = ev[0]
+        fp.write(b"MTrk")
+        fp.write(bytes(((size >> 24) & 0xff, (size >> 16) & 0xff, (size >> 8) & 0xff, size & 0xff)))
+        last = 0
+        for ev in make_events():
+            write_varlen(fp, ev[0] - last)
+            write_event(fp, ev)
+            last = ev[0]
+        fp.write(b"\x00\xff\x2f\x00")
+
+def slot_events(sequences, slot, chan, transpose, start, ppq, lens, chans, rates, name=None):
+    """sequence_events() of a sequence slot, with its length, channel (0-15) & rate
+    from lens, chans & rates, lists indexed by slot, any of them None for the defaults"""
+    return sequence_events(sequences[slot], chans[slot] if chans else chan, transpose, start, ppq, name,
+                           lens[slot] if lens else None, rates[slot] if rates else RATE_16TH)
+
+def write_sequences(fp, sequences, tempo_centi=120_00, chan=0, transpose=0, ppq=smf_ppq,
+                    lens=None, chans=None, rates=None):
+    """Write each sequence as its own track, all starting at the top"""
+    smf = SmfWriter(fp, 1 + len(sequences), ppq)
+    smf.write_track(lambda: tempo_events(tempo_centi))
+    for n in range(len(sequences)):
+        smf.write_track(lambda: slot_events(sequences, n, chan, transpose, 0, ppq, lens, chans, rates,
+                                            "seq %d" % (n+1)))
+
+def song_events(sequences, song, chan=0, transpose=0, ppq=smf_ppq, lens=None, chans=None, rates=None):
+    """Events for a song, a list of sequence slots to play one after another"""
+    yield (0, META, META_TRACK_NAME, b"song")
+    start = 0
+    for slot in song:
+        for ev in slot_events(sequences, slot, chan, transpose, start, ppq, lens, chans, rates):
+            yield ev
+        length = lens[slot] if lens else len(sequences[slot])
+        start += length * rate_step_ticks(rates[slot] if rates else RATE_16TH, ppq)
+
+def write_song(fp, sequences, song, tempo_centi=120_00, chan=0, transpose=0, ppq=smf_ppq,
+               lens=None, chans=None, rates=None):
+    """Write a song as one track, e.g. write_song(fp, sequences, (0,0,1,2)).
+    lens, chans (0-15) & rates are each slot's, like Settings' seq_len(), seq_chan() - 1 & seq_rate()"""
+    smf = SmfWriter(fp, 2, ppq)
+    smf.write_track(lambda: tempo_events(tempo_centi))
+    smf.write_track(lambda: song_events(sequences, song, chan, transpose, ppq, lens, chans, rates))
+
+class SmfReader:
+    """Streams events out of a Standard MIDI File, reading a few bytes at a time"""
+    def __init__(self, fp):
+        self.fp = fp
+        self.left = 0  # bytes left in current track
+        (chunk, size) = self._chunk_header()
+        if chunk != b"MThd" or size < 6:
+            raise ValueError("not a MIDI file")
+        data = fp.read(size)
+        self.format = (data[0] << 8) | data[1]
+        self.num_tracks = (data[2] << 8) | data[3]
+        self.ppq = (data[4] << 8) | data[5]
+        if self.ppq & 0x8000:
+            raise ValueError("SMPTE timing not supported")
+
+    def _chunk_header(self):
+        data = self.fp.read(8)
+        if len(data) < 8:
+            return (b"", 0)
+        return (data[:4], (data[4] << 24) | (data[5] << 16) | (data[6] << 8) | data[7])
+
+    def _read(self, n):
+        self.left -= n
+        data = self.fp.read(n)
+        if len(data) < n:
+            raise ValueError("MIDI file is cut short")
+        return data
+
+    def _byte(self):
+        return self._read(1)[0]
+
+    def _varlen(self):
+        n = 0
+        while True:
+            b = self._byte()
+            n = (n << 7) | (b & 0x7f)
+            if not b & 0x80:
+                return n
+
+    def events(self):
+        """Yields (track, tick, status, data1, data2) for every event, a track at a time.
+        Meta events are (track, tick, META, type, bytes), sysex is skipped"""
+        track = 0
+        while track < self.num_tracks:
+            (chunk, size) = self._chunk_header()
+            if not chunk:
+                return
+            self.left = size
+            if chunk != b"MTrk":  # unknown chunks are skipped, and don't count as tracks
+                self._read(size)
+                continue
+            tick = 0
+            status = 0
+            while self.left > 0:
+                tick += self._varlen()
+                b = self._byte()
+                if b == META:
+                    kind = self._byte()
+                    data = self._read(self._varlen())
+                    if kind == META_END_OF_TRACK:
+                        break
+                    yield (track, tick, META, kind, data)
+                elif b == 0xF0 or b == 0xF7:
+                    self._read(self._varlen())
+                else:
+                    if b & 0x80:
+                        status = b
+                        b = self._byte()
+                    elif not status:
+                        raise ValueError("running status with no status")
+                    d2 = 0 if 0xC0 <= status < 0xE0 else self._byte()
+                    yield (track, tick, status, b, d2)
+            if self.left > 0:
+                self._read(self.left)
+            track += 1
+
+def read_sequences(fp, num_seqs=8, num_steps=8, chan=None, base_note=60):
+    """Read a MIDI file into num_seqs slots of num_steps [note,vel,gate,on] steps,
+    returns (sequences, tempo_centi). Notes are quantized to the nearest 1/16th
+    note step, one after another across the slots. If two notes land on the
+    same step, the louder one wins. Steps without a note are muted. Only notes
+    on chan (0-15) are read, or all channels if chan is None"""
+    smf = SmfReader(fp)
+    step_ticks = smf.ppq // steps_per_beat
+    total_steps = num_seqs * num_steps
+    notes = bytearray(total_steps)
+    vels = bytearray(total_steps)
+    gates = bytearray(total_steps)
+    pending = {}  # (chan,note) -> (tick, vel) of notes that are on
+    tempo_centi = 0
+    for (_, tick, status, d1, d2) in smf.events():
+        if status == META:
+            if d1 == META_TEMPO and not tempo_centi:
+                micros_per_quarter = (d2[0] << 16) | (d2[1] << 8) | d2[2]
+                tempo_centi = (6_000_000_000 + micros_per_quarter // 2) // micros_per_quarter
+            continue
+        kind = status & 0xf0
+        if chan is not None and status & 0x0f != chan:
+            continue
+        key = (status & 0x0f, d1)
+        if kind == 0x90 and d2:
+            pending[key] = (tick, d2)
+        elif (kind == 0x80 or kind == 0x90) and key in pending:
+            (on_tick, vel) = pending.pop(key)
+            i = (on_tick + step_ticks // 2) // step_ticks
+            if i < total_steps and vel > vels[i]:
+                notes[i] = d1
+                vels[i] = vel
+                gates[i] = min(max(((tick - on_tick) * 16 + step_ticks // 2) // step_ticks, 1), 15)
+    sequences = []
+    note = base_note
+    for j in range(num_seqs):
+        steps = []
+        for i in range(j * num_steps, (j+1) * num_steps):
+            if vels[i]:
+                note = notes[i]
+                steps.append([note, vels[i], gates[i], True])
+            else:  # muted, but with the note before it, so unmuting sounds right
+                steps.append([note, 127, 8, False])
+        sequences.append(steps)
+    return sequences, tempo_centi
@@ -0,0 +1,295 @@
+# sequencer_sysex.py -- picostepseq SysEx dump & load of banks, patterns and settings
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Protocol, all bytes between F0 and F7 are 7-bit:
+#
+#   F0 7D 50 53 cmd ... F7       (7D = non-commercial ID, 50 53 = "PS")
+#
+#   cmd 01 request dump:  kind index
+#   cmd 02 data chunk:    kind index chunk_num num_chunks data... checksum
+#   cmd 03 chunk ok:      kind chunk_num
+#   cmd 04 chunk bad:     kind chunk_num
+#
+# kind is KIND_BANK (all slots, as a sequencer_bank file), KIND_PATTERN
+# (one slot, index 0-126, or 127 for the playing pattern, as its steps),
+# or KIND_SETTINGS. Payloads are sent in chunks of up to chunk_size bytes,
+# each packed 7 bytes into 8 (a byte of high bits, then 7 bytes of low bits).
+# checksum makes the 7-bit sum of everything from kind to checksum zero.
+# A chunk is answered with "chunk ok" or "chunk bad", so a sender can wait
+# for it before sending the next, or resend. A request for a dump too big
+# for the payload buffer is answered with "chunk bad" for chunk 0.
+#
+# SysexPort sits between the USB MIDI port and MidiIn, reading the port in
+# bulk and keeping SysEx out of MidiIn, but passing through the MIDI clock
+# and other realtime messages that can come in the middle of a SysEx.
+# SysexHandler puts received chunks together into a preallocated payload
+# buffer, and sends dumps out one chunk per update(), so transfers can
+# happen while playing without holding up the sequencer.
+
+SYSEX_START = 0xF0
+SYSEX_END = 0xF7
+sysex_id = (0x7D, 0x50, 0x53)
+
+CMD_REQUEST = 0x01
+CMD_DATA = 0x02
+CMD_ACK = 0x03
+CMD_NAK = 0x04
+
+KIND_BANK = 0
+KIND_PATTERN = 1
+KIND_SETTINGS = 2
+PATTERN_LIVE = 127  # pattern index for the pattern that's playing
+
+chunk_size = 56  # payload bytes per chunk, packs into 64 sysex bytes
+chunk_header_size = 8  # id, cmd, kind, index, chunk_num, num_chunks
+max_msg_size = chunk_header_size + chunk_size + (chunk_size + 6) // 7 + 1  # + checksum
+
+def packed_size(n):
+    """SysEx bytes that n payload bytes pack into"""
+    return n + (n + 6) // 7
+
+def pack7(dst, doff, src, soff, n):
+    """Pack n bytes of src into 7-bit bytes in dst, returns bytes written"""
+    start = doff
+    while n > 0:
+        k = min(n, 7)
+        hibits = 0
+        for i in range(k):
+            b = src[soff+i]
+            hibits |= (b >> 7) << i
+            dst[doff+1+i] = b & 0x7f
+        dst[doff] = hibits
+        doff += k + 1
+        soff += k
+        n -= k
+    return doff - start
+
+def unpack7(dst, doff, src, soff, n):
+    """Unpack n 7-bit bytes of src into dst, returns bytes written"""
+    start = doff
+    end = soff + n
+    while soff < end:
+        hibits = src[soff]
+        k = min(end - soff - 1, 7)
+        for i in range(k):
+            dst[doff+i] = src[soff+1+i] | (((hibits >> i) & 1) << 7)
+        doff += k
+        soff += k + 1
+    return doff - start
+
+def checksum(buf, start, end):
+    """7-bit value that makes the sum of buf[start:end] plus it a multiple of 128"""
+    s = 0
+    for i in range(start, end):
+        s += buf[i]
+    return -s & 0x7f
+
+def encode_chunk(buf, kind, index, chunk_num, num_chunks, payload, length):
+    """Make one complete data chunk message in buf, from payload bytes
+    chunk_num * chunk_size onwards (of length total). Returns message length"""
+    off = chunk_num * chunk_size
+    n = min(chunk_size, length - off)
+    buf[0] = SYSEX_START
+    buf[1:4] = bytes(sysex_id)
+    buf[4] = CMD_DATA
+    buf[5] = kind
+    buf[6] = index
+    buf[7] = chunk_num
+    buf[8] = num_chunks
+    j = 9 + pack7(buf, 9, payload, off, n)
+    buf[j] = checksum(buf, 5, j)
+    buf[j+1] = SYSEX_END
+    return j + 2
+
+def encode_messages(kind, index, payload):
+    """All the messages to send a payload, as a list of bytes. For host tools"""
+    num_chunks = max(1, (len(payload) + chunk_size - 1) // chunk_size)
+    buf = bytearray(max_msg_size + 2)
+    return [ bytes(buf[:encode_chunk(buf, kind, index, k, num_chunks, payload, len(payload))])
+             for k in range(num_chunks) ]
+
+def request_message(kind, index=0):
+    return bytes((SYSEX_START,) + sysex_id + (CMD_REQUEST, kind, index, SYSEX_END))
+
+
+class SysexPort:
+    """MIDI in port wrapper that reads port in bulk and takes SysEx out of the stream.
+    Give it to MidiIn in place of the port. When .ready, .msg[:.msg_len] is a whole
+    SysEx message (without F0 & F7), call done() when finished with it"""
+    def __init__(self, port, max_len=max_msg_size, read_size=64):
+        self.port = port
+        self.read_buf = bytearray(read_size)
+        self.read_pos = 0
+        self.read_len = 0
+        self.msg = bytearray(max_len)
+        self.msg_len = 0
+        self.in_sysex = False
+        self.overflow = False
+        self.ready = False
+        self.error_count = 0  # SysEx that was too long or cut off
+
+    def done(self):
+        self.ready = False
+        self.msg_len = 0
+
+    def readinto(self, buf, n=None):
+        """Port read for MidiIn: all bytes but SysEx. Reads the real port at most once"""
+        n = n or len(buf)
+        count = 0
+        did_read = False
+        read_buf = self.read_buf
+        while count < n:
+            if self.read_pos >= self.read_len:
+                if did_read:
+                    break  # already read port once
+                self.read_len = self.port.readinto(read_buf) or 0
+                self.read_pos = 0
+                did_read = True
+                if not self.read_len:
+                    break
+            b = read_buf[self.read_pos]
+            if self.in_sysex and b < 0x80:
+                if self.msg_len < len(self.msg):
+                    self.msg[self.msg_len] = b
+                    self.msg_len += 1
+                else:
+                    self.overflow = True
+                self.read_pos += 1
+                continue
+            if b >= 0xF8:  # realtime, can happen anywhere
+                buf[count] = b
+                count += 1
+            elif b == SYSEX_START:
+                if self.ready:
+                    break  # last one not dealt with yet, leave this for next time
+                self.in_sysex = True
+                self.overflow = False
+                self.msg_len = 0
+            elif self.in_sysex:  # end of SysEx, or any other status byte cuts it off
+                self.in_sysex = False
+                if b == SYSEX_END and not self.overflow:
+                    self.ready = True
+                else:
+                    self.error_count += 1
+                    self.msg_len = 0
+                if b != SYSEX_END:
+                    buf[count] = b
+                    count += 1
+            else:
+                buf[count] = b
+                count += 1
+            self.read_pos += 1
+        return count
+
+
+class SysexHandler:
+    """Acts on SysEx messages from a SysexPort, and sends dumps.
+    get_payload(kind, index, buf) fills buf with a payload to dump, returning its length,
+    raising ValueError if it doesn't fit (BufWriter does).
+    put_payload(kind, index, buf, length) is called with each payload received"""
+    def __init__(self, out_port, get_payload, put_payload, max_payload):
+        self.out_port = out_port
+        self.get_payload = get_payload
+        self.put_payload = put_payload
+        self.payload = bytearray(max_payload)
+        self.out_msg = bytearray(max_msg_size + 2)
+        # receiving
+        self.rx_kind = -1
+        self.rx_next_chunk = 0
+        self.rx_len = 0
+        # sending
+        self.tx_kind = -1
+        self.tx_index = 0
+        self.tx_next_chunk = 0
+        self.tx_num_chunks = 0
+        self.tx_len = 0
+
+    def handle(self, msg, length):
+        """Act on one SysEx message, returns True if it was for us"""
+        if length < 6 or msg[0] != sysex_id[0] or msg[1] != sysex_id[1] or msg[2] != sysex_id[2]:
+            return False
+        cmd = msg[3]
+        kind = msg[4]
+        if cmd == CMD_REQUEST:
+            if self.rx_kind < 0:  # payload buffer is ours to use
+                try:
+                    self.tx_len = self.get_payload(kind, msg[5], self.payload)
+                except ValueError:  # too big for the payload buffer
+                    self.tx_len = 0
+                    self._send_reply(CMD_NAK, kind, 0)
+                if self.tx_len:
+                    self.tx_kind = kind
+                    self.tx_index = msg[5]
+                    self.tx_next_chunk = 0
+                    self.tx_num_chunks = max(1, (self.tx_len + chunk_size - 1) // chunk_size)
+        elif cmd == CMD_DATA and length >= 8:
+            self._receive_chunk(msg, length)
+        return True
+
+    def _receive_chunk(self, msg, length):
+        (kind, index, chunk_num, num_chunks) = (msg[4], msg[5], msg[6], msg[7])
+        ok = checksum(msg, 4, length) == 0 and self.tx_kind < 0
+        if ok and chunk_num == 0:
+            self.rx_kind = kind
+            self.rx_next_chunk = 0
+            self.rx_len = 0
+        ok = ok and kind == self.rx_kind and chunk_num == self.rx_next_chunk
+        n = length - 9  # packed data bytes
+        if ok and self.rx_len + n - (n + 7) // 8 <= len(self.payload):
+            self.rx_len += unpack7(self.payload, self.rx_len, msg, 8, n)
+            self.rx_next_chunk += 1
+        else:
+            ok = False
+        self._send_reply(CMD_ACK if ok else CMD_NAK, kind, chunk_num)
+        if ok and self.rx_next_chunk == num_chunks:
+            self.rx_kind = -1
+            self.put_payload(kind, index, self.payload, self.rx_len)
+
+    def _send_reply(self, cmd, kind, chunk_num):
+        buf = self.out_msg
+        buf[0] = SYSEX_START
+        buf[1:4] = bytes(sysex_id)
+        buf[4] = cmd
+        buf[5] = kind
+        buf[6] = chunk_num
+        buf[7] = SYSEX_END
+        self.out_port.write(memoryview(buf)[:8])
+
+    def update(self):
+        """Send next chunk of a dump, if there is one. Returns True if it sent one"""
+        if self.tx_kind < 0:
+            return False
+        n = encode_chunk(self.out_msg, self.tx_kind, self.tx_index, self.tx_next_chunk,
+                         self.tx_num_chunks, self.payload, self.tx_len)
+        self.out_port.write(memoryview(self.out_msg)[:n])
+        self.tx_next_chunk += 1
+        if self.tx_next_chunk == self.tx_num_chunks:
+            self.tx_kind = -1
+        return True
+
+
+class BufWriter:
+    """Just enough of a file to write() into a bytearray, for sequencer_bank.
+    Never grows the bytearray, writing past its end raises ValueError"""
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def write(self, data):
+        n = len(data)
+        if self.pos + n > len(self.buf):
+            raise ValueError("payload too big for buffer")
+        self.buf[self.pos:self.pos+n] = data
+        self.pos += n
+
+class BufReader:
+    """Just enough of a file to read() from a bytearray, for sequencer_bank"""
+    def __init__(self, buf, length):
+        self.buf = buf
+        self.pos = 0
+        self.length = length
+
+    def read(self, n):
+        n = min(n, self.length - self.pos)
+        self.pos += n
+        return self.buf[self.pos-n:self.pos]
@@ -0,0 +1,132 @@
+# sequencer_undo.py -- picostepseq undo/redo history
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Each change is stored as a 5-byte delta (slot, step, field, old, new) in a
+# fixed-size ring buffer, so memory use is bounded and undoing one change is
+# a single field write. Changes that belong together (like a sequence load)
+# are grouped and undone as one.
+
+# which step param a delta changes
+FIELD_NOTE, FIELD_VEL, FIELD_GATE, FIELD_ON, FIELD_PROB, FIELD_COND, FIELD_CHORD, FIELD_ARP, FIELD_CC, FIELD_RAMP = range(10)
+FIELD_SEQNO = 10  # which sequence the sequencer is playing, step is unused
+num_step_fields = 10
+field_defaults = (0, 127, 8, 1, 100, 0, 0, 0, 0xff, 0)  # what load_steps() uses for params a step doesn't have
+
+SLOT_LIVE = 0xff  # slot for the sequence in the sequencer, 0-254 are stored sequence slots
+
+_GROUP_CONT = 0x80  # set on field byte of deltas that go with the delta before them
+
+def step_field_get(seqr, step, field):
+    """Get one param of one step in the sequencer"""
+    if field < 4:
+        return int(seqr.steps[step][field])
+    if field == FIELD_SEQNO:
+        return seqr.seqno
+    return seqr.step_arrays[field - 3][step]  # probs, conds, chords, arps, ccs, ramps
+
+def step_field_set(seqr, step, field, val):
+    """Set one param of one step in the sequencer"""
+    if field < 4:
+        s = list(seqr.steps[step])
+        s[field] = bool(val) if field == FIELD_ON else val
+        seqr.steps[step] = tuple(s)
+    elif field == FIELD_SEQNO:
+        seqr.seqno = val
+    else:
+        seqr.step_arrays[field - 3][step] = val
+
+def stored_field_get(sequences, slot, step, field):
+    """Get one param of one step in a stored sequence slot, the way load_steps() defaults it"""
+    s = sequences[slot][step]
+    if field < len(s):
+        return int(s[field])
+    return field_defaults[field]
+
+def stored_field_set(sequences, slot, step, field, val):
+    """Set one param of one step in a stored sequence slot"""
+    s = list(sequences[slot][step])
+    while len(s) < num_step_fields:
+        s.append(field_defaults[len(s)])
+    s[field] = bool(val) if field == FIELD_ON else val
+    sequences[slot][step] = s
+
+class UndoHistory:
+    """Ring buffer of deltas, with undo and redo.
+    size should be bigger than the biggest group, or its oldest deltas get overwritten"""
+    def __init__(self, size=128):
+        self.size = size
+        self.deltas = bytearray(size * 5)  # slot, step, field (| _GROUP_CONT), old, new
+        self.head = 0   # where next delta goes
+        self.count = 0  # how many deltas can be undone
+        self.redo_count = 0  # how many undone deltas can be redone
+        self.in_group = False  # are we in begin_group() / end_group()
+        self.group_started = False  # has current group got its first delta yet
+        self.sealed = True  # can next record() merge into last delta
+
+    def begin_group(self):
+        """Deltas recorded until end_group() are undone together"""
+        self.in_group = True
+        self.group_started = False
+
+    def end_group(self):
+        self.in_group = False
+        self.sealed = True
+
+    def seal(self):
+        """Stop next record() from merging into the last delta, e.g. on step key release"""
+        self.sealed = True
+
+    def record(self, slot, step, field, old, new):
+        """Record a change. Repeated changes to the same param merge into one delta"""
+        if old == new:
+            return
+        self.redo_count = 0  # a new change ends what can be redone
+        d = self.deltas
+        if not self.sealed and not self.in_group and self.count:
+            j = ((self.head - 1) % self.size) * 5
+            if d[j] == slot and d[j+1] == step and d[j+2] == field:
+                d[j+4] = new
+                return
+        j = self.head * 5
+        d[j] = slot
+        d[j+1] = step
+        d[j+2] = field | (_GROUP_CONT if self.in_group and self.group_started else 0)
+        d[j+3] = old
+        d[j+4] = new
+        self.head = (self.head + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.group_started = self.in_group
+        self.sealed = self.in_group
+
+    def undo(self, apply):
+        """Undo last change (or group), calling apply(slot, step, field, val) for each delta.
+        Returns how many deltas were undone"""
+        n = 0
+        d = self.deltas
+        while self.count:
+            self.head = (self.head - 1) % self.size
+            self.count -= 1
+            self.redo_count += 1
+            j = self.head * 5
+            apply(d[j], d[j+1], d[j+2] & 0x7f, d[j+3])
+            n += 1
+            if not d[j+2] & _GROUP_CONT:  # first delta of its group
+                break
+        self.sealed = True
+        return n
+
+    def redo(self, apply):
+        """Redo last undone change (or group). Returns how many deltas were redone"""
+        n = 0
+        d = self.deltas
+        while self.redo_count:
+            j = self.head * 5
+            apply(d[j], d[j+1], d[j+2] & 0x7f, d[j+4])
+            self.head = (self.head + 1) % self.size
+            self.count += 1
+            self.redo_count -= 1
+            n += 1
+            if not self.redo_count or not d[self.head*5+2] & _GROUP_CONT:  # next delta starts new group
+                break
+        self.sealed = True
+        return n
@@ -47,6 +47,10 @@ STOP = 0xFC
 ACTIVE_SENSING = 0xFE
 SYSTEM_RESET = 0xFF
 
+# receive_sysex() gives up on a message after this many reads in a row
+# come back empty, so a sender that stops mid-message can't hang it.
+SYSEX_MAX_EMPTY_READS = 1000
+
 _LEN_0_MESSAGES = set(
     [
         TUNE_REQUEST,
@@ -179,6 +183,9 @@ class MidiIn:
 
         This must only be called after getting a sysex message from
         receive and must be called before invoking receive again.
+
+        If the port has nothing for SYSEX_MAX_EMPTY_READS reads in a
+        row, the bytes so far are returned as truncated.
         """
         self._outstanding_sysex = False
 
@@ -186,13 +193,19 @@ class MidiIn:
         length = 0
         buf = bytearray(1)
         truncated = False
+        empty_reads = 0
 
         # This reads one byte at a time so we don't read past the
         # end byte. There may be more efficient ways to do this
         # but sysex messages should be relatively rare in practice,
         # so I'm not sure how much benefit we'll get.
         while length < max_length:
-            self._port.readinto(buf, 1)
+            if not self._port.readinto(buf, 1):
+                empty_reads += 1
+                if empty_reads > SYSEX_MAX_EMPTY_READS:
+                    return out, True  # sender stopped, give up on the rest
+                continue  # nothing yet, don't take buf's last byte again
+            empty_reads = 0
             if buf[0] == SYSEX_END:
                 break
             out.extend(buf)
@@ -204,6 +217,11 @@ class MidiIn:
             # Ignore the rest of the message by reading and throwing away
             # bytes until we get to SYSEX_END.
             while buf[0] != SYSEX_END:
-                self._port.readinto(buf, 1)
+                if self._port.readinto(buf, 1):
+                    empty_reads = 0
+                else:
+                    empty_reads += 1
+                    if empty_reads > SYSEX_MAX_EMPTY_READS:
+                        break
 
         return out, truncated
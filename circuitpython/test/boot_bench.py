@@ -0,0 +1,89 @@
+# boot_bench.py -- host timing of the pure-Python parts of booting, up to the first note
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Times what code.py does before the sequencer can play, in order: imports,
+# settings, reading the bank (.psq, and the older .json for comparison),
+# setting up the sequencer, and the first step. The display isn't in here,
+# it's built from the main loop after this (see ui_setup() in code.py).
+# Host times are much faster than on a Pico, but show what costs the most.
+#
+# Run on the host: python3 boot_bench.py
+
+import importlib
+import io
+import json
+import sys
+import time
+sys.path.insert(0, "../picostepseq")
+
+pure_modules = ("sequencer", "sequencer_boot", "winterbloom_smolmidi", "sequencer_midi", "sequencer_leds",
+                "sequencer_recorder", "sequencer_input", "sequencer_undo", "sequencer_bank",
+                "sequencer_sysex", "sequencer_settings", "sequencer_heap")
+
+def timed(func, n=1):
+    """Average millis func() takes over n runs, and its last result"""
+    st = time.perf_counter()
+    for _ in range(n):
+        result = func()
+    return (time.perf_counter() - st) * 1000 / n, result
+
+def bench_imports():
+    total = 0
+    for name in pure_modules:
+        sys.modules.pop(name, None)
+        (ms, _) = timed(lambda: importlib.import_module(name))
+        total += ms
+        print("  import %-22s %6.2f ms" % (name, ms))
+    return total
+
+def main():
+    stages = []
+    stages.append(("imports", bench_imports()))
+
+    from sequencer import StepSequencer
+    from sequencer_bank import read_bank, write_bank
+    from sequencer_settings import Settings
+    from sequencer_undo import UndoHistory, num_step_fields
+
+    settings_bytes = Settings(midi_chan=2).to_bytes()
+    def load_settings():
+        s = Settings()
+        s.from_bytes(settings_bytes)
+        return s
+    (ms, settings) = timed(load_settings, 100)
+    stages.append(("settings", ms))
+
+    with open("../picostepseq/saved_sequences.json") as fp:
+        json_text = fp.read()
+    bank = io.BytesIO()
+    write_bank(bank, json.loads(json_text), 120_00)
+    (ms, (sequences, tempo_centi)) = timed(lambda: read_bank(io.BytesIO(bank.getvalue())), 100)
+    stages.append(("bank (.psq)", ms))
+    (json_ms, _) = timed(lambda: json.loads(json_text), 100)
+
+    first_note = []
+    def note_on(note, vel, gate, on): first_note.append(time.perf_counter())
+    def setup_sequencer():
+        seqr = StepSequencer(settings.num_steps, 100, note_on, lambda *a: None)
+        seqr.set_tempo_centi(tempo_centi)
+        seqr.load_steps(sequences[0])
+        seqr.length = settings.seq_len(0)
+        UndoHistory(size=2 * settings.num_steps * num_step_fields + 2)
+        return seqr
+    (ms, seqr) = timed(setup_sequencer, 100)
+    stages.append(("sequencer", ms))
+
+    st = time.perf_counter()
+    seqr.play()
+    stages.append(("first step", (first_note[0] - st) * 1000))
+
+    print()
+    total = 0
+    for (name, ms) in stages:
+        total += ms
+        print("%-14s %7.3f ms   %7.3f ms total" % (name, ms, total))
+    print("(the same bank as .json: %.3f ms, but the .psq needs no json module or its RAM)" % json_ms)
+    print("time to first note on host: %.2f ms, display is built after this" % total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# cc_check.py -- check CC param lock ramps, the bandwidth calculator, and that the rate cap holds
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Plays sequences with CC locks & ramps on a fake millisecond clock through
+# MidiOut to a fake port, a main loop pass per millisecond like code.py, and
+# checks what comes out: CCs never closer together than the cap, notes & CCs
+# under the share of serial MIDI they're allowed, and CCs after the notes.
+#
+# Run on the host: python3 cc_check.py
+
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, cc_none
+from sequencer_midi import MidiOut
+from sequencer_cc import *
+
+class FakePort:
+    def __init__(self):
+        self.now = 0
+        self.writes = []  # (millis, bytes)
+
+    def write(self, data):
+        self.writes.append((self.now, bytes(data)))
+
+def run(steps, ccs, ramps, tempo=120, share_percent=50, passes=2):
+    """Play steps with locks for some passes through them, returns (port, locks, note on times)"""
+    port = FakePort()
+    midi_out = MidiOut([port])
+    note_ons = []
+    seqr = StepSequencer(8, tempo, lambda n,v,g,o: (note_ons.append(port.now), midi_out.note_on(1, n, v)),
+                         lambda n,v,g,o: midi_out.note_off(1, n, v))
+    seqr.load_steps(steps)
+    seqr.ccs[:] = bytes(ccs)
+    seqr.ramps[:] = bytes(ramps)
+    locks = ParamLocks(midi_out, 8, share_percent=share_percent)
+    now = port.now = 1000
+    seqr.play(now=now)
+    end = now + passes * 8 * seqr.beat_millis
+    while now < end:
+        port.now = now
+        seqr.update(now)
+        locks.update(seqr, 1, now)
+        midi_out.flush()
+        now += 1
+    return port, locks, note_ons
+
+def cc_events(port):
+    """(millis, value) of each CC sent"""
+    out = []
+    for (t, data) in port.writes:
+        for j in range(0, len(data), 3):
+            if data[j] & 0xf0 == 0xB0:
+                out.append((t, data[j+2]))
+    return out
+
+def check_render():
+    seqr = StepSequencer(8, 120, lambda *a: None, lambda *a: None)
+    seqr.ccs[:] = bytes([0, cc_none, cc_none, cc_none, 120, cc_none, 60, cc_none])
+    seqr.ramps[:] = bytes([1, 0, 0, 0, 0, 0, 1, 0])
+    locks = ParamLocks(MidiOut([]), 8)
+    locks.render(seqr)
+    t = locks.table
+    span = 4 * ramp_slots
+    ok = (list(t[:span]) == [ 120 * k // span for k in range(span) ] and  # 0 up to 120 over 4 steps
+          t[span] == 120 and all(v == cc_none for v in t[span+1:6*ramp_slots]) and
+          t[6*ramp_slots] == 60 and t[8*ramp_slots-1] == 60 - 60 * (2*ramp_slots-1) // (2*ramp_slots))  # 60 down to 0
+    print("ramp table  %s" % ("ok" if ok else "FAILED %s" % list(t)))
+    return ok
+
+def check_bandwidth():
+    ok = (uart_bytes_per_sec == 3125 and
+          midi_bytes_per_sec(120_00) == 48 and  # 8 steps/sec, on & off each
+          midi_bytes_per_sec(120_00, 4, 6) == 8 * (24 + 18) and
+          midi_load_percent(300_00, 4, ramp_slots) == 20 * (24 + 18) * 100 // 3125 and
+          cc_interval_millis(120_00) == 3 and  # (1562 - 192) bytes/s left for CCs
+          cc_interval_millis(300_00, share_percent=10) == 1000)  # notes alone are over 10%
+    for tempo in (60_00, 120_00, 200_00, 300_00):
+        print("  %3d BPM: 4-note chords use %2d%% of serial MIDI, with a CC every slot %2d%%, CC cap %d ms" %
+              (tempo // 100, midi_load_percent(tempo, 4), midi_load_percent(tempo, 4, ramp_slots),
+               cc_interval_millis(tempo)))
+    print("bandwidth calculator  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_cap(tempo, share_percent):
+    steps = [ [60 + i, 100, 8, True] for i in range(8) ]
+    ccs = [0, 127] * 4  # every step ramps all the way up or down
+    (port, locks, note_ons) = run(steps, ccs, [1] * 8, tempo, share_percent, passes=8)
+    ccs_sent = cc_events(port)
+    gaps = [ b[0] - a[0] for (a, b) in zip(ccs_sent, ccs_sent[1:]) ]
+    cap = locks.min_interval_millis
+    # bytes in any one second, notes & CCs
+    times = [ t for (t, data) in port.writes for _ in range(len(data)) ]
+    worst = max(sum(1 for t in times if s <= t < s + 1000) for s in range(1000, times[-1] - 999, 50))
+    budget = uart_bytes_per_sec * share_percent // 100
+    # notes first in every write that has both
+    notes_first = all(data[0] & 0xf0 != 0xB0 for (t, data) in port.writes if any(b & 0xf0 == 0x90 for b in data[::3]))
+    (_, _, plain_ons) = run(steps, [cc_none] * 8, [0] * 8, tempo, share_percent, passes=8)
+    ok = (ccs_sent and min(gaps) >= cap and worst <= budget + 6 and notes_first and note_ons == plain_ons)
+    print("%3d BPM, %d%% share: %d CCs, cap %d ms, closest %d ms, busiest second %d of %d bytes, notes on time & first  %s" %
+          (tempo, share_percent, len(ccs_sent), cap, min(gaps), worst, budget, "ok" if ok else "FAILED"))
+    return ok
+
+def check_locks():
+    steps = [ [60, 100, 8, True] ] * 8
+    ccs = [10, cc_none, 20, 20, cc_none, cc_none, cc_none, 30]
+    (port, locks, note_ons) = run(steps, ccs, [0] * 8)
+    vals = [ v for (t, v) in cc_events(port) ]
+    # same value on the step after is dropped, locks come right after their step's note
+    on_time = all(t in note_ons for (t, v) in cc_events(port))
+    ok = vals == [10, 20, 30] * 2 and on_time
+    print("locks without ramps: %s  %s" % (vals, "ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_render()
+    ok = check_bandwidth() and ok
+    ok = check_locks() and ok
+    for (tempo, share) in ((120, 50), (300, 50), (300, 25), (200, 15)):
+        ok = check_cap(tempo, share) and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
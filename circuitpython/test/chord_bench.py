@@ -0,0 +1,51 @@
+# chord_bench.py -- host benchmark of chord step output through MidiOut
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 chord_bench.py
+# Plays 4-note chords on every 16th note at 200 BPM on a fake millisecond clock
+# and reports the message rate the sequencer needs vs what the host can push.
+
+import sys, time
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, chord_shapes, ARP_CHORD, ARP_UP
+from sequencer_midi import MidiOut
+
+uart_bytes_per_sec = 31250 // 10  # 8N1 => 10 bits per byte
+
+class FakePort:
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+    def write(self, buf):
+        self.writes += 1
+        self.bytes += len(buf)
+
+def bench(arp, tempo=200, sim_secs=60):
+    port = FakePort()
+    midi_out = MidiOut([port])
+    seqr = StepSequencer(8, tempo,
+                         lambda n,v,g,on: midi_out.note_on(1, n, v),
+                         lambda n,v,g,on: midi_out.note_off(1, n, v))
+    seqr.load_steps([ [60+i, 127, 8, True, 100, 0, 3, arp] for i in range(8) ])  # 3 == maj7
+    assert len(chord_shapes[3]) == 4
+    seqr.last_beat_millis = -seqr.beat_millis
+    seqr.playing = True
+
+    st = time.monotonic()
+    for now in range(sim_secs * 1000):  # one update per simulated millisecond
+        seqr.update(now)
+        midi_out.flush()
+    et = time.monotonic() - st
+
+    steps = sim_secs * 1000 // seqr.beat_millis
+    msgs_per_sec = midi_out.msg_count / sim_secs
+    print("%s: %d steps, %d msgs, %d writes (%.2f writes/step)" %
+          ("arp up" if arp else "chord ", steps, midi_out.msg_count, port.writes, port.writes / steps))
+    print("   needed: %.1f msgs/sec, %d bytes/sec = %.1f%% of DIN MIDI" %
+          (msgs_per_sec, port.bytes / sim_secs, 100 * port.bytes / sim_secs / uart_bytes_per_sec))
+    print("   host:   %.0f msgs/sec, %.1fx realtime" % (midi_out.msg_count / et, sim_secs / et))
+
+if __name__ == "__main__":
+    bench(ARP_CHORD)
+    bench(ARP_UP)
@@ -29,72 +29,22 @@ import usb_midi
 from sequencer import StepSequencer, ticks_ms, ticks_diff
 
 if 'macropad' in board.board_id:
-    from sequencer_display_macropad import StepSequencerDisplay
-    from sequencer_hardware_macropad import StepSequencerHardware
-    # display, encoder, encoder_switch, keys, set_led, show_leds
-    #import sequencer_hardware_macropad
+    from sequencer_display_macropad import SequencerDisplayMacroPad as StepSequencerDisplay
+    from sequencer_hardware_macropad import Hardware
 else:
-    from sequencer_display import StepSequencerDisplay
-    #from sequencer_hardware import display, encoder, encoder_switch, keys, led_set, leds_show
-    #from sequencer_hardware import Hardware
+    from sequencer_display import SequencerDisplay as StepSequencerDisplay
+    from sequencer_hardware import Hardware
 
-
-
-import board
-import busio
-import pwmio
-import rotaryio
-import keypad
-import displayio
-import adafruit_displayio_ssd1306
-
-led_pins = (board.GP0, board.GP2, board.GP4, board.GP6,
-            board.GP8, board.GP10, board.GP12, board.GP14)
-
-key_pins = (board.GP1, board.GP3, board.GP5, board.GP7,
-            board.GP9, board.GP11, board.GP13, board.GP15)
-
-encoderA_pin, encoderB_pin, encoderSW_pin = board.GP18, board.GP19, board.GP22
-
-oled_sda_pin, oled_scl_pin = board.GP20, board.GP21
-
-midi_tx_pin, midi_rx_pin = board.GP16, board.GP17
-
-# KEYS
-keys = keypad.Keys(key_pins, value_when_pressed=False, pull=True)
-step_to_key_pos = (0,1,2,3,4,5,6,7)
-
-# LEDS
-# create the objects handling those pin functions
-def make_led(p): po = pwmio.PWMOut(p, frequency=25000, duty_cycle=0); return po
-leds = [ make_led(p) for p in led_pins ]
-
-# KNOB
-encoder = rotaryio.IncrementalEncoder(encoderA_pin, encoderB_pin)
-encoder_switch = keypad.Keys((encoderSW_pin,), value_when_pressed=False, pull=True)
-
-# DISPLAY
-displayio.release_displays()
-
-dw,dh = 128,64
-oled_i2c = busio.I2C( scl=oled_scl_pin, sda=oled_sda_pin )
-display_bus = displayio.I2CDisplay(oled_i2c, device_address=0x3C)  # or 0x3D depending on display
-display = adafruit_displayio_ssd1306.SSD1306(display_bus, width=dw, height=dh)
+# same hardware setup as code.py
+hw = Hardware()
+hw.setup_display()
+(keys, encoder, encoder_switch, display) = (hw.keys, hw.encoder, hw.encoder_switch, hw.display)
+step_to_key_pos = hw.step_to_key_pos
+led_set = hw.led_set
+leds_show = hw.leds_show
 
 usb_out = usb_midi.ports[1]
 
-# # uart midi setup
-# midi_timeout = 0.01
-# uart = busio.UART(tx=midi_tx_pin, rx=midi_rx_pin, baudrate=31250) # timeout=midi_timeout)
-
-# set LED brightness to value from 0-255
-def led_set(i,v):
-    leds[i].duty_cycle = v * 256  # duty_cycle 0-65535
-
-# refresh all LEDs (if meaningful)
-def leds_show():
-    pass
-
 
 playdebug = False
 
@@ -145,7 +95,6 @@ def sequences_write():
     with open('/saved_sequences.json', 'w') as fp:
         json.dump(sequences, fp)
 
-#hardware = Hardware()
 
 seqr = StepSequencer(num_steps, tempo, play_note_on, play_note_off, playing=False)
 
@@ -153,7 +102,7 @@ sequences_read()
 
 seqr_display = StepSequencerDisplay(seqr)
 #display.rotation = seqr_display.rotation
-display.show(seqr_display)
+display.root_group = seqr_display
 
 sequence_load(0)
 
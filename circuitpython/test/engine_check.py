@@ -0,0 +1,114 @@
+# engine_check.py -- check the CircuitPython sequencer engine against the reference model
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Runs scripted scenarios through tools/sequencer_model.py (the golden model,
+# in microseconds) and sequencer.py's StepSequencer (on a fake millisecond
+# clock), and checks they play the same notes at the same times.
+#
+# Run on the host: python3 engine_check.py [-v]
+
+import sys
+sys.path.insert(0, "../picostepseq")
+sys.path.insert(0, "../tools")
+
+from sequencer import StepSequencer, rate_ticks, rate_names
+from sequencer_model import ReferenceSequencer
+
+steps8 = [ [60, 100, 8, True], [62, 90, 4, True], [64, 80, 15, True], [65, 70, 1, True],
+           [67, 100, 12, True], [69, 110, 8, False], [71, 120, 2, True], [72, 127, 14, True] ]
+
+def clocks(start, interval, count):
+    """MIDI clock pulses every interval millis"""
+    return [ (start + k * interval, "midi_clock") for k in range(count) ]
+
+# (name, steps, tempo_centi, end millis, script of (millis, action, args...))
+scenarios = [
+    ("play 120 bpm", steps8, 120_00, 6000,
+     [ (1000, "play") ]),
+    ("fractional tempo 133.33", steps8, 133_33, 20000,
+     [ (1000, "play") ]),
+    ("slow & fast tempos", steps8, 20_00, 8000,
+     [ (1000, "play"), (4010, "tempo", 300_00), (6003, "tempo", 97_50) ]),
+    ("tempo changes mid-step", steps8, 100_00, 8000,
+     [ (1000, "play"), (1777, "tempo", 160_00), (3333, "tempo", 87_00), (5001, "tempo", 171_11) ]),
+    ("transpose & mutes", steps8, 140_00, 6000,
+     [ (1000, "play"), (1900, "transpose", 7), (2500, "step", 2, [64, 80, 15, False]),
+       (3100, "transpose", -12), (3700, "step", 5, [69, 110, 8, True]) ]),
+    ("pause, cont, stop, play", steps8, 120_00, 9000,
+     [ (1000, "play"), (1800, "pause"), (2500, "cont"), (3321, "pause"), (3330, "cont"),
+       (4400, "stop"), (5000, "play"), (6100, "stop"), (6102, "play") ]),
+    ("MIDI clock 125 bpm", steps8, 100_00, 6000,
+     [ (1000, "midi_start") ] + clocks(1005, 20, 200) + [ (5100, "stop") ]),
+    ("MIDI clock tempo change", steps8, 100_00, 9000,
+     [ (1000, "midi_start") ] + clocks(1002, 20, 96) + clocks(1002 + 96 * 20, 25, 96) +
+     [ (5300, "stop") ]),
+    ("rate 1/16T, 1/32, 1/2", steps8, 120_00, 9000,
+     [ (1000, "rate", rate_names.index("1/16T")), (1000, "play"), (3000, "stop"),
+       (3500, "rate", rate_names.index("1/32")), (3500, "play"), (5000, "stop"),
+       (5500, "rate", rate_names.index("1/2")), (5500, "play"), (8000, "stop") ]),
+    ("rate changes mid-step", steps8, 133_33, 9000,
+     [ (1000, "play"), (1420, "rate", rate_names.index("1/8T")), (2333, "rate", rate_names.index("1/4")),
+       (3100, "tempo", 97_00), (3917, "rate", rate_names.index("1/32T")), (4600, "rate", rate_names.index("1/16")),
+       (5250, "rate", rate_names.index("1/1")), (7000, "pause"), (7300, "cont") ]),
+    ("MIDI clock 1/8T, then 1/4", steps8, 100_00, 6000,
+     [ (1000, "rate", rate_names.index("1/8T")), (1000, "midi_start") ] + clocks(1005, 20, 100) +
+     [ (3005, "rate", rate_names.index("1/4")) ] + clocks(3005, 20, 100) + [ (5100, "stop") ]),
+]
+
+def run_model(steps, tempo_centi, end, script):
+    seqr = ReferenceSequencer(steps, tempo_centi)
+    for (t, action, *args) in script:
+        now = t * 1000
+        if action == "tempo":       seqr.set_tempo_centi(args[0], now)
+        elif action == "rate":      seqr.set_rate(rate_ticks[args[0]], now)
+        elif action == "transpose": seqr.set_transpose(args[0], now)
+        elif action == "step":      seqr.set_step(args[0], args[1], now)
+        else:                       getattr(seqr, action)(now)
+    seqr.advance(end * 1000)
+    return [ (t // 1000, status, note, vel) for (t, status, note, vel) in seqr.out ]
+
+def run_engine(steps, tempo_centi, end, script):
+    out = []
+    def note_on(note, vel, gate, on):
+        if on: out.append((t, 0x90, note, vel))
+    def note_off(note, vel, gate, on):
+        if on: out.append((t, 0x80, note, vel))
+    seqr = StepSequencer(len(steps), 120, note_on, note_off)
+    seqr.set_tempo_centi(tempo_centi)
+    seqr.load_steps(steps)
+    k = 0
+    for t in range(script[0][0], end + 1):
+        while k < len(script) and script[k][0] == t:
+            (_, action, *args) = script[k]
+            if action == "play":          seqr.play(now=t)
+            elif action == "cont":        seqr.cont(now=t)
+            elif action == "pause":       seqr.pause()
+            elif action == "stop":        seqr.stop()
+            elif action == "midi_start":  seqr.midi_start(t)
+            elif action == "midi_clock":  seqr.midi_clock(t)
+            elif action == "tempo":       seqr.set_tempo_centi(args[0])
+            elif action == "rate":        seqr.set_rate(args[0], now=t)
+            elif action == "transpose":   seqr.transpose = args[0]
+            elif action == "step":        seqr.steps[args[0]] = tuple(args[1])
+            k += 1
+        seqr.update(t)
+    return out
+
+def check(verbose=False):
+    ok = True
+    for (name, steps, tempo_centi, end, script) in scenarios:
+        want = run_model(steps, tempo_centi, end, script)
+        got = run_engine(steps, tempo_centi, end, script)
+        bad = [ k for k in range(max(len(want), len(got)))
+                if k >= len(want) or k >= len(got) or want[k] != got[k] ]
+        print("%-26s %4d notes  %s" % (name, len(want), "ok" if not bad else "FAILED"))
+        for k in bad[:5 if not verbose else len(bad)]:
+            print("   #%d model %s  engine %s" % (k, want[k] if k < len(want) else None,
+                                                  got[k] if k < len(got) else None))
+        ok = ok and not bad
+    return ok
+
+if __name__ == "__main__":
+    ok = check("-v" in sys.argv)
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
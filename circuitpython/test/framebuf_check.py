@@ -0,0 +1,162 @@
+# framebuf_check.py -- check the framebuffer display draws right and sends only what changed
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Drives sequencer_display_fb.py against a fake I2C bus with a fake SSD1306
+# on it that keeps its own copy of the screen from the commands & data sent.
+# Checks the framebuffer has the right pixels, the fake screen ends up the same
+# as the framebuffer, and how many bytes each kind of UI update costs.
+#
+# Run on the host: python3 framebuf_check.py
+
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer
+from sequencer_display_fb import *
+
+class FakeSSD1306:
+    """An I2C bus with an SSD1306 on it, in horizontal addressing mode"""
+    def __init__(self):
+        self.ram = bytearray(num_pages * dw)
+        self.writes = []  # bytes on the wire per write, address byte included
+        self.window = (0, dw - 1, 0, num_pages - 1)
+        self.locked = False
+
+    def try_lock(self):
+        self.locked = True
+        return True
+
+    def writeto(self, address, buf, start=0, end=None):
+        assert self.locked and address == oled_address
+        data = bytes(buf[start:end])
+        self.writes.append(1 + len(data))
+        if data[0] == CTRL_CMD:
+            cmds = data[1:]
+            k = 0
+            while k < len(cmds):
+                if cmds[k] == 0x21:
+                    self.window = (cmds[k+1], cmds[k+2]) + self.window[2:]
+                    k += 3
+                elif cmds[k] == 0x22:
+                    self.window = self.window[:2] + (cmds[k+1], cmds[k+2])
+                    k += 3
+                else:
+                    k += 1
+        else:
+            assert data[0] == CTRL_DATA
+            (c0, c1, p0, p1) = self.window
+            (col, page) = (c0, p0)
+            for b in data[1:]:
+                self.ram[page * dw + col] = b
+                col += 1
+                if col > c1:
+                    (col, page) = (c0, page + 1 if page < p1 else p0)
+
+    def sent(self):
+        """Bytes on the wire since last asked"""
+        n = sum(self.writes)
+        self.writes.clear()
+        return n
+
+def flush_all(fbd, oled, max_bytes=128):
+    """Flush until clean, returns (bytes on the wire, passes)"""
+    passes = 0
+    while fbd.flush(max_bytes):
+        passes += 1
+    return oled.sent(), passes
+
+def make(num_steps=8):
+    seqr = StepSequencer(num_steps, 120, lambda *a: None, lambda *a: None)
+    seqr.load_steps([ [60 + i, 100, 8, True] for i in range(num_steps) ])
+    seqr.set_tempo_centi(120_00)
+    oled = FakeSSD1306()
+    fbd = FramebufDisplay(seqr, oled)
+    oled.sent()  # not counting the init commands
+    return seqr, oled, fbd
+
+def column(fbd, page, x):
+    return fbd.buf[1 + page * dw + x]
+
+def check_pixels():
+    (seqr, oled, fbd) = make()
+    fbd.update_ui_all()
+    (full, passes) = flush_all(fbd, oled)
+    ok = bytes(oled.ram) == bytes(fbd.buf[1:])
+    # step 0 is note 60: a tall "C", octave "3" (octaves start at -2), gate 8 of 16 is an 8 pixel bar
+    c = ord("C") - 32
+    ok = ok and all(column(fbd, note_page, j) | column(fbd, note_page + 1, j) << 8 == tall_bits[font5x7[c*5 + j]]
+                    for j in range(5))
+    ok = ok and [ column(fbd, oct_page, oct_x + j) for j in range(5) ] == list(font5x7[(ord("3")-32)*5:][:5])
+    w = 1 + 8 * gate_bar_width // 16
+    ok = ok and [ column(fbd, gate_page, j) for j in range(gate_bar_width) ] == [gate_bar_bits] * w + [0] * (gate_bar_width - w)
+    # step 1 is C#
+    ok = ok and column(fbd, note_page, step_width + char_width + 1) == tall_bits[font5x7[(ord("#")-32)*5 + 1]] & 0xff
+    print("full screen: %d bytes in %d passes, pixels right, display matches framebuffer  %s" %
+          (full, passes, "ok" if ok else "FAILED"))
+    return ok
+
+def check_updates():
+    (seqr, oled, fbd) = make()
+    fbd.update_ui_all()
+    flush_all(fbd, oled)
+    ok = True
+    costs = []
+    def cost(name, func, most):
+        nonlocal ok
+        func()
+        (n, _) = flush_all(fbd, oled)
+        good = n <= most and bytes(oled.ram) == bytes(fbd.buf[1:])
+        ok = ok and good
+        costs.append("  %-28s %4d bytes  %s" % (name, n, "ok" if good else "FAILED, want <= %d" % most))
+    cost("same step again", lambda: fbd.update_ui_step(0, 60, 100, 8, True), 0)
+    cost("same seqno again", lambda: fbd.update_ui_seqno(), 0)
+    cost("step note C -> D", lambda: fbd.update_ui_step(0, 62, 100, 8, True), 2 * (12 + transfer_overhead))
+    cost("step selected", lambda: fbd.update_ui_step(0, 62, 100, 8, True, True), 5 + transfer_overhead)
+    cost("step gate 8 -> 12", lambda: fbd.update_ui_step(0, 62, 100, 12, True, True), 14 + transfer_overhead)
+    seqr.transpose = 3
+    cost("transpose", fbd.update_ui_transpose, 18 + transfer_overhead)
+    seqr.set_tempo_centi(121_00)
+    cost("bpm 120 -> 121", fbd.update_ui_bpm, 6 + transfer_overhead)
+    cost("message", lambda: fbd.update_ui_seqno("TAP TEMPO"), dw + transfer_overhead)
+    for line in costs: print(line)
+    print("update costs  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_chunks():
+    (seqr, oled, fbd) = make()
+    fbd.update_ui_all()
+    budget = bytes_for_millis(1)  # about what fits in a millisecond of 400 kHz I2C
+    most = 0
+    passes = 0
+    while True:
+        n = fbd.flush(budget)
+        if not n: break
+        passes += 1
+        most = max(most, oled.sent())
+    ok = most <= budget and not fbd.is_dirty() and bytes(oled.ram) == bytes(fbd.buf[1:])
+    print("full screen in %d byte pieces: %d passes, most %d bytes a pass  %s" %
+          (budget, passes, most, "ok" if ok else "FAILED"))
+    return ok
+
+def check_stopped():
+    """Before play there's no current step to draw, with any number of steps"""
+    ok = True
+    for num_steps in (4, 8):
+        (seqr, oled, fbd) = make(num_steps)
+        fbd.update_ui_all()
+        flush_all(fbd, oled)
+        try:
+            fbd.update_ui_step()
+            ok = ok and not fbd.is_dirty() and len(fbd.step_cache) == 3 * num_steps
+        except (ValueError, IndexError):
+            ok = False
+    print("no current step before play  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_pixels()
+    ok = check_updates() and ok
+    ok = check_chunks() and ok
+    ok = check_stopped() and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
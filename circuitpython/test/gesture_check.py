@@ -0,0 +1,109 @@
+# gesture_check.py -- host check of sequencer_input gestures with scripted events
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 gesture_check.py
+
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer_input import *
+
+# scripted events: (millis, "key"|"sw"|"turn"|"tick", args...)
+def run(script):
+    """Feed a script of events to Gestures, return list of (cmd,a,b) it made"""
+    cmds = CommandQueue()
+    g = Gestures(cmds)
+    out = []
+    for ev in script:
+        t, kind = ev[0] + 1000, ev[1]  # 0 millis means "not pushed" to Gestures
+        if kind == "key":    g.key(ev[2], ev[3], t)
+        elif kind == "sw":   g.encoder_switch(ev[2], t)
+        elif kind == "turn": g.encoder_turn(ev[2], t)
+        g.tick(t)
+        cmd = cmds.get()
+        while cmd:
+            out.append((cmd, cmds.a, cmds.b))
+            cmd = cmds.get()
+    return out
+
+def check(name, script, expected):
+    got = run(script)
+    print("%-28s %s" % (name, "ok" if got == expected else "FAIL"))
+    if got != expected:
+        print("   expected:", expected)
+        print("   got:     ", got)
+    return got == expected
+
+checks = [
+    ("encoder tap = play/pause",
+     [(0,"sw",True), (100,"sw",False)],
+     [(CMD_PLAY_TOGGLE,0,0)]),
+    ("encoder long press = nothing",
+     [(0,"sw",True), (500,"sw",False)],
+     []),
+    ("turn = transpose",
+     [(0,"turn",2), (5,"turn",-1)],
+     [(CMD_TRANSPOSE,2,0), (CMD_TRANSPOSE,-1,0)]),
+    ("push+turn = tempo, no toggle",
+     [(0,"sw",True), (50,"turn",3), (100,"sw",False)],
+     [(CMD_TEMPO,9,0)]),
+    ("key tap = down/up",
+     [(0,"key",2,True), (80,"key",2,False)],
+     [(CMD_KEY_DOWN,2,0), (CMD_KEY_UP,2,0)]),
+    ("key hold+turn = note edit",
+     [(0,"key",1,True), (50,"turn",1), (90,"key",1,False)],
+     [(CMD_KEY_DOWN,1,0), (CMD_EDIT_NOTE,1,1), (CMD_KEY_UP,1,1)]),
+    ("slow tempo turn = 1 per detent",
+     [(0,"sw",True), (50,"turn",1), (100,"turn",-1), (150,"sw",False)],
+     [(CMD_TEMPO,1,0), (CMD_TEMPO,-1,0)]),
+    ("key hold+push+turn = gate",
+     [(0,"key",1,True), (20,"sw",True), (50,"turn",-2), (60,"sw",False), (90,"key",1,False)],
+     [(CMD_KEY_DOWN,1,0), (CMD_EDIT_GATE,1,-2), (CMD_KEY_UP,1,1)]),
+    ("key hold+enc tap = vel edit",
+     [(0,"key",4,True), (20,"sw",True), (60,"sw",False), (80,"turn",5), (99,"key",4,False)],
+     [(CMD_KEY_DOWN,4,0), (CMD_EDIT_FIELD,4,1), (CMD_EDIT_NOTE+1,4,20), (CMD_KEY_UP,4,1)]),
+    ("enc push+key tap = load",
+     [(0,"sw",True), (20,"key",3,True), (60,"key",3,False), (80,"sw",False)],
+     [(CMD_LOAD,3,0)]),
+    ("enc push+key hold = save",
+     [(0,"sw",True), (20,"key",5,True), (1100,"tick"), (1200,"key",5,False), (1300,"sw",False)],
+     [(CMD_SAVE_ARMED,5,0), (CMD_SAVE,5,0)]),
+    ("hold enc = tap tempo mode",
+     [(0,"sw",True), (1100,"tick"), (1200,"sw",False),
+      (1500,"sw",True), (1550,"sw",False), (2000,"sw",True), (2050,"sw",False),
+      (2500,"sw",True), (2550,"sw",False), (2800,"sw",True), (2850,"sw",False),  # 300ms outlier
+      (3300,"sw",True), (3350,"sw",False), (5500,"tick")],
+     [(CMD_TAP_MODE,1,0), (CMD_TAP_TEMPO,12000,0), (CMD_TAP_TEMPO,12000,0),
+      (CMD_TAP_TEMPO,12000,0), (CMD_TAP_MODE,0,0)]),
+    ("tap tempo too fast = max",  # 150ms taps would be 400 BPM
+     [(0,"sw",True), (1100,"tick"), (1200,"sw",False),
+      (1500,"sw",True), (1520,"sw",False), (1650,"sw",True), (1670,"sw",False),
+      (1800,"sw",True), (1820,"sw",False)],
+     [(CMD_TAP_MODE,1,0), (CMD_TAP_TEMPO,tempo_max_centi,0)]),
+    ("overlapping key taps",
+     [(0,"key",0,True), (10,"key",1,True), (20,"key",0,False), (30,"key",1,False)],
+     [(CMD_KEY_DOWN,0,0), (CMD_KEY_DOWN,1,0), (CMD_KEY_UP,0,0), (CMD_KEY_UP,1,0)]),
+]
+
+def check_tap_restart():
+    """Taps after a pause start over, the taps from before it left out"""
+    tt = TapTempo()
+    got = [ tt.tap(t) for t in (1000, 1500, 2000, 2500, 5000, 5250, 5500) ]
+    ok = got == [0, 0, 12000, 12000, 0, 0, 24000]
+    print("%-28s %s" % ("tap tempo pause starts over", "ok" if ok else "FAIL %s" % got))
+    return ok
+
+def check_in_range():
+    """With 4 steps, keys 4-7 do nothing to steps, but still load & save slots 4-7"""
+    got = [ command_in_range(cmd, 5, 4, 8) for cmd in
+            (CMD_KEY_DOWN, CMD_KEY_UP, CMD_EDIT_FIELD, CMD_EDIT_GATE, CMD_EDIT_NOTE, CMD_EDIT_NOTE + 3,
+             CMD_LOAD, CMD_SAVE, CMD_SAVE_ARMED, CMD_TRANSPOSE) ]
+    ok = (got == [False] * 6 + [True] * 4 and command_in_range(CMD_KEY_DOWN, 3, 4, 8) and
+          not command_in_range(CMD_LOAD, 8, 4, 8))
+    print("%-28s %s" % ("steps past num_steps", "ok" if ok else "FAIL %s" % got))
+    return ok
+
+if __name__ == "__main__":
+    results = [check(*c) for c in checks] + [check_tap_restart(), check_in_range()]
+    print("%d/%d ok" % (sum(results), len(results)))
+    sys.exit(0 if all(results) else 1)
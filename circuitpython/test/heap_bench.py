@@ -0,0 +1,77 @@
+# heap_bench.py -- check HeapMonitor only collects in gaps between steps, and report its numbers
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Runs the sequencer in virtual time, a main loop pass per millisecond, with a
+# fake gc module: each pass allocates some bytes, and a collection really takes
+# a while (busy waits) so HeapMonitor's timing has something to measure. Counts
+# collections that would still be running when the sequencer next needs the CPU,
+# for HeapMonitor and for the old gc.collect() on every pass.
+#
+# Run on the host: python3 heap_bench.py
+
+import sys
+import time
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer
+from sequencer_heap import HeapMonitor
+
+class FakeGC:
+    """Heap that fills by alloc() and empties by collect(), which takes pause_usecs"""
+    def __init__(self, heap_size=100_000, live=40_000, pause_usecs=1500):
+        self.heap_size = heap_size
+        self.live = live
+        self.used = live
+        self.pause_usecs = pause_usecs
+
+    def mem_free(self):
+        return self.heap_size - self.used
+
+    def alloc(self, n):
+        self.used = min(self.used + n, self.heap_size)
+
+    def collect(self):
+        end = time.perf_counter() + self.pause_usecs / 1e6
+        while time.perf_counter() < end:
+            pass
+        self.used = self.live
+
+def run(bars=4, tempo=120, alloc_per_pass=48, pause_usecs=1500):
+    fake_gc = FakeGC(pause_usecs=pause_usecs)
+    heap = HeapMonitor(gc_module=fake_gc)
+    seqr = StepSequencer(8, tempo, lambda *a: None, lambda *a: None)
+    seqr.load_steps([ [60 + i, 100, 4 + i, True] for i in range(8) ])
+    pause_millis = (pause_usecs + 999) // 1000
+    (late, old_late, passes) = (0, 0, 0)
+    now = 1000
+    seqr.play(now=now)
+    end = now + bars * 16 * seqr.beat_millis
+    while now < end:
+        passes += 1
+        seqr.update(now)
+        fake_gc.alloc(alloc_per_pass)
+        idle = seqr.idle_millis(now)
+        if idle < pause_millis:
+            old_late += 1  # gc.collect() every pass would've run into what's due
+        if heap.update(seqr, now):
+            if idle < pause_millis:
+                late += 1
+            now += pause_millis
+        now += 1
+    return heap, late, old_late, passes
+
+if __name__ == "__main__":
+    (heap, late, old_late, passes) = run()
+    heap.report()
+    steps = 4 * 16
+    ok = (heap.collections >= steps - 1 and heap.collections <= steps and late == 0 and heap.forced == 0 and
+          heap.worst_pause_usecs >= 1500 and heap.min_free > 0 and heap.alloc_rate > 0)
+    print("%d passes, %d steps: %d collections, %d ran into a due step or note off (gc every pass: %d collections, %d would)" %
+          (passes, steps, heap.collections, late, passes, old_late))
+    # a heap too small to wait for the next step still gets collected
+    (heap, late, old_late, passes) = run(bars=1, alloc_per_pass=2000)
+    ok2 = heap.forced > 0 and heap.min_free >= 0
+    print("small heap: %d forced collections  %s" % (heap.forced, "ok" if ok2 else "FAILED"))
+    ok = ok and ok2
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
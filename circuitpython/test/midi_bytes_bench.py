@@ -0,0 +1,88 @@
+# midi_bytes_bench.py -- host byte count of serial MIDI out, full messages vs running status
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Plays single notes, chords, arps and CC ramps on a fake millisecond clock
+# through MidiOut, with a USB port getting full 3-byte messages and a serial
+# port getting running status & velocity 0 note offs. Decodes what the serial
+# port got like a synth would and checks it's the same notes & CCs, and that
+# a receiver that starts listening partway through is back in step within
+# status_refresh writes. Prints bytes and wire time at 31250 baud for each.
+#
+# Run on the host: python3 midi_bytes_bench.py
+
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, ARP_CHORD, ARP_UP
+from sequencer_midi import MidiOut
+from sequencer_cc import ParamLocks, uart_bytes_per_sec
+
+class FakePort:
+    def __init__(self):
+        self.data = bytearray()
+        self.writes = []
+    def write(self, buf):
+        self.data += buf
+        self.writes.append(bytes(buf))
+
+def decode(writes):
+    """Messages in writes as (status, d1, d2), running status kept from write to write
+    like a synth would, note on velocity 0 as a note off"""
+    msgs = []
+    running = 0
+    for data in writes:
+        j = 0
+        while j < len(data):
+            if data[j] & 0x80:
+                running = data[j]
+                j += 1
+            (status, d1, d2) = (running, data[j], data[j+1])
+            j += 2
+            msgs.append((status & 0xef, d1, 0) if status & 0xf0 in (0x80, 0x90) and (status & 0xf0 == 0x80 or d2 == 0)
+                        else (status, d1, d2))
+    return msgs
+
+def full_as_decoded(data):
+    """Full 3-byte messages, note offs' velocity dropped, to compare with decode()"""
+    return [ (data[j] & 0xef, data[j+1], 0) if data[j] & 0xf0 == 0x80 else tuple(data[j:j+3])
+             for j in range(0, len(data), 3) ]
+
+def bench(name, chord, arp, ccs=None, tempo=120, sim_secs=60):
+    (usb, serial) = (FakePort(), FakePort())
+    midi_out = MidiOut([usb], serial_ports=[serial])
+    seqr = StepSequencer(8, tempo, lambda n,v,g,on: midi_out.note_on(1, n, v),
+                         lambda n,v,g,on: midi_out.note_off(1, n, 64))
+    seqr.load_steps([ [60+i, 100, 8, True, 100, 0, chord, arp] for i in range(8) ])
+    locks = None
+    if ccs:
+        seqr.ccs[:] = bytes(ccs)
+        seqr.ramps[:] = bytes([1] * 8)
+        locks = ParamLocks(midi_out, 8)
+    seqr.play(now=0)
+    for now in range(sim_secs * 1000):
+        seqr.update(now)
+        if locks: locks.update(seqr, 1, now)
+        midi_out.flush()
+    steps = sim_secs * 1000 // seqr.beat_millis
+    ok = (decode(serial.writes) == full_as_decoded(usb.data) and len(serial.writes) == len(usb.writes) and
+          midi_out.serial_byte_count == len(serial.data) and midi_out.byte_count == len(usb.data))
+    # a receiver listening from write 100 on gets a status byte within status_refresh writes
+    w = next(k for k in range(100, len(serial.writes)) if serial.writes[k][0] & 0x80)
+    ok = ok and w - 100 < midi_out.status_refresh and decode(serial.writes[w:]) == full_as_decoded(b"".join(usb.writes[w:]))
+    saved = 100 - 100 * len(serial.data) // len(usb.data)
+    print("%-22s %6d msgs, %6d -> %6d bytes (%2d%% less), %.2f -> %.2f ms/step on the wire  %s" %
+          (name, midi_out.msg_count, len(usb.data), len(serial.data), saved,
+           1000 * len(usb.data) / steps / uart_bytes_per_sec, 1000 * len(serial.data) / steps / uart_bytes_per_sec,
+           "ok" if ok else "FAILED"))
+    return ok, saved
+
+if __name__ == "__main__":
+    ok = True
+    for (name, chord, arp, ccs, least) in (("single notes", 0, ARP_CHORD, None, 32),
+                                           ("4-note chords", 3, ARP_CHORD, None, 32),
+                                           ("4-note arp up", 3, ARP_UP, None, 32),
+                                           ("chords + CC ramps", 3, ARP_CHORD, [0, 127] * 4, 20)):
+        (good, saved) = bench(name, chord, arp, ccs)
+        ok = ok and good and saved >= least
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,149 @@
+# notes_check.py -- check no note is left hanging and no note off is sent twice
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Plays the sequencer through MidiOut like code.py does, on a fake millisecond
+# clock, while randomly transposing, muting, changing chords, gates, channels &
+# patterns, and stopping, pausing and playing. Then follows the MIDI that came
+# out like a synth would: every note off must be for a note that's on, and
+# after a stop or pause nothing may be left on.
+#
+# Run on the host: python3 notes_check.py
+
+import random
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, chord_shapes, arp_names
+from sequencer_midi import MidiOut
+
+class FakePort:
+    def __init__(self):
+        self.data = bytearray()
+    def write(self, buf):
+        self.data += buf
+
+class Synth:
+    """Follows 3-byte MIDI messages, counting note offs for notes that aren't on"""
+    def __init__(self):
+        self.on = set()
+        self.stray_offs = 0
+        self.pos = 0
+
+    def follow(self, data):
+        while self.pos < len(data):
+            (status, note, vel) = data[self.pos:self.pos+3]
+            self.pos += 3
+            key = (status & 0x0f, note)
+            if status & 0xf0 == 0x90 and vel:
+                self.on.add(key)
+            elif status & 0xf0 in (0x80, 0x90):
+                if key in self.on: self.on.remove(key)
+                else: self.stray_offs += 1
+            elif status & 0xf0 == 0xB0 and note == 123:
+                self.on = { k for k in self.on if k[0] != status & 0x0f }
+
+class Device:
+    """The note parts of code.py"""
+    def __init__(self):
+        self.port = FakePort()
+        self.midi_out = MidiOut([self.port])
+        self.chan = 1
+        self.seqr = StepSequencer(8, 150, self.play_note_on, self.play_note_off)
+
+    def play_note_on(self, note, vel, gate, on):
+        if not on: return
+        self.midi_out.note_on(self.chan, note, vel)
+
+    def play_note_off(self, note, vel, gate, on):
+        self.midi_out.release(note, vel)
+
+    def notes_stop(self):
+        self.seqr.release_voices()
+        self.midi_out.all_notes_off()
+
+def random_steps():
+    return [ [random.randint(40, 90), 100, random.randint(1, 15), random.random() < 0.7, 100, 0,
+              random.randrange(len(chord_shapes)), random.randrange(len(arp_names))] for _ in range(8) ]
+
+def check_fuzz(seed, secs=60):
+    random.seed(seed)
+    dev = Device()
+    (seqr, midi_out) = (dev.seqr, dev.midi_out)
+    seqr.load_steps(random_steps())
+    synth = Synth()
+    hung_after_stop = 0
+    now = 1000
+    seqr.play(now=now)
+    for now in range(1000, 1000 + secs * 1000):
+        r = random.random()
+        if r < 0.002:   seqr.transpose = random.randint(-12, 12)
+        elif r < 0.004: seqr.steps[random.randrange(8)] = (random.randint(40, 90), 100, random.randint(1, 15), random.random() < 0.5)
+        elif r < 0.005: seqr.chords[random.randrange(8)] = random.randrange(len(chord_shapes))
+        elif r < 0.006: dev.chan = random.randint(1, 16)  # sequence's channel changed mid-note
+        elif r < 0.007: seqr.queue_op(StepSequencer.load_steps, random_steps())  # pattern change
+        elif r < 0.0075:
+            (seqr.stop if random.random() < 0.5 else seqr.pause)()
+            dev.notes_stop()
+            midi_out.flush()
+            synth.follow(dev.port.data)
+            hung_after_stop += len(synth.on)
+        elif r < 0.0085 and not seqr.playing:
+            seqr.cont(now=now)
+        seqr.update(now)
+        midi_out.flush()
+    dev.notes_stop()
+    midi_out.flush()
+    synth.follow(dev.port.data)
+    ok = synth.stray_offs == 0 and hung_after_stop == 0 and not synth.on and midi_out.offs_dropped > 0
+    print("fuzz seed %d: %d msgs, %d offs not needed & dropped, %d stray offs, %d hung after stop  %s" %
+          (seed, midi_out.msg_count, midi_out.offs_dropped, synth.stray_offs, hung_after_stop + len(synth.on),
+           "ok" if ok else "FAILED"))
+    return ok
+
+def check_exact():
+    dev = Device()
+    midi_out = dev.midi_out
+    # a long note still sounding, stop ends it now with just its own note off
+    dev.seqr.load_steps([ [60, 100, 15, True, 100, 0, 1, 0] ] + [ [62, 100, 8, False] ] * 7)  # maj chord
+    dev.seqr.play(now=1000)
+    dev.seqr.update(1010)
+    midi_out.flush()
+    n = len(dev.port.data)
+    dev.seqr.stop()
+    dev.notes_stop()
+    midi_out.flush()
+    offs = dev.port.data[n:]
+    ok = sorted(offs[1::3]) == [60, 64, 67] and all(s == 0x80 for s in offs[::3])
+    for t in range(1010, 1200):  # their gates coming up later sends nothing more
+        dev.seqr.update(t)
+    midi_out.flush()
+    ok = ok and len(dev.port.data) == n + 9
+    # a note off for a note on another channel goes to that channel
+    midi_out.note_on(3, 50, 100)
+    ok = ok and midi_out.release(50) == 3 and midi_out.release(50) == 0 and not midi_out.is_on(3, 50)
+    print("stop sends exactly the note offs needed, release finds the channel  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_panic():
+    ok = True
+    for notes in (1, 128):
+        port = FakePort()
+        midi_out = MidiOut([port])
+        for chan in (1, 5, 10):
+            for note in range(notes):
+                midi_out.note_on(chan, note, 100)
+        midi_out.flush()
+        n = len(port.data)
+        midi_out.panic()
+        midi_out.flush()
+        ok = ok and len(port.data) - n == 3 * 3 and not any(midi_out.active) and midi_out.active_chans == 0
+    print("panic is one All Notes Off per channel in use, for 1 or 128 notes  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_exact()
+    ok = check_panic() and ok
+    for seed in (1, 2, 3):
+        ok = check_fuzz(seed) and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,139 @@
+# pattern_bench.py -- host check & timing of sequencer_patterns ops on a 64-step pattern
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 pattern_bench.py
+
+import sys, time
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, max_pending_ops
+import sequencer_patterns as ops
+from sequencer_cc import ParamLocks
+from sequencer_midi import MidiOut
+
+num_steps = 64
+
+def make_seqr(count=num_steps):
+    seqr = StepSequencer(count, 120, lambda *a: None, lambda *a: None, seed=1234)
+    seqr.load_steps([ [36+i, 100, 1 + i % 15, i % 3 != 0, i, i % 10, i % 9, i % 3] for i in range(count) ])
+    return seqr
+
+def notes(seqr):
+    return [s[0] for s in seqr.steps]
+
+def check():
+    ok = True
+    def expect(name, got, want):
+        nonlocal ok
+        if got != want:
+            print("FAIL", name, got, want)
+            ok = False
+
+    seqr = make_seqr(8)
+    ops.rotate(seqr, 3)
+    expect("rotate notes", notes(seqr), [41,42,43,36,37,38,39,40])
+    expect("rotate probs", list(seqr.probs), [5,6,7,0,1,2,3,4])
+    ops.rotate(seqr, -3)
+    expect("rotate back", notes(seqr), list(range(36,44)))
+
+    ops.reverse(seqr)
+    expect("reverse", notes(seqr), list(range(43,35,-1)))
+    expect("reverse conds", list(seqr.conds), [7,6,5,4,3,2,1,0])
+    ops.reverse(seqr)
+
+    seqr = make_seqr(8)  # shortened, steps not played stay out of it
+    seqr.length = 5
+    ops.reverse(seqr)
+    expect("reverse length 5", notes(seqr), [40, 39, 38, 37, 36, 41, 42, 43])
+    ops.reverse(seqr)
+    ops.rotate(seqr, 2)
+    expect("rotate length 5", notes(seqr), [39, 40, 36, 37, 38, 41, 42, 43])
+    expect("rotate length 5 probs", list(seqr.probs), [3, 4, 0, 1, 2, 5, 6, 7])
+
+    ons = [s[3] for s in seqr.steps]
+    ops.invert_mutes(seqr)
+    expect("invert mutes", [s[3] for s in seqr.steps], [not on for on in ons])
+
+    ops.random_fill(seqr, "pentatonic", root=48, octaves=2)
+    expect("random fill in scale", all((n-48) % 12 in ops.scales["pentatonic"] and 48 <= n < 72
+                                       for n in notes(seqr)), True)
+    seqr2 = make_seqr(8)
+    ops.random_fill(seqr2, "pentatonic", root=48, octaves=2)
+    expect("random fill repeatable", notes(seqr2), notes(seqr))
+
+    seqr = make_seqr(8)
+    seqr.length = 3
+    expect("double length adds", ops.double_length(seqr), 3)
+    expect("double length", notes(seqr), [36, 37, 38, 36, 37, 38, 42, 43])
+    expect("double length params", list(seqr.arps[:6]), [0, 1, 2, 0, 1, 2])
+    expect("double length, only as far as step_count", (ops.double_length(seqr), seqr.length), (2, 8))
+    expect("double length, no room", ops.double_length(seqr), 0)
+    expect("double length never grows", (seqr.step_count, len(seqr.steps), len(seqr.arps)), (8, 8, 8))
+    locks = ParamLocks(MidiOut([]), 8)  # sized to step_count, like code.py's
+    seqr.length = 4
+    seqr.play(now=1000)
+    for t in range(1000, 3000):
+        if t == 1300: seqr.queue_op(ops.double_length)
+        seqr.update(t)
+        locks.update(seqr, 1, t)  # IndexError if the pattern outgrew it
+    expect("CC locks follow a doubled pattern", seqr.length, 8)
+
+    sequences = [ [[n, 127, 8, True]] * 8 for n in range(8) ]
+    ops.copy_slot(sequences, 2, 5)
+    expect("copy slot", sequences[5], sequences[2])
+
+    # queued ops wait for the next bar downbeat when playing, in order, none dropped
+    def play_steps(seqr, t, n):  # update() until n more steps have fired, returns the time
+        while n:
+            t += 1
+            i = seqr.i
+            seqr.update(t)
+            n -= seqr.i != i
+        return t
+    seqr = make_seqr(8)
+    seqr.length = 6  # so passes and bars don't line up
+    seqr.play(now=1000)
+    seqr.queue_op(ops.rotate, 1)
+    seqr.queue_op(ops.reverse)
+    t = play_steps(seqr, 1000, 8)  # past the start of pass 2
+    expect("queued, not yet", (seqr.i, notes(seqr)[0]), (2, 36))
+    t = play_steps(seqr, t, 8)  # 16 steps of 1/16th = bar 2 downbeat
+    expect("queued, both applied on the bar", (seqr.i, notes(seqr)[:2]), (4, [40, 39]))
+    seqr.queue_op(ops.rotate, 1, at_pass=True)
+    t = play_steps(seqr, t, 1)
+    expect("queued at_pass, not yet", notes(seqr)[:2], [40, 39])
+    t = play_steps(seqr, t, 1)
+    expect("queued at_pass, applied at pass start", (seqr.i, notes(seqr)[:2]), (0, [41, 40]))
+    seqr = make_seqr(8)  # same on MIDI clock, 96 pulses a bar
+    seqr.midi_start(1000)
+    seqr.midi_clock(1000)
+    seqr.queue_op(ops.rotate, 1)
+    for t in range(1020, 1000 + 96 * 20, 20):  # 125 BPM
+        seqr.update(t)
+        seqr.midi_clock(t)
+    expect("MIDI clocked, not yet", notes(seqr)[0], 36)
+    seqr.midi_clock(1000 + 96 * 20)
+    expect("MIDI clocked, applied on the bar", (seqr.i, notes(seqr)[0]), (0, 43))
+    full = [ seqr.queue_op(ops.rotate, 1) for _ in range(max_pending_ops + 1) ]
+    expect("queue full says so", full, [True] * max_pending_ops + [False])
+    return ok
+
+def bench(name, op, *args, runs=200):
+    seqr = make_seqr()
+    st = time.monotonic()
+    for _ in range(runs):
+        op(seqr, *args)
+    et = time.monotonic() - st
+    print("%-14s %7.1f us" % (name, et / runs * 1e6))
+
+if __name__ == "__main__":
+    ok = check()
+    print("checks", "ok" if ok else "FAILED")
+    print("%d-step pattern, time per op:" % num_steps)
+    bench("rotate 1", ops.rotate, 1)
+    bench("rotate 17", ops.rotate, 17)
+    bench("reverse", ops.reverse)
+    bench("invert_mutes", ops.invert_mutes)
+    bench("random_fill", ops.random_fill, "minor")
+    bench("double_length", lambda seqr: (setattr(seqr, "length", num_steps // 2), ops.double_length(seqr)))
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,121 @@
+# recorder_check.py -- host check of event recorder dump, read back and replay
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Plays a sequence on a fake clock, recording like code.py does, dumps the
+# log, reads it back and replays it with tools/replay_events.py, checking the
+# events, the notes played and the sequencer state at the end all match.
+#
+# Run on the host: python3 recorder_check.py
+
+import io, sys
+sys.path.insert(0, "../picostepseq")
+sys.path.insert(0, "../tools")
+
+import sequencer_recorder
+from sequencer_recorder import *
+from sequencer import StepSequencer
+from sequencer_midi import MidiOut
+from replay_events import replay, compare
+
+now = 0
+sequencer_recorder.ticks_ms = lambda: now  # the recorder's clock is the fake one
+
+steps8 = [ (60, 100, 8, True), (62, 90, 4, True), (64, 80, 15, True), (65, 70, 1, True),
+           (67, 100, 12, True), (69, 110, 8, False), (71, 120, 2, True), (72, 127, 14, True) ]
+
+def ring_events(rec):
+    """What's in the ring, oldest first, as read_events() gives them"""
+    start = (rec.head - rec.count) % rec.size
+    return [ (rec.times[i], *rec.events[i*4:i*4+4]) for i in ((start + k) % rec.size for k in range(rec.count)) ]
+
+def state(seqr):
+    return (seqr.seqno, seqr.playing, seqr.transpose, seqr.tempo_centi, seqr.length, seqr.rate, list(seqr.steps),
+            bytes(seqr.probs), bytes(seqr.conds), bytes(seqr.chords), bytes(seqr.arps), bytes(seqr.ccs))
+
+def record_session():
+    """A session of play, edits & pause, like code.py records it. Returns (recorder, sequencer)"""
+    global now
+    rec = EventRecorder()
+    midi_out = MidiOut([])
+    def on(note, vel, gate, on):
+        if on:
+            midi_out.note_on(1, note, vel)
+            rec.record(EV_MIDI_OUT, 0x90, note, vel)
+    def off(note, vel, gate, on):  # only note offs MidiOut sends get recorded, like code.py
+        if midi_out.release(note, vel):
+            rec.record(EV_MIDI_OUT, 0x80, note, vel)
+    seqr = StepSequencer(8, 120, on, off, seed=0x1234)
+    seqr.load_steps([ list(s) for s in steps8 ])
+    seqr.probs[3] = 50  # replay gets the same dice from the snapshot's rng state
+    seqr.chords[1] = 2
+    seqr.seqno = 2
+    now = 1000
+    rec.snapshot(seqr)  # code.py snapshots before a play/pause, then records the change
+    seqr.cont(now)
+    rec.record_state(seqr)
+    for now in range(1000, 6000):
+        seqr.update(now)
+        if now == 1810:
+            seqr.transpose = 5
+            rec.record_state(seqr)
+        elif now == 2410:
+            seqr.set_tempo_centi(133_33)
+            rec.record_state(seqr)
+        elif now == 3010:
+            seqr.steps[2] = (48, 80, 10, True)
+            seqr.conds[2] = 3
+            rec.record_step(seqr, 2)
+        elif now == 3620:
+            seqr.length = 5
+            rec.record_state(seqr)
+        elif now == 4130:
+            seqr.set_rate(4, now)  # 1/8T, the step playing ends on the next 1/8T tick
+            rec.record_state(seqr)
+        elif now == 5000:
+            rec.snapshot(seqr)
+            seqr.pause()
+            rec.record_state(seqr)
+    return rec, seqr
+
+def check_round_trip():
+    (rec, seqr) = record_session()
+    fp = io.BytesIO()
+    rec.dump(fp)
+    events = list(read_events(io.BytesIO(fp.getvalue())))
+    ok_events = events == ring_events(rec)
+    replay_seqr = StepSequencer(8, 120, None, None)
+    out = io.StringIO()
+    (stdout, sys.stdout) = (sys.stdout, out)
+    (replayed, recorded) = replay(events, seqr=replay_seqr)
+    ok_notes = compare(replayed, recorded) and len(recorded) > 50
+    sys.stdout = stdout
+    ok_state = state(replay_seqr) == state(seqr)
+    print("%d events dumped & read back  %s" % (len(events), "ok" if ok_events else "FAILED"))
+    print("replay: %d notes  %s" % (len(replayed), "ok" if ok_notes else "FAILED\n" + out.getvalue()))
+    print("state after replay  %s" % ("ok" if ok_state else "FAILED"))
+    return ok_events and ok_notes and ok_state
+
+def check_wrap():
+    """A full ring keeps the newest events, oldest first"""
+    rec = EventRecorder(size=16)
+    for k in range(100):
+        rec.record(EV_KEY, k, k & 1)
+    fp = io.BytesIO()
+    rec.dump(fp)
+    events = list(read_events(io.BytesIO(fp.getvalue())))
+    ok = [ ev[2] for ev in events ] == list(range(84, 100))
+    bad = bytearray(fp.getvalue())
+    bad[4] = dump_version + 1
+    try:
+        list(read_events(io.BytesIO(bad)))
+        ok = False
+    except ValueError:
+        pass
+    print("ring wraps, newer version refused  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_round_trip()
+    ok = check_wrap() and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
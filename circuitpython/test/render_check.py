@@ -0,0 +1,138 @@
+# render_check.py -- host check of sequencer_render offline rendering
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Renders patterns & songs offline, and plays the same ones live on a fake
+# millisecond clock (update() every millisecond, like the main loop at its
+# best), and checks the events are the same, at the same times. Then times
+# how many bars a second it renders.
+#
+# Run on the host: python3 render_check.py
+
+import json, sys, time
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, ARP_UP, ARP_DOWN, RATE_16TH, rate_ticks, rate_names, ticks_per_bar
+import sequencer_render as render
+import sequencer_smf as smf
+
+steps8 = [ [60, 100, 8, True], [62, 90, 4, True], [64, 80, 15, True], [65, 70, 1, True],
+           [67, 100, 16, True], [69, 110, 8, False], [71, 120, 2, True], [72, 127, 14, True] ]
+
+# chords, arps, probabilities & trig conditions: [note,vel,gate,on,prob,cond,chord,arp]
+steps_fancy = [ [48, 100, 8, True, 100, 0, 1, 0], [50, 90, 12, True, 50, 0, 3, ARP_UP],
+                [52, 80, 16, True, 100, 1, 2, ARP_DOWN], [53, 70, 1, True, 100, 0, 8, ARP_UP],
+                [55, 100, 16, True, 75, 2, 4, 0], [57, 110, 8, False, 100, 0, 1, 0],
+                [59, 120, 3, True, 30, 6, 5, ARP_DOWN], [60, 127, 16, True, 100, 9, 7, 0] ]
+
+def live_events(setup, num_steps, tempo_centi, chan, next_slots=None):
+    """Events from playing a StepSequencer for num_steps steps in real time, update() every millisecond"""
+    t0 = 1000
+    now = t0
+    events = []
+    active = bytearray(128)
+    def on(note, vel, gate, on):
+        if on:
+            active[note] += 1
+            events.append((now - t0, 0x90 | chan, note, vel))
+    def off(note, vel, gate, on):
+        if active[note]:
+            active[note] -= 1
+            events.append((now - t0, 0x80 | chan, note, 0))
+    seqr = setup(on, off)
+    seqr.set_tempo_centi(tempo_centi)
+    seqr.play(now=now)
+    fired = 1
+    if next_slots:
+        seqr.queue_op(StepSequencer.load_steps, next_slots[0], at_pass=True)
+    while seqr.playing or seqr.idle_millis(now) < 1000:
+        now += 1
+        i = seqr.i
+        seqr.update(now)
+        if seqr.playing and seqr.i != i:
+            fired += 1
+            if seqr.i == 0 and next_slots and seqr.loop_count < len(next_slots):
+                seqr.queue_op(StepSequencer.load_steps, next_slots[seqr.loop_count], at_pass=True)
+        if seqr.playing and fired >= num_steps:
+            seqr.pause()
+    return events
+
+def pattern_setup(steps, transpose=0, length=None, seed=0xACE1, rate=RATE_16TH):
+    def setup(on, off):
+        seqr = StepSequencer(len(steps), 120, on, off, seed=seed)
+        seqr.set_rate(rate)
+        seqr.load_steps(steps)
+        seqr.length = length or len(steps)
+        seqr.transpose = transpose
+        return seqr
+    return setup
+
+def check():
+    ok = True
+    def expect(name, got, want):
+        nonlocal ok
+        if got != want:
+            print("FAIL", name, len(got), len(want))
+            for (g, w) in zip(got, want):
+                if g != w:
+                    print("  first difference:", g, w)
+                    break
+            ok = False
+
+    # (name, steps, bars, tempo_centi, chan, transpose, length)
+    cases = [ ("plain 120 bpm", steps8, 4, 120_00, 0, 0, None),
+              ("fractional tempo", steps8, 8, 133_33, 3, 0, None),
+              ("slow, transposed", steps8, 2, 20_00, 0, -12, None),
+              ("fast, short length", steps8, 8, 300_00, 15, 5, 5),
+              ("chords, arps, probs, conds", steps_fancy, 16, 120_00, 0, 0, None),
+              ("all of it, odd tempo", steps_fancy, 16, 97_50, 9, 7, 7) ]
+    for (name, steps, bars, tempo_centi, chan, transpose, length) in cases:
+        got = list(render.render_pattern(steps, bars, tempo_centi, chan, transpose, length))
+        want = live_events(pattern_setup(steps, transpose, length), bars * render.steps_per_bar,
+                           tempo_centi, chan)
+        expect(name, got, want)
+        ons = sum(1 for e in got if e[1] & 0xf0 == 0x90)
+        offs = sum(1 for e in got if e[1] & 0xf0 == 0x80)
+        expect(name + ", every note on has its note off", [offs], [ons])
+
+    # other step rates play as many steps as fit in the bars
+    for (rate, bars) in ((2, 3), (4, 4), (8, 2)):  # 1/16T, 1/8T, 1/2
+        got = list(render.render_pattern(steps8, bars, 127_00, rate=rate))
+        want = live_events(pattern_setup(steps8, rate=rate), bars * ticks_per_bar // rate_ticks[rate], 127_00, 0)
+        expect("rate " + rate_names[rate], got, want)
+
+    # same seed, same probabilities
+    expect("seeded", list(render.render_pattern(steps_fancy, 4)), list(render.render_pattern(steps_fancy, 4)))
+
+    # a song switches patterns between passes
+    with open("../picostepseq/saved_sequences.json") as fp:
+        sequences = json.load(fp)
+    sequences[1] = steps_fancy
+    song = (0, 1, 1, 3, 0)
+    got = list(render.render_song(sequences, song, 111_00, chan=2))
+    want = live_events(pattern_setup(sequences[song[0]]), len(song) * len(sequences[0]), 111_00, 2,
+                       [ sequences[s] for s in song[1:] ])
+    expect("song", got, want)
+
+    # plain steps land on the same MIDI file ticks as the SMF exporter's, give or take a tick
+    got = [ (render.millis_to_ticks(t, 120_00), st, n, v)
+            for (t, st, n, v) in render.render_pattern(steps8, 1, 120_00) ]
+    want = sorted(smf.sequence_events(steps8 * 2), key=lambda e: (e[0], e[1]))
+    near = len(got) == len(want) and all(abs(g[0] - w[0]) <= 1 and g[1:] == w[1:]
+                                         for (g, w) in zip(sorted(got), sorted(want)))
+    expect("ticks match SMF export", [near], [True])
+    return ok
+
+def bench(bars=2000):
+    """Time rendering, chords & arps are the most events per bar"""
+    for (name, steps) in (("plain", steps8), ("chords & arps", steps_fancy)):
+        st = time.monotonic()
+        n = sum(1 for _ in render.render_pattern(steps, bars, 120_00))
+        et = time.monotonic() - st
+        print("%s: %d bars, %d events in %.1f ms, %d bars/sec (%dx real time)" %
+              (name, bars, n, et * 1000, bars / et, bars * 2 / et))
+
+if __name__ == "__main__":
+    ok = check()
+    print("checks", "ok" if ok else "FAILED")
+    bench()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,118 @@
+# settings_check.py -- check settings file round trip, schema check and per-sequence length
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 settings_check.py
+
+import io
+import struct
+import sys
+import time
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer, RATE_16TH
+from sequencer_settings import *
+
+def check_round_trip():
+    s = Settings(midi_chan=3, num_steps=8, tempo_centi=133_33, serial_midi=False)
+    s.set_seq_len(2, 5, 1000)
+    s.set_seq_chan(2, 10, 1000)
+    s.set_seq_len(3, 99, 1000)  # longer than num_steps == all of them
+    s.set_seq_rate(1, 5, 1000)
+    s.set_seq_rate(4, 99, 1000)  # past the slowest == the slowest
+    fp = io.BytesIO()
+    s.save(fp)
+    t = Settings()
+    t.load(io.BytesIO(fp.getvalue()))
+    ok = (t.loaded and s.changed_millis == 0 and len(fp.getvalue()) == s.size() and
+          (t.midi_chan, t.num_steps, t.tempo_centi, t.usb_midi, t.serial_midi) == (3, 8, 133_33, True, False) and
+          [ t.seq_len(i) for i in range(8) ] == [8, 8, 5, 8, 8, 8, 8, 8] and
+          [ t.seq_chan(i) for i in range(8) ] == [3, 3, 10, 3, 3, 3, 3, 3] and
+          [ t.seq_rate(i) for i in range(8) ] == [3, 5, 3, 3, 9, 3, 3, 3])
+    print("round trip, %d bytes  %s" % (len(fp.getvalue()), "ok" if ok else "FAILED"))
+    # a version 1 file, from before rates, loads with every sequence at 1/16th notes
+    n = len(s.seq_lens)
+    v1 = bytearray(s.to_bytes()[:settings_header_size + 2 * n])
+    struct.pack_into("<BB", v1, 4, 1, len(v1))  # version, size
+    t = Settings()
+    t.from_bytes(v1)
+    v1_ok = (t.loaded and t.seq_len(2) == 5 and t.seq_chan(2) == 10 and
+             [ t.seq_rate(i) for i in range(8) ] == [RATE_16TH] * 8)
+    print("version 1 file loads  %s" % ("ok" if v1_ok else "FAILED"))
+    return ok and v1_ok
+
+def check_schema():
+    good = Settings().to_bytes()
+    bad = []
+    for (offset, val) in ((0, ord("X")), (4, settings_version + 1), (6, 0), (6, 17),
+                          (7, 0), (7, max_steps + 1), (9, 0), (11, 0)):
+        data = bytearray(good)
+        data[offset] = val
+        bad.append(data)
+    bad.append(good[:settings_header_size + 3])  # cut short
+    ok = True
+    for data in bad:
+        s = Settings(midi_chan=5)
+        try:
+            s.from_bytes(data)
+            ok = False
+        except ValueError:
+            ok = ok and s.midi_chan == 5 and not s.loaded  # defaults kept
+    # a file from a build with more sequence slots still loads
+    more = Settings(num_seqs=12)
+    more.set_seq_len(11, 2, 1)
+    more.set_seq_len(1, 3, 1)
+    s = Settings()
+    s.from_bytes(more.to_bytes())
+    ok = ok and s.seq_len(1) == 3
+    n = 2000
+    st = time.perf_counter()
+    for _ in range(n):
+        Settings().from_bytes(good)
+    usecs = (time.perf_counter() - st) * 1e6 / n
+    print("schema check refuses %d bad files, %.1f usecs per load  %s" % (len(bad), usecs, "ok" if ok else "FAILED"))
+    return ok
+
+def check_seq_len():
+    played = []
+    def note_on(note, vel, gate, on): played.append(note)
+    def note_off(note, vel, gate, on): pass
+    seqr = StepSequencer(8, 120, note_on, note_off)
+    seqr.load_steps([ [60 + i, 100, 8, True] for i in range(8) ])
+    seqr.length = 5
+    seqr.play(now=1000)
+    for t in range(1000, 1000 + 125 * 12 - 10):
+        if t == 1000 + 125 * 7: seqr.length = 3  # at step 2 of the second pass, next is step 0
+        seqr.update(t)
+    want = [60, 61, 62, 63, 64, 60, 61, 62, 60, 61, 62, 60]
+    ok = played == want
+    print("sequence length 5 then 3  %s" % ("ok" if ok else "FAILED %s" % played))
+    return ok
+
+def check_boot_num_steps():
+    """Settings with more steps than the sequencer was made with, from SysEx, wait for next boot"""
+    s = Settings(num_steps=4)
+    s.boot_num_steps = 4
+    more = Settings(num_steps=8)
+    more.set_seq_len(1, 6, 1000)
+    s.from_bytes(more.to_bytes())
+    seqr = StepSequencer(4, 120, lambda *a: None, lambda *a: None)
+    seqr.length = s.seq_len(1)
+    seqr.play(now=1000)
+    for t in range(1000, 3000):
+        seqr.update(t)  # IndexError if length is past the step arrays
+    ok = s.num_steps == 8 and s.seq_len(1) == 4 and s.seq_len(0) == 4
+    fewer = Settings(num_steps=8)  # and fewer steps from SysEx don't cut lengths set before next boot
+    fewer.boot_num_steps = 8
+    fewer.from_bytes(Settings(num_steps=4).to_bytes())
+    fewer.set_seq_len(2, 6, 1000)
+    ok = ok and fewer.num_steps == 4 and fewer.seq_len(2) == 6 and fewer.seq_len(0) == 8
+    print("num_steps from SysEx waits for next boot  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_round_trip()
+    ok = check_schema() and ok
+    ok = check_seq_len() and ok
+    ok = check_boot_num_steps() and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,91 @@
+# smf_check.py -- host check of sequencer_smf MIDI file export & import
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 smf_check.py
+
+import io, json, sys, time
+sys.path.insert(0, "../picostepseq")
+
+import sequencer_smf as smf
+
+def load_sequences():
+    with open("../picostepseq/saved_sequences.json") as fp:
+        return json.load(fp)
+
+def events(data):
+    return list(smf.SmfReader(io.BytesIO(data)).events())
+
+def check():
+    ok = True
+    def expect(name, got, want):
+        nonlocal ok
+        if got != want:
+            print("FAIL", name, got, want)
+            ok = False
+
+    sequences = load_sequences()
+
+    # every gate survives the round trip
+    steps = [ [48 + g, 100, g, True] for g in range(1, 16) ] + [ [40, 127, 8, False] ]
+    fp = io.BytesIO()
+    smf.write_sequences(fp, [steps], 133_33)
+    fp.seek(0)
+    (got, tempo_centi) = smf.read_sequences(fp, num_seqs=1, num_steps=16)
+    expect("round trip steps", got[0][:15], steps[:15])
+    expect("muted step keeps note before it", got[0][15], [63, 127, 8, False])
+    expect("round trip tempo", tempo_centi, 133_33)
+
+    # a song is its slots played in order
+    fp = io.BytesIO()
+    smf.write_song(fp, sequences, (2, 0, 0), 120_00, transpose=-12)
+    fp.seek(0)
+    (got, _) = smf.read_sequences(fp, num_seqs=3)
+    for (name, k, slot) in (("song 1", 0, 2), ("song 2", 1, 0), ("song 3", 2, 0)):
+        expect(name, [ (s[0], s[2]) for s in got[k] if s[3] ],
+                     [ (s[0] - 12, s[2]) for s in sequences[slot] if s[3] ])
+    evs = events(fp.getvalue())
+    expect("song is type-1, tempo + song track", sorted(set(e[0] for e in evs)), [0, 1])
+
+    # each slot at its own length, channel & rate, like the settings code.py exports with
+    fp = io.BytesIO()
+    smf.write_song(fp, sequences, (0, 1, 0), 120_00, chan=0,
+                   lens=[8, 5] + [8] * 6, chans=[0, 9] + [0] * 6, rates=[5, 2] + [3] * 6)  # 1/8, 1/16T
+    evs = [ e for e in events(fp.getvalue()) if e[0] == 1 and e[2] & 0xf0 == 0x90 ]
+    (t8, t16t) = (smf.rate_step_ticks(5), smf.rate_step_ticks(2))
+    want = [ (k * t8, 0x90, s[0]) for (k, s) in enumerate(sequences[0]) if s[3] ]
+    want += [ (8 * t8 + k * t16t, 0x99, s[0]) for (k, s) in enumerate(sequences[1][:5]) if s[3] ]
+    want += [ (8 * t8 + 5 * t16t + k * t8, 0x90, s[0]) for (k, s) in enumerate(sequences[0]) if s[3] ]
+    expect("song of rates, lengths & channels", [ (e[1], e[2], e[3]) for e in evs ], want)
+    expect("1/8 & 1/16T step ticks", (t8, t16t), (48, 16))
+
+    # sloppy timing snaps to the nearest step, running status is understood
+    track = bytes((0, 0x90, 60, 100,  20, 62, 90,  4, 0x80, 60, 0,  23, 62, 0,
+                   26, 0x90, 64, 80,  10, 64, 0))
+    track += b"\x00\xff\x2f\x00"
+    data = (b"MThd\x00\x00\x00\x06\x00\x00\x00\x01\x00\x60" +
+            b"MTrk" + len(track).to_bytes(4, "big") + track)
+    (got, _) = smf.read_sequences(io.BytesIO(data), num_seqs=1)
+    expect("quantized notes", [ (s[0], s[3]) for s in got[0][:4] ], [(60, True), (62, True), (62, False), (64, True)])
+    return ok
+
+def bench(runs=20):
+    """Time exporting a long song, and reading it back"""
+    sequences = load_sequences()
+    song = list(range(8)) * 64  # 512 bars of 1/16th notes
+    st = time.monotonic()
+    for _ in range(runs):
+        fp = io.BytesIO()
+        smf.write_song(fp, sequences, song)
+    et = (time.monotonic() - st) / runs
+    size = len(fp.getvalue())
+    st = time.monotonic()
+    fp.seek(0)
+    for _ in smf.SmfReader(fp).events(): pass
+    rt = time.monotonic() - st
+    print("song of %d sequences: %d bytes, written in %.1f ms, read in %.1f ms" % (len(song), size, et * 1000, rt * 1000))
+
+if __name__ == "__main__":
+    ok = check()
+    print("checks", "ok" if ok else "FAILED")
+    bench()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,310 @@
+# smolmidi_bench.py -- host fuzz check & benchmark of winterbloom_smolmidi's MidiIn
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Feeds realistic and nasty MIDI streams (clock floods, running status, cut
+# off SysEx, stray data bytes, random bytes) through MidiIn from a fake port
+# that hands bytes over in random chunks with "nothing yet" reads in between,
+# like USB MIDI does, and checks every message and the error count against
+# reference_decode(), a straightforward whole-buffer decoder of the same
+# rules, and that a SysEx whose sender stops part way comes back truncated
+# instead of hanging. Then times messages/sec, straight from a port and
+# through SysexPort like code.py, and counts objects MidiIn allocates per
+# message.
+#
+# Rules MidiIn has that the MIDI spec doesn't: a realtime byte in the middle
+# of a message ruins the message (and is lost), system common messages don't
+# cancel running status, and a SysEx not read with receive_sysex() is thrown
+# away up to its F7, whatever else is in it.
+#
+# Run on the host: python3 smolmidi_bench.py [megabytes]
+
+import random, sys, time
+sys.path.insert(0, "../picostepseq")
+
+import winterbloom_smolmidi as smolmidi
+from winterbloom_smolmidi import MidiIn, SYSEX, SYSEX_END
+from sequencer_sysex import SysexPort
+
+len2_types = (0x80, 0x90, 0xA0, 0xB0, 0xE0, 0xF2)
+len1_types = (0xC0, 0xD0, 0xF3, 0xF5)
+
+class FakePort:
+    """Serves data to readinto() in random sized chunks, with some reads getting nothing,
+    raises EOFError when read again after the end (MidiIn waiting for the rest of a message)"""
+    def __init__(self, data, seed=0, max_chunk=64, empty_percent=20):
+        self.data = data
+        self.pos = 0
+        self.rng = random.Random(seed)
+        self.max_chunk = max_chunk
+        self.empty_percent = empty_percent
+        self.empty_at_end = 0
+
+    def at_end(self):
+        return self.pos >= len(self.data)
+
+    def readinto(self, buf, n=None):
+        n = n or len(buf)
+        if self.at_end():
+            self.empty_at_end += 1
+            if self.empty_at_end > 1:
+                raise EOFError
+            return 0
+        if self.empty_percent and self.rng.randrange(100) < self.empty_percent:
+            return 0
+        n = min(n, self.rng.randint(1, self.max_chunk), len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+class StallPort:
+    """All of data one byte a read, then nothing, like a sender that stops mid-SysEx.
+    more() gives it bytes again"""
+    def __init__(self, data):
+        self.data = bytearray(data)
+        self.empty_reads = 0
+
+    def more(self, data):
+        self.data += data
+
+    def readinto(self, buf, n=None):
+        if not self.data:
+            self.empty_reads += 1
+            return 0
+        buf[0] = self.data.pop(0)
+        return 1
+
+class BulkPort:
+    """All of data in big reads, for timing the parser and not the port"""
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def at_end(self):
+        return self.pos >= len(self.view)
+
+    def readinto(self, buf, n=None):
+        n = min(n or len(buf), len(self.view) - self.pos)
+        if n <= 0:
+            raise EOFError
+        buf[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+def reference_decode(data, running=False, sysex_max=None):
+    """Decode data by MidiIn's rules. Returns (messages, error count), messages are
+    (type, channel, data) and, if sysex_max, ("sysex", body, truncated) after each SysEx"""
+    out = []
+    errors = 0
+    running_status = None
+    (i, n) = (0, len(data))
+    while i < n:
+        b = data[i]
+        i += 1
+        d = b""
+        if b < 0x80:
+            if not (running and running_status):
+                errors += 1
+                continue
+            (d, b) = (bytes((b,)), running_status)
+        if 0x80 <= b <= 0xEF:
+            running_status = b
+            (typ, chan) = (b & 0xF0, b & 0x0F)
+        else:
+            (typ, chan) = (b, None)
+        need = (2 if typ in len2_types else 1 if typ in len1_types else 0) - len(d)
+        if i + need > n:
+            break  # MidiIn waits for the rest
+        d += data[i:i + need]
+        i += need
+        if any(x & 0x80 for x in d):
+            errors += 1
+            continue
+        out.append((typ, chan, d if typ in len2_types or typ in len1_types else None))
+        if typ == SYSEX:
+            j = data.find(bytes((SYSEX_END,)), i)
+            if j < 0:
+                break  # waits for the F7
+            if sysex_max is not None:
+                body = data[i:j]
+                out.append(("sysex", body[:sysex_max], len(body) >= sysex_max))
+            i = j + 1
+    return out, errors
+
+def smol_decode(port, running=False, sysex_max=None, at_end=None):
+    """Decode everything from port with MidiIn, same results as reference_decode().
+    Stops when at_end() (default port.at_end()) says so after an empty receive(), or on EOFError"""
+    at_end = at_end or port.at_end
+    midi_in = MidiIn(port, enable_running_status=running)
+    out = []
+    try:
+        while True:
+            msg = midi_in.receive()
+            if msg is None:
+                if at_end():
+                    break
+                continue
+            out.append((msg.type, msg.channel, None if msg.data is None else bytes(msg.data)))
+            if msg.type == SYSEX and sysex_max is not None:
+                (body, truncated) = midi_in.receive_sysex(sysex_max)
+                out.append(("sysex", bytes(body), truncated))
+    except EOFError:
+        pass
+    return out, midi_in.error_count
+
+# streams, as bytes
+
+def realistic(rng, size, running=False):
+    """MIDI clock with notes, CCs & pitch bend between clocks, status left out if running"""
+    out = bytearray()
+    last = None
+    while len(out) < size:
+        out.append(0xF8)
+        for _ in range(rng.randrange(4)):
+            kind = rng.choice((0x90, 0x80, 0x90, 0xB0, 0xE0, 0xC0))
+            status = kind | rng.randrange(2)
+            if status != last or not running:
+                out.append(status)
+            last = status
+            out.append(rng.randrange(128))
+            if kind != 0xC0:
+                out.append(rng.randrange(128))
+    return bytes(out)
+
+def clock_flood(rng, size):
+    return bytes((0xF8,)) * size
+
+def running_status(rng, size):
+    """Long runs of data bytes after one status"""
+    out = bytearray()
+    while len(out) < size:
+        out.append(rng.choice((0x90, 0xB0, 0xC0, 0xD0, 0xE0)) | rng.randrange(16))
+        out += bytes(rng.randrange(128) for _ in range(rng.randrange(1, 40)))
+    return bytes(out)
+
+def sysex_mix(rng, size):
+    """SysEx of all lengths, some cut off by a status byte and ended by a later F7"""
+    out = bytearray()
+    while len(out) < size:
+        out.append(0xF0)
+        out += bytes(rng.randrange(128) for _ in range(rng.randrange(80)))
+        if rng.randrange(4) == 0:
+            out += bytes((0x90, 60, 100))  # cut off
+        out += bytes((SYSEX_END, 0x90, 62, 90, 0xF8))
+    return bytes(out)
+
+def stray_data(rng, size):
+    """Messages with data bytes missing or extra, and realtime bytes in the middle of messages"""
+    out = bytearray()
+    while len(out) < size:
+        msg = [0x90 | rng.randrange(16), rng.randrange(128), rng.randrange(128)]
+        r = rng.randrange(5)
+        if r == 0:
+            msg.pop()
+        elif r == 1:
+            msg.append(rng.randrange(128))
+        elif r == 2:
+            msg.insert(rng.randrange(1, 3), rng.choice((0xF8, 0xFA, 0xFC, 0xFE)))
+        out += bytes(msg)
+    return bytes(out)
+
+def random_bytes(rng, size):
+    """Anything at all, half of it status bytes"""
+    return bytes(rng.randrange(256) if rng.randrange(2) else rng.randrange(128) for _ in range(size))
+
+def realistic_running(rng, size):
+    return realistic(rng, size, running=True)
+
+# (name, stream maker, running status in bench), bench times the first four
+streams = (("realistic", realistic, False), ("realistic rs", realistic_running, True),
+           ("clock flood", clock_flood, False), ("running status", running_status, True),
+           ("sysex", sysex_mix, False), ("stray data", stray_data, False), ("random", random_bytes, False))
+
+def check(runs=40, size=2000):
+    ok = True
+    for (name, make, _) in streams:
+        for run in range(runs):
+            rng = random.Random(run)
+            data = make(rng, size)
+            for running in (False, True):
+                for sysex_max in (None, 0, 16, 1000):
+                    want = reference_decode(data, running, sysex_max)
+                    got = smol_decode(FakePort(data, seed=run), running, sysex_max)
+                    if got != want:
+                        print("FAIL %s run %d running %s sysex_max %s: %d msgs %d errors, want %d msgs %d errors" %
+                              (name, run, running, sysex_max, len(got[0]), got[1], len(want[0]), want[1]))
+                        for (g, w) in zip(got[0], want[0]):
+                            if g != w:
+                                print("  first difference:", g, w)
+                                break
+                        ok = False
+                        break
+    return ok
+
+def check_stall():
+    """A SysEx whose sender stops part way comes back truncated, and doesn't hang MidiIn"""
+    ok = True
+    body = bytes(range(10))
+    for (sysex_max, want) in ((100, body), (4, body[:4]), (None, None)):
+        port = StallPort(bytes((SYSEX,)) + body)
+        midi_in = MidiIn(port)
+        msg = midi_in.receive()
+        got = midi_in.receive_sysex(sysex_max) if sysex_max is not None else None
+        if got is None:
+            msg2 = midi_in.receive()  # throws the SysEx away
+        else:
+            (got, truncated) = (bytes(got[0]), got[1])
+            if not truncated:
+                got = "not truncated"
+            msg2 = midi_in.receive()
+        port.more(bytes((0x90, 60, 100)))  # the sender is back
+        msg3 = midi_in.receive()
+        fine = (msg.type == SYSEX and got == want and msg2 is None and
+                port.empty_reads == smolmidi.SYSEX_MAX_EMPTY_READS + 2 and
+                msg3 is not None and (msg3.type, bytes(msg3.data)) == (0x90, bytes((60, 100))))
+        print("stalled sysex, max %-4s %s" % (sysex_max, "ok" if fine else "FAILED %s" % (got,)))
+        ok = ok and fine
+    return ok
+
+def count_allocs(func):
+    """Messages & bytearrays MidiIn makes while func() runs, counted by wrapping
+    the names it looks up in its module (the list a running status message
+    starts its data in isn't counted, a literal can't be wrapped)"""
+    made = 0
+    class CountedMessage(smolmidi.Message):
+        def __init__(self):
+            nonlocal made
+            made += 1
+            super().__init__()
+    def counted_bytearray(*args):
+        nonlocal made
+        made += 1
+        return bytearray(*args)
+    (smolmidi.Message, smolmidi.bytearray) = (CountedMessage, counted_bytearray)
+    try:
+        func()
+    finally:
+        smolmidi.Message = CountedMessage.__bases__[0]
+        del smolmidi.bytearray
+    return made
+
+def bench(megabytes=1):
+    size = int(megabytes * 1_000_000)
+    rng = random.Random(1)
+    for (name, make, running) in streams[:4]:
+        data = make(rng, size)
+        for (how, port) in (("port", BulkPort(data)), ("SysexPort", SysexPort(BulkPort(data)))):
+            st = time.perf_counter()
+            (msgs, _) = smol_decode(port, running, at_end=lambda: False)  # BulkPort raises EOFError at the end
+            et = time.perf_counter() - st
+            print("%-15s via %-9s %7d msgs in %6.1f ms, %7d msgs/sec, %5.2f MB/s" %
+                  (name, how, len(msgs), et * 1000, len(msgs) / et, len(data) / et / 1e6))
+        small = make(random.Random(2), 4000)
+        (msgs, _) = reference_decode(small, running)
+        allocs = count_allocs(lambda: smol_decode(BulkPort(small), running))
+        print("%-15s %.2f objects allocated per message" % (name, allocs / max(len(msgs), 1)))
+
+if __name__ == "__main__":
+    ok = all([check(), check_stall()])
+    print("checks", "ok" if ok else "FAILED")
+    bench(float(sys.argv[1]) if len(sys.argv) > 1 else 1)
+    sys.exit(0 if ok else 1)
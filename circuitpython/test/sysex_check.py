@@ -0,0 +1,217 @@
+# sysex_check.py -- check SysEx dump & load against a fake USB MIDI port
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Feeds sequencer_sysex.py messages through a fake port, a few bytes per
+# main loop pass with MIDI clock mixed in like during playback, and checks
+# banks, patterns and settings get through, bad chunks are refused, the clock
+# still gets to MidiIn, and no pass does more than one port read or write.
+#
+# Run on the host: python3 sysex_check.py
+
+import io
+import random
+import sys
+sys.path.insert(0, "../picostepseq")
+
+import winterbloom_smolmidi as smolmidi
+from sequencer_bank import write_bank
+from sequencer_sysex import *
+
+class FakePort:
+    """Stands in for a usb_midi port, gives out at most packet_size bytes per read"""
+    def __init__(self, packet_size=16):
+        self.packet_size = packet_size
+        self.incoming = bytearray()
+        self.written = bytearray()
+        self.reads = 0
+        self.writes = 0
+
+    def readinto(self, buf, n=None):
+        self.reads += 1
+        n = min(n or len(buf), self.packet_size, len(self.incoming))
+        buf[:n] = self.incoming[:n]
+        del self.incoming[:n]
+        return n
+
+    def write(self, data):
+        self.writes += 1
+        self.written += data
+
+def split_messages(data):
+    """SysEx messages in data, without F0 & F7"""
+    msgs = []
+    start = None
+    for i, b in enumerate(data):
+        if b == SYSEX_START: start = i + 1
+        elif b == SYSEX_END and start is not None:
+            msgs.append(bytes(data[start:i]))
+            start = None
+    return msgs
+
+def decode_messages(msgs):
+    """Payload from a dump's data chunk messages"""
+    payload = bytearray()
+    for m in msgs:
+        assert m[3] == CMD_DATA and checksum(m, 4, len(m)) == 0
+        buf = bytearray(64)
+        payload += buf[:unpack7(buf, 0, m, 8, len(m) - 9)]
+    return bytes(payload)
+
+class Device:
+    """Just the SysEx parts of code.py's main loop"""
+    def __init__(self, packet_size=16):
+        self.port = FakePort(packet_size)
+        self.sysex_port = SysexPort(self.port)
+        self.midi_in = smolmidi.MidiIn(self.sysex_port)
+        self.payloads = []
+        self.handler = SysexHandler(self.port, self.get_payload, self.put_payload, 700)
+        self.dump = bytes(range(256)) * 2 + b"end"
+        self.received = []
+
+    def get_payload(self, kind, index, buf):
+        fp = BufWriter(buf)  # like code.py
+        fp.write(self.dump)
+        return fp.pos
+
+    def put_payload(self, kind, index, buf, length):
+        self.payloads.append((kind, index, bytes(buf[:length])))
+
+    def loop(self, max_passes=10000):
+        """Run passes until nothing left to do, returns max port reads & writes in any pass"""
+        (max_reads, max_writes) = (0, 0)
+        for _ in range(max_passes):
+            (reads, writes) = (self.port.reads, self.port.writes)
+            msg = self.midi_in.receive()
+            if msg: self.received.append(msg.type)
+            if self.sysex_port.ready:
+                self.handler.handle(self.sysex_port.msg, self.sysex_port.msg_len)
+                self.sysex_port.done()
+            sent = self.handler.update()
+            max_reads = max(max_reads, self.port.reads - reads)
+            max_writes = max(max_writes, self.port.writes - writes)
+            if not self.port.incoming and not msg and not sent and not self.sysex_port.ready:
+                break
+        return max_reads, max_writes
+
+def with_clocks(data, every=5):
+    """data with a MIDI clock byte every few bytes, even inside SysEx"""
+    out = bytearray()
+    for i in range(0, len(data), every):
+        out += data[i:i+every] + b"\xf8"
+    return out
+
+def check_pack():
+    src = bytes(range(256))
+    for n in (0, 1, 6, 7, 8, 55, 56, 256):
+        dst = bytearray(packed_size(n))
+        assert pack7(dst, 0, src, 0, n) == packed_size(n)
+        assert all(b < 0x80 for b in dst)
+        back = bytearray(n)
+        assert unpack7(back, 0, dst, 0, len(dst)) == n and back == src[:n]
+    return True
+
+def check_bank_load():
+    random.seed(3)
+    sequences = [ [ [random.randint(0, 127), random.randint(1, 127), random.randint(1, 15),
+                     random.random() < 0.8, random.randint(0, 100), random.randint(0, 8),
+                     random.randint(0, 5), random.randint(0, 3)] for _ in range(8) ] for _ in range(8) ]
+    fp = io.BytesIO()
+    write_bank(fp, sequences, 123_45)
+    bank = fp.getvalue()
+    msgs = encode_messages(KIND_BANK, 0, bank)
+    dev = Device()
+    stream = b"".join(msgs)
+    dev.port.incoming += with_clocks(stream)
+    (max_reads, max_writes) = dev.loop()
+    replies = split_messages(dev.port.written)
+    ok = (dev.payloads == [(KIND_BANK, 0, bank)] and
+          len(replies) == len(msgs) and all(r[3] == CMD_ACK for r in replies) and
+          dev.received.count(smolmidi.CLOCK) == (len(stream) + 4) // 5 and
+          max_reads <= 1 and max_writes <= 1)
+    print("bank load: %d bytes in %d chunks, %d clocks passed through, max %d read/pass  %s" %
+          (len(bank), len(msgs), dev.received.count(smolmidi.CLOCK), max_reads, "ok" if ok else "FAILED"))
+    return ok
+
+def check_bad_chunk():
+    dev = Device()
+    msgs = [ bytearray(m) for m in encode_messages(KIND_PATTERN, 3, bytes(range(64))) ]
+    msgs[1][12] ^= 0x01  # flip a bit, checksum should catch it
+    dev.port.incoming += b"".join(msgs)
+    dev.loop()
+    replies = [ r[3] for r in split_messages(dev.port.written) ]
+    ok = not dev.payloads and replies == [CMD_ACK, CMD_NAK]
+    # resending from the bad chunk gets it through
+    dev.port.written.clear()
+    dev.port.incoming += encode_messages(KIND_PATTERN, 3, bytes(range(64)))[1]
+    dev.loop()
+    ok = ok and dev.payloads == [(KIND_PATTERN, 3, bytes(range(64)))]
+    print("bad chunk refused, resend accepted  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_dump():
+    dev = Device()
+    dev.port.incoming += b"\xf8" + request_message(KIND_BANK) + b"\xf8"
+    (max_reads, max_writes) = dev.loop()
+    msgs = split_messages(dev.port.written)
+    ok = (decode_messages(msgs) == dev.dump and max_writes <= 1 and
+          [ m[6] for m in msgs ] == list(range(len(msgs))) and all(m[7] == len(msgs) for m in msgs))
+    print("dump: %d bytes in %d chunks, max %d write/pass  %s" %
+          (len(dev.dump), len(msgs), max_writes, "ok" if ok else "FAILED"))
+    return ok
+
+def check_too_big():
+    """A dump bigger than the payload buffer is refused, the buffer doesn't grow"""
+    dev = Device()
+    dev.dump = bytes(701)
+    dev.port.incoming += request_message(KIND_BANK)
+    dev.loop()
+    replies = split_messages(dev.port.written)
+    ok = ([ (r[3], r[5]) for r in replies ] == [(CMD_NAK, 0)] and len(dev.handler.payload) == 700 and
+          dev.handler.tx_kind < 0)
+    print("dump too big for buffer refused  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_cut_off():
+    dev = Device()
+    good = encode_messages(KIND_SETTINGS, 0, b"\x39\x30\x01\x00")[0]
+    dev.port.incoming += good[:10] + b"\x90\x3c\x64" + good + b"\xf0" + bytes(200) + b"\xf7"
+    dev.loop()
+    ok = (dev.received == [smolmidi.NOTE_ON] and dev.sysex_port.error_count == 2 and
+          dev.payloads == [(KIND_SETTINGS, 0, b"\x39\x30\x01\x00")])
+    print("cut off & too long SysEx dropped, note still received  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+def check_split_after_sysex():
+    """A note on split across two reads, right after a SysEx, still gets to MidiIn
+    while the SysEx waits to be handled"""
+    good = encode_messages(KIND_SETTINGS, 0, b"\x39\x30\x01\x00")[0]
+    dev = Device(packet_size=len(good) + 1)  # first read ends with the note on's status byte
+    dev.port.incoming += good + b"\x90\x3c\x64"
+    calls = 0
+    sysex_readinto = dev.sysex_port.readinto
+    def readinto(buf, n=None):
+        nonlocal calls
+        calls += 1
+        if calls > 1000:
+            raise RuntimeError("MidiIn stuck waiting for the note on's data")
+        return sysex_readinto(buf, n)
+    dev.sysex_port.readinto = readinto
+    try:
+        dev.loop()
+        ok = dev.received == [smolmidi.NOTE_ON] and dev.payloads == [(KIND_SETTINGS, 0, b"\x39\x30\x01\x00")]
+    except RuntimeError:
+        ok = False
+    print("note on split across reads after SysEx received  %s" % ("ok" if ok else "FAILED"))
+    return ok
+
+if __name__ == "__main__":
+    ok = check_pack()
+    print("pack7/unpack7 round trip  %s" % ("ok" if ok else "FAILED"))
+    ok = check_bank_load() and ok
+    ok = check_bad_chunk() and ok
+    ok = check_dump() and ok
+    ok = check_too_big() and ok
+    ok = check_cut_off() and ok
+    ok = check_split_after_sysex() and ok
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
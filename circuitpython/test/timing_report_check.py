@@ -0,0 +1,123 @@
+# timing_report_check.py -- host check of tools/timing_report.py, needs NumPy
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Makes event logs like a device would record, with known timing errors
+# added to its MIDI out, and checks the report finds those errors.
+#
+# Run on the host: python3 timing_report_check.py
+
+import io, os, struct, sys, tempfile
+sys.path.insert(0, "../picostepseq")
+sys.path.insert(0, "../tools")
+
+try:
+    import numpy as np
+except ImportError:
+    print("numpy not installed, skipped")
+    sys.exit(0)
+
+from sequencer_recorder import *
+from replay_events import replay
+import timing_report as tr
+
+steps8 = [ [60, 100, 8, True], [62, 90, 4, True], [64, 80, 15, True], [65, 70, 1, True],
+           [67, 100, 12, True], [69, 110, 8, False], [71, 120, 2, True], [72, 127, 14, True] ]
+
+def snapshot(t, tempo_centi=120_00):
+    """Events a recorder snapshot of steps8 makes, stopped"""
+    evs = [ (t, EV_SNAPSHOT, 0xE1, 0xAC, 0), (t, EV_STATE, 0, 0, 128),
+            (t, EV_TEMPO, tempo_centi & 0xff, tempo_centi >> 8, 0), (t, EV_LENGTH, 8, 0, 0) ]
+    for (i, (n, v, gate, on)) in enumerate(steps8):
+        evs += [ (t, EV_STEP, i, n, gate | (0x80 if on else 0)), (t, EV_STEP_PROB, i, 100, 0),
+                 (t, EV_STEP_CHORD, i, 0, 0), (t, EV_STEP_CC, i, 0xff, 0) ]
+    return evs
+
+def with_midi_out(evs, on_late, off_late):
+    """Add the MIDI out a device with note ons on_late(note) & note offs off_late(note) millis late would record"""
+    (replayed, _) = replay(evs)
+    out = []
+    for (t, st, n) in replayed:
+        late = on_late(n) if st == 0x90 else off_late(n)
+        out.append((t + late, EV_MIDI_OUT, st, n, 100 if st == 0x90 else 0))
+    return sorted(evs + out, key=lambda e: e[0])
+
+def dump_file(evs):
+    fp = tempfile.NamedTemporaryFile(suffix=".bin", delete=False)
+    fp.write(struct.pack(dump_header_fmt, dump_magic, dump_version, len(evs)))
+    for ev in evs:
+        fp.write(struct.pack(dump_event_fmt, *ev))
+    fp.close()
+    return fp.name
+
+def check():
+    ok = True
+    def expect(name, got, want, tol=0.01):
+        nonlocal ok
+        if abs(got - want) > tol:
+            print("FAIL", name, got, want)
+            ok = False
+
+    # internal clock: the first step's note ons 4 ms late, its note offs on time, so its gate 4 ms short
+    evs = snapshot(1000) + [ (1000, EV_STATE, 0, 1, 128), (4990, EV_STATE, 0, 0, 128) ]  # 32 steps
+    path = dump_file(with_midi_out(evs, lambda n: 4 if n == 60 else 0, lambda n: 0))
+    rep = tr.report_dump(path)
+    os.unlink(path)
+    expect("notes matched", rep["onset"]["n"], 4 * 7, 0)
+    expect("onset max", rep["onset"]["max"], 4)
+    expect("onset mean", rep["onset"]["mean"], 4 / 7)
+    expect("onset p50", rep["onset"]["p50"], 0)
+    expect("ioi max", rep["ioi"]["max"], 4)
+    expect("gate max", rep["gate"]["max"], 4)
+    expect("gate mean", rep["gate"]["mean"], -4 / 7)
+    expect("no clock", rep["clock"]["n"], 0)
+
+    # MIDI clocked: every note on 3 ms after the clock pulse that triggered it
+    pulse = 60_000 / (120 * 24)
+    evs = snapshot(1000) + [ (1000, EV_MIDI_IN, 0xFA, 0, 0) ]
+    evs += [ (1010 + round(k * pulse), EV_MIDI_IN, 0xF8, 0, 0) for k in range(24 * 8) ]
+    path = dump_file(with_midi_out(evs, lambda n: 3, lambda n: 3))
+    rep = tr.report_dump(path)
+    os.unlink(path)
+    expect("clock steps", rep["clock"]["n"], 4 * 7, 0)
+    expect("clock latency", rep["clock"]["p99.9"], 3)
+    expect("clock onset", rep["onset"]["mean"], 3)
+    expect("clocked gate", rep["gate"]["max"], 0)
+
+    # the same at 1/8 steps, a step every 12 pulses
+    evs = snapshot(1000) + [ (1000, EV_RATE, 5, 0, 0), (1000, EV_MIDI_IN, 0xFA, 0, 0) ]
+    evs += [ (1010 + round(k * pulse), EV_MIDI_IN, 0xF8, 0, 0) for k in range(24 * 8) ]
+    path = dump_file(with_midi_out(evs, lambda n: 3, lambda n: 3))
+    rep = tr.report_dump(path)
+    os.unlink(path)
+    expect("1/8 clock steps", rep["clock"]["n"], 2 * 7, 0)
+    expect("1/8 clock latency", rep["clock"]["p99.9"], 3)
+
+    # capture log: 120 BPM 1/16ths with a sawtooth of 0-1.5 ms lateness
+    lines = [ "# millis status data1 data2" ]
+    for k in range(64):
+        t = 100 + k * 125 + (k % 4) * 0.5
+        lines += [ "%.1f 0x90 60 100" % t, "%.1f 0x90 60 0" % (t + 60) ]
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as fp:
+        fp.write("\n".join(lines))
+    rep = tr.report_capture(fp.name, 120)
+    os.unlink(fp.name)
+    expect("capture onset max", rep["onset"]["max"], 1.5)
+    expect("capture ioi max", rep["ioi"]["max"], 1.5)
+    expect("capture ioi p50", rep["ioi"]["p50"], 0.5)
+
+    # a baseline says which way things went
+    base = {"onset": dict(rep["onset"])}
+    worse = {"onset": dict(rep["onset"], p99=rep["onset"]["p99"] + 1)}
+    out = io.StringIO()
+    (stdout, sys.stdout) = (sys.stdout, out)
+    same_ok = tr.compare(rep, base, 0.5)
+    worse_ok = tr.compare(worse, base, 0.5)
+    sys.stdout = stdout
+    expect("same as baseline passes", same_ok, True, 0)
+    expect("worse than baseline fails", worse_ok, False, 0)
+    return ok
+
+if __name__ == "__main__":
+    ok = check()
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
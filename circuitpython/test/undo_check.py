@@ -0,0 +1,100 @@
+# undo_check.py -- host check of sequencer_undo history: merging, groups, redo, ring wrap
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Run on the host: python3 undo_check.py
+
+import sys
+sys.path.insert(0, "../picostepseq")
+
+from sequencer import StepSequencer
+from sequencer_undo import *
+
+def make_seqr(count=8):
+    seqr = StepSequencer(count, 120, lambda *a: None, lambda *a: None)
+    seqr.load_steps([ [36+i, 100, 8, True] for i in range(count) ])
+    return seqr
+
+def check():
+    ok = True
+    def expect(name, got, want):
+        nonlocal ok
+        if got != want:
+            print("FAIL", name, got, want)
+            ok = False
+
+    seqr = make_seqr()
+    sequences = [ [[60+i, 127, 4, i % 2 == 0] for i in range(8)] for _ in range(4) ]
+    def apply(slot, step, field, val):
+        if slot == SLOT_LIVE: step_field_set(seqr, step, field, val)
+        else: stored_field_set(sequences, slot, step, field, val)
+    undo = UndoHistory(size=32)  # bigger than the biggest group
+
+    def edit(step, field, delta):  # what code.py does for one encoder turn
+        old = step_field_get(seqr, step, field)
+        step_field_set(seqr, step, field, old + delta)
+        undo.record(SLOT_LIVE, step, field, old, step_field_get(seqr, step, field))
+
+    # several turns while one key is held are one undo
+    for _ in range(5): edit(2, FIELD_NOTE, 1)
+    undo.seal()
+    expect("merged", undo.count, 1)
+    edit(2, FIELD_NOTE, 1)  # sealed, so a new delta
+    edit(3, FIELD_PROB, -10)
+    expect("three deltas", undo.count, 3)
+    undo.undo(apply)
+    expect("undo prob", seqr.probs[3], 100)
+    undo.undo(apply)
+    undo.undo(apply)
+    expect("undo note", seqr.steps[2][0], 38)
+    expect("undo empty", undo.undo(apply), 0)
+    undo.redo(apply)
+    expect("redo note", seqr.steps[2][0], 43)
+    undo.redo(apply)
+    undo.redo(apply)
+    expect("redo all", (seqr.steps[2][0], seqr.probs[3]), (44, 90))
+    expect("redo empty", undo.redo(apply), 0)
+
+    # a new edit after undo drops the redo
+    undo.undo(apply)
+    edit(0, FIELD_VEL, -1)
+    expect("redo dropped", undo.redo(apply), 0)
+
+    # a whole sequence load is one group
+    before = [tuple(s) for s in seqr.steps]
+    undo.begin_group()
+    undo.record(SLOT_LIVE, 0, FIELD_SEQNO, seqr.seqno, 1)
+    for i in range(8):
+        for f in range(num_step_fields):
+            undo.record(SLOT_LIVE, i, f, step_field_get(seqr, i, f), stored_field_get(sequences, 1, i, f))
+    undo.end_group()
+    seqr.load_steps(sequences[1])
+    seqr.seqno = 1
+    expect("group undo count", undo.undo(apply), 1 + 8 + 8 + 8 + 4)  # seqno, notes, vels, gates, half the ons
+    expect("group undone", ([tuple(s) for s in seqr.steps], seqr.seqno), (before, 0))
+    undo.redo(apply)
+    expect("group redone", [s[0] for s in seqr.steps], list(range(60, 68)))
+
+    # undo of a save puts back the stored slot
+    undo.begin_group()
+    for f in range(num_step_fields):
+        undo.record(2, 5, f, stored_field_get(sequences, 2, 5, f), [10, 20, 3, 1, 50, 2, 1, 0, 64, 1][f])
+    undo.end_group()
+    sequences[2][5] = [10, 20, 3, True, 50, 2, 1, 0, 64, 1]
+    undo.undo(apply)
+    expect("save undone", sequences[2][5][:4], [65, 127, 4, False])
+    expect("save undone, cc lock", sequences[2][5][8:], [0xff, 0])
+
+    # ring buffer keeps only the newest deltas
+    undo = UndoHistory(size=4)
+    for i in range(6):
+        undo.record(SLOT_LIVE, i, FIELD_GATE, 8, 9)
+        undo.seal()
+    steps = []
+    while undo.undo(lambda slot, step, field, val: steps.append(step)): pass
+    expect("ring wrap", steps, [5, 4, 3, 2])
+    return ok
+
+if __name__ == "__main__":
+    ok = check()
+    print("checks", "ok" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# bank_convert.py -- convert picostepseq sequence banks between formats
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Converts between the device bank file (saved_sequences.psq, see
+# sequencer_bank.py), the older saved_sequences.json, Standard MIDI Files, and
+# SysEx dumps (.syx, see sequencer_sysex.py) to send to or save from the device
+# with any SysEx librarian:
+#
+#   python3 bank_convert.py saved_sequences.json -t psq
+#   python3 bank_convert.py saved_sequences.psq -t syx
+#   python3 bank_convert.py banks/*.psq -t mid -o midi_out/
+#   python3 bank_convert.py saved_sequences.psq -t mid --song 1,1,2,3
+#   python3 bank_convert.py riff.mid -t psq
+#
+# MIDI files are read into the 8 slots with each note snapped to its nearest
+# 1/16th note step, see sequencer_smf.read_sequences().
+#
+# Each bank is converted one sequence at a time, so converting lots of banks
+# is quick and needs little memory.
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "picostepseq"))
+
+from sequencer_bank import BankHeader, read_header, write_header, read_sequence, write_sequence
+import sequencer_smf as smf
+import sequencer_sysex as sysex
+
+formats = ("psq", "json", "mid", "syx")
+
+def read_syx(fp):
+    """Bank payload of a SysEx bank dump, raises ValueError if there isn't a whole one"""
+    data = fp.read()
+    payload = bytearray()
+    buf = bytearray(sysex.chunk_size)
+    next_chunk = 0
+    start = data.find(bytes((sysex.SYSEX_START,)))
+    while start >= 0:
+        end = data.find(bytes((sysex.SYSEX_END,)), start)
+        msg = data[start+1:end] if end > 0 else b""
+        if (len(msg) > 9 and tuple(msg[:3]) == sysex.sysex_id and msg[3] == sysex.CMD_DATA and
+                msg[4] == sysex.KIND_BANK and msg[6] == next_chunk):
+            if sysex.checksum(msg, 4, len(msg)):
+                raise ValueError("bad checksum in chunk %d" % next_chunk)
+            payload += buf[:sysex.unpack7(buf, 0, msg, 8, len(msg) - 9)]
+            next_chunk += 1
+            if next_chunk == msg[7]:
+                return bytes(payload)
+        start = data.find(bytes((sysex.SYSEX_START,)), end) if end > 0 else -1
+    raise ValueError("no whole bank dump")
+
+def open_bank(fp, fmt):
+    """Returns (BankHeader, iterator of sequences) for a bank file"""
+    if fmt == "syx":
+        fp = io.BytesIO(read_syx(fp))
+    if fmt == "psq" or fmt == "syx":
+        header = read_header(fp)
+        return header, (read_sequence(fp, header) for _ in range(header.num_seqs))
+    if fmt == "mid":
+        (sequences, tempo_centi) = smf.read_sequences(fp)
+        return BankHeader(len(sequences), len(sequences[0]), tempo_centi), iter(sequences)
+    sequences = json.load(fp)
+    tempo_centi = 0
+    if isinstance(sequences, dict):  # {"tempo_centi": ..., "sequences": [...]}
+        tempo_centi = sequences.get("tempo_centi", 0)
+        sequences = sequences["sequences"]
+    return BankHeader(len(sequences), len(sequences[0]), tempo_centi), iter(sequences)
+
+def write_json(fp, header, sequences):
+    fp.write("[")
+    for n, steps in enumerate(sequences):
+        fp.write(",\n " if n else "")
+        fp.write(json.dumps([ [s[0], s[1], s[2], bool(s[3])] + list(s[4:]) for s in steps ]))
+    fp.write("]\n")
+
+def write_psq(fp, header, sequences):
+    write_header(fp, header)
+    buf = None
+    for steps in sequences:
+        buf = write_sequence(fp, steps, buf)
+
+def write_syx(fp, header, sequences):
+    bank = io.BytesIO()
+    write_psq(bank, header, sequences)
+    for msg in sysex.encode_messages(sysex.KIND_BANK, 0, bank.getvalue()):
+        fp.write(msg)
+
+def write_mid(fp, header, sequences, chan=0, transpose=0, song=None):
+    if song:  # chained song needs any slot at any time, so read them all
+        smf.write_song(fp, list(sequences), song, header.tempo_centi or 120_00, chan, transpose)
+        return
+    writer = smf.SmfWriter(fp, 1 + header.num_seqs)
+    writer.write_track(lambda: smf.tempo_events(header.tempo_centi or 120_00))
+    for n, steps in enumerate(sequences):
+        writer.write_track(lambda: smf.sequence_events(steps, chan, transpose, name="seq %d" % (n+1)))
+
+def convert(in_path, out_path, to_fmt, tempo_centi=0, chan=0, transpose=0, song=None):
+    in_fmt = os.path.splitext(in_path)[1][1:].lower()
+    in_fmt = "mid" if in_fmt in ("mid", "midi", "smf") else in_fmt if in_fmt in ("psq", "syx") else "json"
+    with open(in_path, "r" if in_fmt == "json" else "rb") as fin:
+        header, sequences = open_bank(fin, in_fmt)
+        header.tempo_centi = tempo_centi or header.tempo_centi
+        with open(out_path, "w" if to_fmt == "json" else "wb") as fout:
+            if to_fmt == "json":  write_json(fout, header, sequences)
+            elif to_fmt == "psq": write_psq(fout, header, sequences)
+            elif to_fmt == "syx": write_syx(fout, header, sequences)
+            else:                 write_mid(fout, header, sequences, chan, transpose, song)
+    return header.num_seqs
+
+def main():
+    parser = argparse.ArgumentParser(description="convert picostepseq sequence banks")
+    parser.add_argument("files", nargs="+", help=".psq, .json or .syx banks, or .mid files")
+    parser.add_argument("-t", "--to", choices=formats, default="psq", help="format to convert to")
+    parser.add_argument("-o", "--outdir", help="where to put converted files (default: next to each input)")
+    parser.add_argument("--tempo", type=float, default=0, help="tempo in BPM (default: bank's tempo, or 120)")
+    parser.add_argument("--chan", type=int, default=1, help="MIDI channel for .mid, 1-16")
+    parser.add_argument("--transpose", type=int, default=0, help="semitones to transpose .mid by")
+    parser.add_argument("--song", help="write .mid as one song track, slots to play in order, e.g. 1,1,2,3")
+    args = parser.parse_args()
+    song = [ int(n) - 1 for n in args.song.split(",") ] if args.song else None
+
+    st = time.monotonic()
+    num_files = num_seqs = 0
+    for path in args.files:
+        (base, ext) = os.path.splitext(os.path.basename(path))
+        if ext[1:] == args.to:
+            print("skipping %s, already .%s" % (path, args.to))
+            continue
+        out_path = os.path.join(args.outdir or os.path.dirname(path), base + "." + args.to)
+        try:
+            num_seqs += convert(path, out_path, args.to, round(args.tempo * 100), args.chan - 1,
+                                args.transpose, song)
+            num_files += 1
+        except (ValueError, KeyError, IndexError) as e:
+            print("could not convert %s: %s" % (path, e))
+    print("converted %d files, %d sequences in %.2f secs" % (num_files, num_seqs, time.monotonic() - st))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# replay_events.py -- replay a picostepseq event log on the host
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Copy /event_log.bin off CIRCUITPY (written on pause when code.py's
+# do_record_events = True) and run:
+#
+#   python3 replay_events.py event_log.bin [-v]
+#
+# Runs a StepSequencer on a fake millisecond clock, fed the recorded MIDI in
+# and sequencer state changes at their recorded times, and compares the notes
+# it plays with the notes the device actually sent. Key & encoder events are
+# run through the same Gestures state machine as code.py, and with -v the
+# UI commands they resolve to are printed.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "picostepseq"))
+
+from sequencer import StepSequencer, rate_ticks
+from sequencer_recorder import (read_events, ev_names, EV_MIDI_IN, EV_MIDI_OUT, EV_KEY, EV_ENC_SW, EV_ENC_TURN,
+                                EV_SNAPSHOT, EV_STATE, EV_TEMPO, EV_STEP, EV_STEP_PROB, EV_STEP_CHORD, EV_LENGTH,
+                                EV_STEP_CC, EV_STEP_VEL, EV_RATE)
+from sequencer_input import CommandQueue, Gestures
+from sequencer_midi import MidiOut
+
+MIDI_START, MIDI_STOP, MIDI_CLOCK = 0xFA, 0xFC, 0xF8
+
+def apply_event(seqr, t, kind, d0, d1, d2):
+    """Apply one recorded event to the sequencer, the way code.py did"""
+    if kind == EV_SNAPSHOT:
+        seqr.rng.seed(d0 | (d1 << 8))
+    elif kind == EV_STATE:
+        seqr.seqno = d0
+        seqr.transpose = d2 - 128
+        if d1 and not seqr.playing:
+            seqr.cont(now=t)
+        elif not d1 and seqr.playing:
+            seqr.pause()
+    elif kind == EV_TEMPO:
+        seqr.set_tempo_centi(d0 | (d1 << 8))
+    elif kind == EV_LENGTH:
+        seqr.length = min(max(d0, 1), seqr.step_count)
+    elif kind == EV_RATE:
+        if d0 < len(rate_ticks):
+            seqr.set_rate(d0, now=t)
+    elif kind == EV_STEP:
+        (n,v,gate,on) = seqr.steps[d0]
+        seqr.steps[d0] = (d1, v, d2 & 0x7f, bool(d2 & 0x80))
+    elif kind == EV_STEP_VEL:
+        (n,v,gate,on) = seqr.steps[d0]
+        seqr.steps[d0] = (n, d1, gate, on)
+    elif kind == EV_STEP_PROB:
+        seqr.probs[d0] = d1
+        seqr.conds[d0] = d2
+    elif kind == EV_STEP_CHORD:
+        seqr.chords[d0] = d1
+        seqr.arps[d0] = d2
+    elif kind == EV_STEP_CC:
+        seqr.ccs[d0] = d1
+        seqr.ramps[d0] = d2
+    elif kind == EV_MIDI_IN:
+        if d0 == MIDI_START:
+            seqr.midi_start(t)
+        elif d0 == MIDI_STOP:
+            seqr.stop()
+        elif d0 == MIDI_CLOCK:
+            seqr.midi_clock(t)
+
+def replay(events, num_steps=8, verbose=False, seqr=None):
+    """Replay events from the first snapshot on, returns (replayed, recorded) note lists.
+    Replays into seqr if given, to look at its state after (its note callbacks get replaced)"""
+    start = next((k for k,ev in enumerate(events) if ev[1] == EV_SNAPSHOT), None)
+    if start is None:
+        raise ValueError("no snapshot in event log, nothing to replay from")
+    events = events[start:]
+
+    replayed = []
+    midi_out = MidiOut([])  # which notes are on, so only the note offs code.py sends are compared
+    def note_on(n, v, g, on):
+        if on:
+            midi_out.note_on(1, n, v)
+            replayed.append((t, 0x90, n))
+    def note_off(n, v, g, on):
+        if midi_out.release(n, v):
+            replayed.append((t, 0x80, n))
+    if seqr is None:
+        seqr = StepSequencer(num_steps, 120, None, None)
+    (seqr.on_func, seqr.off_func) = (note_on, note_off)
+    recorded = []
+    ui_cmds = CommandQueue()
+    gestures = Gestures(ui_cmds)
+
+    k = 0
+    t = events[0][0]
+    t_end = events[-1][0]
+    while t <= t_end:
+        while k < len(events) and events[k][0] <= t:
+            (_, kind, d0, d1, d2) = events[k]
+            if verbose and kind not in (EV_MIDI_OUT, EV_MIDI_IN):
+                print("%8d %-10s %3d %3d %3d" % (t, ev_names[kind], d0, d1, d2))
+            if kind == EV_MIDI_OUT:
+                recorded.append((t, d0 & 0xf0, d1))
+            elif kind == EV_KEY:
+                gestures.key(d0, d1, t)
+            elif kind == EV_ENC_SW:
+                gestures.encoder_switch(d0, t)
+            elif kind == EV_ENC_TURN:
+                gestures.encoder_turn(d0 - 128, t)
+            else:
+                apply_event(seqr, t, kind, d0, d1, d2)
+            k += 1
+        gestures.tick(t)
+        cmd = ui_cmds.get()
+        while cmd:
+            if verbose: print("%8d   ui cmd %3d %3d %3d" % (t, cmd, ui_cmds.a, ui_cmds.b))
+            cmd = ui_cmds.get()
+        seqr.update(t)
+        t += 1
+    return replayed, recorded
+
+def compare(replayed, recorded):
+    """Print how the replayed notes line up with the recorded ones"""
+    print("recorded notes: %d  replayed notes: %d" % (len(recorded), len(replayed)))
+    mismatches = 0
+    max_err = 0
+    for (r, p) in zip(recorded, replayed):
+        if r[1:] != p[1:]:
+            mismatches += 1
+            if mismatches <= 10:
+                print("  mismatch at %d: recorded %02x %3d, replayed %02x %3d @ %d" %
+                      (r[0], r[1], r[2], p[1], p[2], p[0]))
+        else:
+            max_err = max(max_err, abs(r[0] - p[0]))
+    print("mismatched notes: %d  max timing diff: %d ms" % (mismatches, max_err))
+    return mismatches == 0 and len(recorded) == len(replayed)
+
+def main():
+    parser = argparse.ArgumentParser(description="replay a picostepseq event log")
+    parser.add_argument("dumpfile", help="event_log.bin from CIRCUITPY")
+    parser.add_argument("--steps", type=int, default=8, help="number of steps in sequence")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print UI & state events")
+    args = parser.parse_args()
+
+    with open(args.dumpfile, "rb") as fp:
+        events = list(read_events(fp))
+    replayed, recorded = replay(events, args.steps, args.verbose)
+    sys.exit(0 if compare(replayed, recorded) else 1)
+
+if __name__ == "__main__":
+    main()
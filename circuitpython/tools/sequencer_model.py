@@ -0,0 +1,173 @@
+# sequencer_model.py -- reference picostepseq sequencer engine, the "golden model"
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Host-only model of exactly what notes the sequencer engine
+# (circuitpython/picostepseq/sequencer.py) should play, and when, in integer
+# microseconds. test/engine_check.py runs scripted scenarios through this and
+# the CircuitPython engine and checks they play the same notes at the same
+# times. The Arduino engine (arduino/picostepseq/sequencer.h) isn't checked
+# against it, and still differs: its gates end on a clock tick, a still held
+# note isn't ended before the next step, and it ignores a MIDI clock tempo
+# less than half or more than double the current one.
+#
+# The rules:
+#
+# - Tempo is kept in 1/100ths of a BPM (tempo_centi). Like MIDI clock, there
+#   are 24 ticks per quarter note, tick_micros = 6_000_000_000 // (24 * tempo_centi),
+#   and a step (1/16th note) is 6 ticks, step_micros = 6 * tick_micros.
+# - Steps can be other lengths (rates): rate_ticks master clock ticks, at 96 per
+#   quarter note (4 per MIDI clock tick), 24 is a 1/16th note, 16 a 1/16th triplet.
+#   step_micros = rate_ticks * tick_micros // 4. Steps fire on the master ticks
+#   that are multiples of rate_ticks, counted from the step play() or cont() fired.
+# - Internally clocked, each step fires step_micros after the one before it.
+#   A tempo change applies from the next step on. After a rate change, the
+#   step playing ends on the first master tick after the change that's a
+#   multiple of the new rate (a step is rate_ticks master ticks long, each
+#   tick_micros / 4, so where the master clock is depends on time since the step).
+# - A step that is on plays note + transpose. Its note off comes
+#   gate * step_micros // 16 after its note on. If a note is still on when the
+#   next step fires, its note off is sent first, at the same time.
+#   At the same time, note offs come before note ons.
+# - play() plays from the first step, right away. stop() goes back to the first
+#   step. pause() stops where it is, cont() carries on from the next step, right away.
+#   Stopping or pausing doesn't cut off a playing note, it ends at its usual time.
+# - MIDI start is play(), but externally clocked: steps fire on MIDI clock
+#   pulses 0, 6, 12, ... after it (pulses whose master tick, pulse * 4, is a
+#   multiple of rate_ticks). Every 24 pulses the tempo is re-measured,
+#   tick_micros = quarter note micros // 24, if the quarter note is under 6 secs.
+# - Not modeled: falling back to the internal clock when MIDI clock stops,
+#   and the CircuitPython-only step params (probability, trig conditions, chords, arps).
+#
+# An engine that keeps time in milliseconds should play each note at micros // 1000.
+# One that measures MIDI clock tempo in milliseconds may differ a little on
+# tempos whose quarter note isn't a whole number of milliseconds.
+
+ticks_per_quarternote = 24
+master_ticks_per_tick = 4  # master clock ticks per MIDI clock tick
+max_quarter_micros = 6_000_000
+
+NOTE_ON, NOTE_OFF = 0x90, 0x80
+
+class ReferenceSequencer:
+    """The golden model. Each call takes the time it happens, in microseconds,
+    and first catches up on everything that happened before then.
+    Notes played are in .out, as (micros, NOTE_ON or NOTE_OFF, note, vel)"""
+    def __init__(self, steps, tempo_centi=12000):
+        self.steps = [ (s[0], s[1], s[2], bool(s[3])) for s in steps ]
+        self.stepi = -1  # step last played, -1 == before the first step
+        self.transpose = 0
+        self.playing = False
+        self.ext_clocked = False
+        self.last_step_micros = 0
+        self.held = None  # (note, vel) of the note still on
+        self.held_off_micros = 0
+        self.rate_ticks = 24  # master clock ticks per step
+        self.step_tick = 0  # master clock tick the last step fired on
+        self.step_ticks = 24  # master clock ticks until the next step
+        self.pulses = 0  # MIDI clock pulses since MIDI start
+        self.quarter_micros = -1  # when last quarter note of MIDI clock started, -1 == none yet
+        self.out = []
+        self.set_tempo_centi(tempo_centi)
+
+    @property
+    def step_micros(self):
+        return self.tick_micros * self.rate_ticks // master_ticks_per_tick
+
+
+    def set_tempo_centi(self, tempo_centi, now=None):
+        if now is not None:
+            self.advance(now - 1)
+        self.tick_micros = 6_000_000_000 // (ticks_per_quarternote * tempo_centi)
+
+    def set_rate(self, rate_ticks, now):
+        self.advance(now - 1)
+        self.rate_ticks = rate_ticks
+        self.step_ticks = rate_ticks
+        if self.playing and not self.ext_clocked:
+            tick = self.step_tick + (now - self.last_step_micros) * master_ticks_per_tick // self.tick_micros
+            self.step_ticks = (tick // rate_ticks + 1) * rate_ticks - self.step_tick
+
+    def set_transpose(self, transpose, now):
+        self.advance(now - 1)
+        self.transpose = transpose
+
+    def set_step(self, i, step, now):
+        self.advance(now - 1)
+        self.steps[i] = (step[0], step[1], step[2], bool(step[3]))
+
+    def play(self, now):
+        self.advance(now - 1)
+        self.stepi = -1
+        self.cont(now)
+
+    def cont(self, now):
+        self.advance(now - 1)
+        self.playing = True
+        if not self.ext_clocked:
+            self.step_tick = 0
+            self.step_ticks = self.rate_ticks
+            self._step(now)
+
+    def pause(self, now):
+        self.advance(now - 1)
+        self.playing = False
+
+    def stop(self, now):
+        self.advance(now - 1)
+        self.playing = False
+        self.stepi = -1
+
+    def midi_start(self, now):
+        self.advance(now - 1)
+        self.pulses = 0
+        self.quarter_micros = -1
+        self.ext_clocked = True
+        self.stepi = -1
+        self.playing = True
+
+    def midi_clock(self, now):
+        self.advance(now - 1)
+        if self.pulses % ticks_per_quarternote == 0:
+            quarter = now - self.quarter_micros
+            if self.quarter_micros >= 0 and 0 < quarter < max_quarter_micros:
+                self.tick_micros = quarter // ticks_per_quarternote
+            self.quarter_micros = now
+        if self.pulses * master_ticks_per_tick % self.rate_ticks == 0:
+            self.ext_clocked = True
+            self._step(now)
+        self.pulses += 1
+
+    def advance(self, now):
+        """Play everything due up to and including time now"""
+        while True:
+            t_off = self.held_off_micros if self.held else None
+            t_step = None
+            if self.playing and not self.ext_clocked:
+                t_step = self.last_step_micros + self.tick_micros * self.step_ticks // master_ticks_per_tick
+            if t_off is not None and t_off <= now and (t_step is None or t_off <= t_step):
+                self._note_off(t_off)
+            elif t_step is not None and t_step <= now:
+                self.step_tick += self.step_ticks
+                self.step_ticks = self.rate_ticks
+                self._step(t_step)
+            else:
+                return
+
+    def _note_off(self, t):
+        (note, vel) = self.held
+        self.held = None
+        self.out.append((t, NOTE_OFF, note, vel))
+
+    def _step(self, t):
+        if not self.playing:
+            return
+        if self.held:
+            self._note_off(t)
+        self.last_step_micros = t
+        self.stepi = (self.stepi + 1) % len(self.steps)
+        (note, vel, gate, on) = self.steps[self.stepi]
+        if on:
+            note = min(max(note + self.transpose, 0), 127)
+            self.out.append((t, NOTE_ON, note, vel))
+            self.held = (note, vel)
+            self.held_off_micros = t + gate * self.step_micros // 16
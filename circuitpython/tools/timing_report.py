@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# timing_report.py -- picostepseq timing & jitter report from event logs, with NumPy
+# Part of picostepseq : https://github.com/todbot/picostepseq/
+#
+# Works out how far the notes a device sent were from when they should have
+# been, as percentile tables:
+#
+#   onset   note on time - when the engine meant to play it
+#   ioi     jitter of the time between one step's notes and the next's
+#   gate    note length - the note length the engine meant
+#   clock   MIDI clock pulse in -> the note on it triggered out (MIDI clocked only)
+#
+# From a recorder dump (/event_log.bin, code.py's do_record_events = True),
+# "meant" is what replay_events.py's replay of the same log plays. From a
+# capture log (text lines of "millis status data1 data2", e.g. from a MIDI
+# monitor, millis can be fractional) it's the step grid at --tempo, and there
+# are no gate or clock numbers.
+#
+#   python3 timing_report.py event_log.bin --save-baseline before.json
+#   (change sequencer.py, record again)
+#   python3 timing_report.py event_log.bin --baseline before.json
+#
+# compares against a saved report, and exits 1 if a p99 got worse by more
+# than --tolerance millis.
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "picostepseq"))
+
+from sequencer import rate_ticks, RATE_16TH
+from sequencer_recorder import read_events, dump_magic, EV_MIDI_IN, EV_RATE
+from replay_events import replay
+
+NOTE_ON, NOTE_OFF = 0x90, 0x80
+MIDI_START, MIDI_CLOCK = 0xFA, 0xF8
+master_ticks_per_pulse = 4  # StepSequencer's master clock ticks per MIDI clock pulse
+
+percentiles = (50, 90, 99, 99.9)
+columns = ("n", "mean", "p50", "p90", "p99", "p99.9", "max")
+
+def summarize(x):
+    """Percentile table row of x: count, mean (signed, the bias), then percentiles & max of |x|"""
+    x = np.asarray(x, dtype=np.float64)
+    x = x[~np.isnan(x)]
+    if len(x) == 0:
+        return dict.fromkeys(columns, 0.0)
+    a = np.abs(x)
+    row = dict(n=float(len(x)), mean=float(x.mean()), max=float(a.max()))
+    for (p, v) in zip(percentiles, np.percentile(a, percentiles)):
+        row["p%g" % p] = float(v)
+    return row
+
+def notes_array(notes):
+    """(millis, status, note) tuples as an (n,3) array, channel taken out of status"""
+    return np.array([ (t, st & 0xf0, n) for (t, st, n) in notes ], dtype=np.float64).reshape(-1, 3)
+
+def note_ranks(notes):
+    """For each note, how many of the same note came before it"""
+    order = np.argsort(notes, kind="stable")
+    sorted_notes = notes[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_notes)) + 1]
+    counts = np.diff(np.r_[starts, len(notes)])
+    ranks = np.empty(len(notes), dtype=np.int64)
+    ranks[order] = np.arange(len(notes)) - np.repeat(starts, counts)
+    return ranks
+
+def match_notes(a, b):
+    """Indexes into note arrays a and b pairing the k-th time a note is played in one with its k-th in the other"""
+    ka = a.astype(np.int64) * 1_000_000 + note_ranks(a)
+    kb = b.astype(np.int64) * 1_000_000 + note_ranks(b)
+    (_, ia, ib) = np.intersect1d(ka, kb, assume_unique=True, return_indices=True)
+    return ia, ib
+
+def ons_with_gates(ev):
+    """Note ons of (millis, status, note) events in time order, as (millis, note, gate) rows,
+    gate is the time to the note's next note off, nan if none"""
+    n = len(ev)
+    order = np.lexsort((np.arange(n), ev[:, 2]))  # by note, in time order
+    e = ev[order]
+    next_is_off = np.r_[(e[1:, 1] == NOTE_OFF) & (e[1:, 2] == e[:-1, 2]), False]
+    gate = np.full(n, np.nan)
+    gate[order] = np.where(next_is_off, np.r_[e[1:, 0] - e[:-1, 0], 0], np.nan)
+    on = ev[:, 1] == NOTE_ON
+    return np.column_stack((ev[on, 0], ev[on, 2], gate[on]))
+
+def onset_times(ons):
+    """Distinct note on times, a chord is one onset"""
+    return np.unique(ons[:, 0])
+
+def clock_latency(events, on_times):
+    """Millis from each step's MIDI clock pulse to the first note on after it, at the
+    step rate of the last EV_RATE before the pulse (1/16 if none).
+    Pulses with no note on within a step (a muted step) are left out"""
+    kind = events[:, 1]
+    d0 = events[:, 2]
+    ci = np.flatnonzero((kind == EV_MIDI_IN) & (d0 == MIDI_CLOCK))
+    si = np.flatnonzero((kind == EV_MIDI_IN) & (d0 == MIDI_START))
+    if len(ci) == 0 or len(si) == 0 or len(on_times) == 0:
+        return np.array([])
+    seg = np.searchsorted(si, ci)  # how many starts came before each pulse
+    cnt = np.arange(len(ci)) - np.searchsorted(seg, seg)  # pulses since the last start
+    ri = np.flatnonzero((kind == EV_RATE) & (d0 < len(rate_ticks)))
+    rates = np.full(len(ci), rate_ticks[RATE_16TH])  # master ticks per step at each pulse
+    if len(ri):
+        k = np.searchsorted(ri, ci) - 1  # last rate change before each pulse
+        rates = np.where(k >= 0, np.array(rate_ticks)[d0[ri[np.maximum(k, 0)]].astype(int)], rates)
+    fire = (seg > 0) & (cnt * master_ticks_per_pulse % rates == 0)
+    pulses = events[ci[fire], 0]
+    if len(pulses) == 0:
+        return np.array([])
+    pulse_millis = np.median(np.diff(events[ci, 0])) if len(ci) > 1 else np.inf
+    step_millis = pulse_millis * rates[fire] / master_ticks_per_pulse
+    j = np.searchsorted(on_times, pulses)
+    ok = j < len(on_times)
+    lat = on_times[j[ok]] - pulses[ok]
+    return lat[lat < step_millis[ok]]
+
+def report_dump(path):
+    """Timing report of a recorder dump, against its replay"""
+    with open(path, "rb") as fp:
+        evlist = list(read_events(fp))
+    (replayed, recorded) = replay(evlist)
+    events = np.array(evlist, dtype=np.float64).reshape(-1, 5)
+    (rec, ref) = (notes_array(recorded), notes_array(replayed))
+    (rec_ons, ref_ons) = (ons_with_gates(rec), ons_with_gates(ref))
+    (ia, ib) = match_notes(rec_ons[:, 1], ref_ons[:, 1])
+    (rec_t, ref_t) = (rec_ons[ia, 0], ref_ons[ib, 0])
+    (ref_onsets, first) = np.unique(ref_t, return_index=True)  # matched onsets, first note of each chord
+    return {
+        "onset": summarize(rec_t - ref_t),
+        "ioi": summarize(np.diff(rec_t[first]) - np.diff(ref_onsets)),
+        "gate": summarize(rec_ons[ia, 2] - ref_ons[ib, 2]),
+        "clock": summarize(clock_latency(events, onset_times(rec_ons))),
+    }
+
+def read_capture(path):
+    """Capture log lines of "millis status data1 data2" as (millis, status, note) note events"""
+    rows = []
+    with open(path) as fp:
+        for line in fp:
+            f = line.split("#")[0].replace(",", " ").split()
+            if len(f) < 4:
+                continue
+            (t, st, d1, d2) = (float(f[0]), int(f[1], 0), int(f[2], 0), int(f[3], 0))
+            if st & 0xf0 == NOTE_ON and d2 == 0:
+                st = NOTE_OFF
+            if st & 0xf0 in (NOTE_ON, NOTE_OFF):
+                rows.append((t, st, d1))
+    return notes_array(rows)
+
+def report_capture(path, tempo):
+    """Timing report of a capture log, against the step grid at tempo BPM from its first note"""
+    ons = ons_with_gates(read_capture(path))
+    t = onset_times(ons)
+    step = 60_000 / (tempo * 4)
+    grid = t[0] + np.round((t - t[0]) / step) * step if len(t) else t
+    ioi = np.diff(t)
+    return {
+        "onset": summarize(t - grid),
+        "ioi": summarize(ioi - np.round(ioi / step) * step),
+    }
+
+def print_report(report):
+    print("%-6s" % "ms" + "".join("%9s" % c for c in columns))
+    for (name, row) in report.items():
+        print("%-6s%9d" % (name, row["n"]) + "".join("%9.2f" % row[c] for c in columns[1:]))
+
+def compare(report, baseline, tolerance):
+    """Print report next to baseline, returns False if a p99 got worse by more than tolerance"""
+    ok = True
+    print("%-6s%-7s%10s%10s%10s" % ("ms", "", "baseline", "now", "change"))
+    for (name, row) in report.items():
+        base = baseline.get(name)
+        if not base or not row["n"]:
+            continue
+        for c in columns[2:]:
+            d = row[c] - base[c]
+            verdict = ""
+            if c == "p99" and d > tolerance:
+                (verdict, ok) = ("  WORSE", False)
+            elif c == "p99" and d < -tolerance:
+                verdict = "  better"
+            print("%-6s%-7s%10.2f%10.2f%+10.2f%s" % (name, c, base[c], row[c], d, verdict))
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="picostepseq timing & jitter report")
+    parser.add_argument("logfile", help="event_log.bin recorder dump, or a text capture log")
+    parser.add_argument("--tempo", type=float, default=120, help="BPM of a capture log's step grid")
+    parser.add_argument("--save-baseline", metavar="JSON", help="save this report to compare against later")
+    parser.add_argument("--baseline", metavar="JSON", help="compare with a saved report")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="millis a p99 can get worse by")
+    args = parser.parse_args()
+
+    with open(args.logfile, "rb") as fp:
+        is_dump = fp.read(len(dump_magic)) == dump_magic
+    report = report_dump(args.logfile) if is_dump else report_capture(args.logfile, args.tempo)
+    print_report(report)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as fp:
+            json.dump(report, fp, indent=1)
+    if args.baseline:
+        with open(args.baseline) as fp:
+            ok = compare(report, json.load(fp), args.tolerance)
+        sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()